@@ -1,6 +1,7 @@
 from deepeval.test_case import LLMTestCase, LLMTestCaseParams
 from deepeval.metrics import GEval
 from loguru import logger
+from context_compaction import CompactContextMetric
 
 # 忠実性評価（Faithfulness）
 faithfulness_judge = GEval(
@@ -48,8 +49,14 @@ rag_test_case = LLMTestCase(
     ]
 )
 
+# 重複チャンクを除き、質問・回答との関連度が高い順にJudgeごとのトークン予算まで絞ってから評価
+rag_judges = [
+    CompactContextMetric(faithfulness_judge, token_budget=2000),
+    CompactContextMetric(context_utilization_judge, token_budget=1000)
+]
+
 # 各Judgeで評価
-for judge in [faithfulness_judge, context_utilization_judge]:
+for judge in rag_judges:
     judge.measure(rag_test_case)
     logger.info(f"{judge.name} スコア: {judge.score}")
     logger.info(f"{judge.name} 理由: {judge.reason}")
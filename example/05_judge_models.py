@@ -2,6 +2,7 @@ from deepeval.test_case import LLMTestCase, LLMTestCaseParams
 from deepeval.metrics import GEval
 from loguru import logger
 import sys
+from cascade_judge import CascadeJudgeMetric
 
 # Configure loguru for stylish output
 logger.remove()
@@ -69,4 +70,34 @@ for i, judge in enumerate([gpt4_judge, claude_judge, local_judge], 1):
         logger.error(f"❌ {judge.name}でエラー: {e}")
         continue
 
-logger.success("🎉 全てのモデル評価が完了しました！")
\ No newline at end of file
+logger.success("🎉 全てのモデル評価が完了しました！")
+
+# カスケード評価: 安いモデルで採点し、しきい値±0.1に入ったケースだけ上位モデルで採点し直す
+correctness_steps = [
+    "回答内容を詳細に分析する",
+    "事実の正確性を検証する",
+    "論理的一貫性を確認する"
+]
+cascade_judge = CascadeJudgeMetric(
+    judges=[
+        GEval(
+            name="CascadeCorrectness",
+            criteria="回答の正確性を厳密に評価する",
+            evaluation_steps=correctness_steps,
+            evaluation_params=[LLMTestCaseParams.INPUT, LLMTestCaseParams.ACTUAL_OUTPUT],
+            model=model,
+            threshold=0.8
+        )
+        for model in ["gpt-4o-mini", "o3-mini"]
+    ],
+    margin=0.1
+)
+
+logger.info("🪜 カスケード評価を開始します")
+try:
+    cascade_judge.measure(test_case)
+    logger.success(f"✅ {cascade_judge.name} - スコア: {cascade_judge.score:.3f}（判定: {cascade_judge.decided_by}）")
+    logger.info(f"💭 {cascade_judge.name} 理由: {cascade_judge.reason}")
+    logger.info(f"📊 Tier別の判定件数: {cascade_judge.stats.to_dict()}")
+except Exception as e:
+    logger.error(f"❌ {cascade_judge.name}でエラー: {e}")
\ No newline at end of file
@@ -1,26 +1,36 @@
-import pandas as pd
-from deepeval.test_case import LLMTestCase, LLMTestCaseParams
+from deepeval.test_case import LLMTestCaseParams
 from deepeval.metrics import GEval
-from deepeval.dataset import EvaluationDataset
-from deepeval import evaluate
 from loguru import logger
+import os
+from dotenv import load_dotenv
+from litellm_model import LiteLLMModel
+from judge_cache import JudgeResponseCache
+from judge_telemetry import JudgeTelemetry
+from single_flight import SingleFlight
+from incremental_eval import IncrementalEvaluator, IncrementalResultStore
+from dataset_loader import iter_test_case_chunks
+from chunk_store import ChunkStore
+from fused_judge import FusedJudgeGroup
+from batched_judge import BatchedJudge
+from columnar_results import ColumnarResultWriter
 
-# CSVファイル読み込み
-df = pd.read_csv("qa_dataset.csv")
+# .envファイルをロード
+load_dotenv()
 
-# テストケース作成
-test_cases = []
-for _, row in df.iterrows():
-    test_case = LLMTestCase(
-        input=row["question"],
-        actual_output=row["llm_answer"],
-        expected_output=row["expected_answer"],
-        retrieval_context=row.get("context", "").split("|||") if pd.notna(row.get("context")) else []
-    )
-    test_cases.append(test_case)
-
-# データセット作成
-dataset = EvaluationDataset(test_cases=test_cases)
+# Judgeレスポンスを永続キャッシュし、再実行時に同一プロンプトでAPIを呼ばないようにする
+judge_cache = JudgeResponseCache(os.environ.get("JUDGE_CACHE_PATH", "judge_cache.sqlite3"))
+# Judgeごとのレイテンシ・トークン数・コストを集計する
+telemetry = JudgeTelemetry()
+# 同じプロンプトが同時に送られる場合（重複した質問など）は1回の呼び出しにまとめる
+single_flight = SingleFlight()
+judge_model = LiteLLMModel(
+    model_name=os.environ.get("LITELLM_MODEL", "gpt-4o-mini"),
+    base_url=os.environ.get("LITELLM_BASE_URL", "http://localhost:4000"),
+    api_key=os.environ.get("LITELLM_API_KEY", "your-api-key"),
+    cache=judge_cache,
+    telemetry=telemetry,
+    single_flight=single_flight
+)
 
 # 複数Judge定義
 accuracy_judge = GEval(
@@ -33,7 +43,8 @@ accuracy_judge = GEval(
         "全体的な正確性を0-1で評価する"
     ],
     evaluation_params=[LLMTestCaseParams.INPUT, LLMTestCaseParams.ACTUAL_OUTPUT],
-    threshold=0.8
+    threshold=0.8,
+    model=judge_model.with_judge("Accuracy")
 )
 completeness_judge = GEval(
     name="Completeness",
@@ -49,7 +60,8 @@ completeness_judge = GEval(
         LLMTestCaseParams.ACTUAL_OUTPUT,
         LLMTestCaseParams.EXPECTED_OUTPUT
     ],
-    threshold=0.7
+    threshold=0.7,
+    model=judge_model.with_judge("Completeness")
 )
 clarity_judge = GEval(
     name="Clarity",
@@ -61,7 +73,8 @@ clarity_judge = GEval(
         "読み手にとっての理解しやすさを判定する"
     ],
     evaluation_params=[LLMTestCaseParams.ACTUAL_OUTPUT],
-    threshold=0.6
+    threshold=0.6,
+    model=judge_model.with_judge("Clarity")
 )
 relevance_judge = GEval(
     name="Relevance",
@@ -73,18 +86,81 @@ relevance_judge = GEval(
         "質問と回答の関連度を測定する"
     ],
     evaluation_params=[LLMTestCaseParams.INPUT, LLMTestCaseParams.ACTUAL_OUTPUT],
-    threshold=0.8
+    threshold=0.8,
+    model=judge_model.with_judge("Relevance")
 )
 
+fused_judges = os.environ.get("FUSED_JUDGES") == "1"
+batch_clarity = os.environ.get("BATCHED_CLARITY") == "1"
+if fused_judges and batch_clarity:
+    # 融合採点ではClarityも1回の呼び出しに含まれるため、まとめ採点の先読みは使われず無駄になる
+    logger.warning("⚠️ FUSED_JUDGES=1 のためBATCHED_CLARITYは無視します")
+    batch_clarity = False
+
+# BATCHED_CLARITY=1 の場合、回答だけを見るClarityは複数テストケースを1回の呼び出しでまとめて採点する
+batched_clarity = BatchedJudge(clarity_judge) if batch_clarity else None
+if batched_clarity:
+    clarity_judge = batched_clarity.metric
+
 judges = [accuracy_judge, completeness_judge, clarity_judge, relevance_judge]
 
-# バッチ評価実行
-results = evaluate(
-    dataset=dataset,
-    metrics=judges,
-    max_concurrent=3,
-    show_indicator=True
+# FUSED_JUDGES=1 の場合は4観点をテストケースごとに1回の呼び出しでまとめて採点する
+if fused_judges:
+    judges = FusedJudgeGroup(judges, model=judge_model.with_judge("Fused")).metrics
+
+# バッチ評価実行（前回から変わっていない行・Judgeの組は保存済み結果を再利用）
+evaluator = IncrementalEvaluator(
+    judges,
+    store=IncrementalResultStore(os.environ.get("INCREMENTAL_STORE_PATH", "incremental_results.sqlite3"))
 )
 
-logger.info(f"全体スコア: {results.overall_score}")
-logger.info(f"評価完了件数: {len(results.test_results)}")
\ No newline at end of file
+# 評価結果はチャンクごとにParquetへ追記する（07_analysis.pyで読み込み）
+result_writer = ColumnarResultWriter(
+    os.environ.get("RESULTS_DIR", "evaluation_results"),
+    judge_names=[judge.name for judge in judges]
+)
+
+# 複数の質問で使い回される検索コンテキストのチャンクは1つの文字列を共有させる（保持数に上限を設けてメモリを一定に保つ）
+chunk_store = ChunkStore(max_chunks=int(os.environ.get("CHUNK_STORE_MAX_CHUNKS", "50000")))
+
+# CSVをチャンク単位でストリーミング読み込みし、全件をメモリに載せずに評価する
+score_sum = 0.0
+score_count = 0
+case_count = 0
+reused_count = 0
+judged_count = 0
+for chunk in iter_test_case_chunks(
+    "qa_dataset.csv",
+    chunk_size=int(os.environ.get("EVAL_CHUNK_SIZE", "1000")),
+    chunk_store=chunk_store
+):
+    if batched_clarity:
+        batched_clarity.prefetch(evaluator.pending_test_cases(chunk, clarity_judge))
+    results = evaluator.evaluate(
+        chunk,
+        max_concurrent=3,
+        show_indicator=True
+    )
+    for result in results.test_results:
+        for metric_data in result.metrics_data:
+            score_sum += metric_data.score
+            score_count += 1
+    result_writer.write(results.test_results)
+    case_count += len(results.test_results)
+    reused_count += results.reused_count
+    judged_count += results.judged_count
+    logger.info(f"📦 {case_count}件まで評価完了")
+
+result_writer.close()
+
+logger.info(f"全体スコア: {score_sum / score_count if score_count else 0:.3f}")
+logger.info(f"評価完了件数: {case_count}")
+logger.info(f"再利用: {reused_count}ペア, 新規評価: {judged_count}ペア")
+logger.info(f"Judgeキャッシュ: {judge_cache.stats()}")
+logger.info(f"同時リクエストの集約: {single_flight.stats()}")
+logger.info(f"チャンクストア: {chunk_store.stats()}")
+telemetry.log_summary()
+telemetry.dump(
+    os.environ.get("JUDGE_TELEMETRY_PATH", "judge_telemetry.json"),
+    os.environ.get("JUDGE_METRICS_PATH", "judge_metrics.prom")
+)
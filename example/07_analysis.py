@@ -1,33 +1,21 @@
-import pandas as pd
 import matplotlib.pyplot as plt
 from loguru import logger
+import os
+from columnar_results import load_results, load_scores
 
-# 06_batch_evaluation.pyで得られたresultsをimportまたは再実行して取得してください
-# ここではresultsが既に存在している前提です
-
-# 結果をDataFrameに変換
-results_data = []
-for result in results.test_results:
-    row = {
-        "question": result.input,
-        "answer": result.actual_output,
-        "overall_success": result.success
-    }
-    for metric_data in result.metrics_data:
-        row[f"{metric_data.name}_score"] = metric_data.score
-        row[f"{metric_data.name}_success"] = metric_data.success
-        row[f"{metric_data.name}_reason"] = getattr(metric_data, 'reason', '')
-    results_data.append(row)
+# 06_batch_evaluation.pyがParquetに保存した評価結果を読み込む
+results_dir = os.environ.get("RESULTS_DIR", "evaluation_results")
+judges_names = ["Accuracy", "Completeness", "Clarity", "Relevance"]
 
-df_results = pd.DataFrame(results_data)
+# スコア行列から必要なスコア列だけを読み込む（理由などの文字列列は読まない）
+df_results = load_scores(results_dir, judge_names=judges_names)
 
 # スコア分布の可視化
 fig, axes = plt.subplots(2, 2, figsize=(12, 10))
-judges_names = ["Accuracy", "Completeness", "Clarity", "Relevance"]
 
 for i, judge_name in enumerate(judges_names):
     ax = axes[i//2, i%2]
-    df_results[f"{judge_name}_score"].hist(bins=20, ax=ax)
+    df_results[judge_name].hist(bins=20, ax=ax)
     ax.set_title(f"{judge_name} Score Distribution")
     ax.set_xlabel("Score")
     ax.set_ylabel("Frequency")
@@ -35,15 +23,16 @@ for i, judge_name in enumerate(judges_names):
 plt.tight_layout()
 plt.show()
 
-# 低スコア項目の詳細確認
+# 低スコア項目の詳細確認（しきい値未満の行だけを読み込む）
 low_score_threshold = 0.6
+low_scores_all = load_results(results_dir, filters=[("score", "<", low_score_threshold)])
 for judge_name in judges_names:
-    low_scores = df_results[df_results[f"{judge_name}_score"] < low_score_threshold]
+    low_scores = low_scores_all[low_scores_all["judge"] == judge_name]
     if not low_scores.empty:
         logger.info(f"\n=== {judge_name} 低スコア項目 ===")
-        for idx, row in low_scores.iterrows():
-            logger.info(f"質問: {row['question']}")
-            logger.info(f"回答: {row['answer']}")
-            logger.info(f"スコア: {row[f'{judge_name}_score']}")
-            logger.info(f"理由: {row[f'{judge_name}_reason']}")
-            logger.info("-" * 50)
\ No newline at end of file
+        for row in low_scores.itertuples(index=False):
+            logger.info(f"質問: {row.question}")
+            logger.info(f"回答: {row.answer}")
+            logger.info(f"スコア: {row.score}")
+            logger.info(f"理由: {row.reason}")
+            logger.info("-" * 50)
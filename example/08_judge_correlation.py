@@ -1,15 +1,17 @@
-import numpy as np
-import pandas as pd
 import seaborn as sns
 import matplotlib.pyplot as plt
 from loguru import logger
+import os
+from columnar_results import load_results, load_scores
+from disagreement import find_disagreements
 
-# 07_analysis.pyで作成したdf_resultsをimportまたは再利用してください
-
+# 06_batch_evaluation.pyがParquetに保存したスコア行列を読み込む
+results_dir = os.environ.get("RESULTS_DIR", "evaluation_results")
 judges_names = ["Accuracy", "Completeness", "Clarity", "Relevance"]
+df_results = load_scores(results_dir, judge_names=judges_names)
 
 # Judge間相関分析
-judge_scores = df_results[[f"{name}_score" for name in judges_names]]
+judge_scores = df_results[judges_names]
 correlation_matrix = judge_scores.corr()
 
 # 相関ヒートマップ
@@ -22,32 +24,22 @@ sns.heatmap(correlation_matrix,
 plt.title("Judge間スコア相関")
 plt.show()
 
-# Judge間の意見が分かれた項目の特定
-def find_disagreement_cases(df, threshold=0.3):
-    """Judge間でスコア差が大きい項目を特定"""
-    disagreement_cases = []
-    for idx, row in df.iterrows():
-        scores = [row[f"{name}_score"] for name in judges_names]
-        score_std = np.std(scores)
-        if score_std > threshold:
-            disagreement_cases.append({
-                "index": idx,
-                "question": row["question"],
-                "answer": row["answer"],
-                "scores": {name: row[f"{name}_score"] for name in judges_names},
-                "std": score_std
-            })
-    return sorted(disagreement_cases, key=lambda x: x["std"], reverse=True)
+# Judge間の意見が分かれた項目の特定（スコア行列に対して行ごとの標準偏差をまとめて計算）
+disagreements = find_disagreements(judge_scores.to_numpy(), threshold=0.3, top_k=5)
+logger.info(f"Judge間意見相違項目: {disagreements.count}件")
 
-disagreements = find_disagreement_cases(df_results)
-logger.info(f"Judge間意見相違項目: {len(disagreements)}件")
+# 上位5件の質問・回答・理由だけを縦持ちテーブルから読み込む
+# （case_idは内容のハッシュで同一内容のケースが重複しうるため、一意なrow_idで引く）
+top_row_ids = df_results["row_id"].to_numpy()[disagreements.indices].tolist()
+details = load_results(results_dir, filters=[("row_id", "in", top_row_ids)]) if top_row_ids else None
 
 # 上位5件の詳細表示
-for i, case in enumerate(disagreements[:5]):
-    logger.info(f"\n=== 意見相違ケース {i+1} (標準偏差: {case['std']:.3f}) ===")
-    logger.info(f"質問: {case['question']}")
-    logger.info(f"回答: {case['answer']}")
+for i, (row_id, score_std) in enumerate(zip(top_row_ids, disagreements.std)):
+    case_rows = details[details["row_id"] == row_id].set_index("judge")
+    logger.info(f"\n=== 意見相違ケース {i+1} (標準偏差: {score_std:.3f}) ===")
+    logger.info(f"質問: {case_rows['question'].iloc[0]}")
+    logger.info(f"回答: {case_rows['answer'].iloc[0]}")
     for judge_name in judges_names:
-        score = case['scores'][judge_name]
-        reason = df_results.iloc[case['index']][f"{judge_name}_reason"]
-        logger.info(f"{judge_name}: {score:.3f} - {reason}")
\ No newline at end of file
+        if judge_name in case_rows.index:
+            row = case_rows.loc[judge_name]
+            logger.info(f"{judge_name}: {row['score']:.3f} - {row['reason']}")
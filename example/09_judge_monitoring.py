@@ -1,6 +1,8 @@
 import numpy as np
 import pandas as pd
 from loguru import logger
+from threshold_calibration import calibrate_threshold, calibrate_thresholds
+from judge_monitor import JudgeMonitor
 
 def evaluate_judge_performance(ground_truth_df, judge_results_df):
     """Judgeの判定精度を人間評価と比較"""
@@ -18,21 +20,14 @@ def evaluate_judge_performance(ground_truth_df, judge_results_df):
     }
 
 def calibrate_judge_threshold(validation_results, target_precision=0.9):
-    """バリデーション結果に基づいてJudge閾値を調整"""
-    scores_and_truth = [(r['score'], r['human_label']) for r in validation_results]
-    scores_and_truth.sort(reverse=True)
-    best_threshold = 0.5
-    best_precision = 0
-    for threshold in np.arange(0.1, 1.0, 0.05):
-        predictions = [1 if score >= threshold else 0 for score, _ in scores_and_truth]
-        true_labels = [label for _, label in scores_and_truth]
-        tp = sum(1 for p, t in zip(predictions, true_labels) if p == 1 and t == 1)
-        fp = sum(1 for p, t in zip(predictions, true_labels) if p == 1 and t == 0)
-        precision = tp / (tp + fp) if (tp + fp) > 0 else 0
-        if precision >= target_precision and precision > best_precision:
-            best_precision = precision
-            best_threshold = threshold
-    return best_threshold, best_precision
+    """バリデーション結果に基づいてJudge閾値を調整（精度が目標以上で再現率が最大の閾値）"""
+    scores = np.array([r['score'] for r in validation_results])
+    labels = np.array([r['human_label'] for r in validation_results])
+    result = calibrate_threshold(scores, labels, target_precision=target_precision)
+    if result is None:
+        # 目標精度を満たす閾値が無い場合は既定値のまま
+        return 0.5, 0
+    return result.threshold, result.precision
 
 # サンプルデータ
 ground_truth_df = pd.DataFrame({
@@ -53,4 +48,18 @@ validation_results = [
     {"score": 0.95, "human_label": 1}
 ]
 thresh, prec = calibrate_judge_threshold(validation_results, target_precision=0.8)
-logger.info(f"最適閾値: {thresh}, precision: {prec}")
\ No newline at end of file
+logger.info(f"最適閾値: {thresh}, precision: {prec}")
+
+# 複数Judgeの閾値をまとめて校正（再現率90%以上で精度が最大の閾値）
+human_labels = (ground_truth_df["human_score"] >= 0.7).astype(int).to_numpy()
+calibrated = calibrate_thresholds(judge_results_df, human_labels, target_recall=0.9)
+for judge_name, result in calibrated.items():
+    logger.info(f"{judge_name}: {result}")
+
+# 本番運用での継続モニタリング（人間ラベル付きの結果が届くたびに1件ずつ更新し、履歴は再読み込みしない）
+monitor = JudgeMonitor(window_size=3, mode="sliding", correlation_drop=0.1, agreement_drop=0.2)
+for human_score, judge_score in zip(ground_truth_df["human_score"], judge_results_df["Accuracy_score"]):
+    for alert in monitor.update(human_score, judge_score):
+        logger.warning(f"ドリフト検知: {alert}")
+logger.info(f"直近ウィンドウ: {monitor.window.to_dict()}")
+logger.info(f"累計: {monitor.total.to_dict()}")
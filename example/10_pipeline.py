@@ -1,10 +1,12 @@
-from deepeval.test_case import LLMTestCase, LLMTestCaseParams
-from deepeval.metrics import GEval
-from deepeval.dataset import EvaluationDataset
-from deepeval import evaluate
+from deepeval.test_case import LLMTestCaseParams
 from loguru import logger
 import sys
+import os
 import json
+from qa_pipeline import QAEvaluationPipeline
+from sharded_runner import ShardedPipelineRunner
+from work_queue import WorkQueue
+from result_journal import ResultJournal
 
 # Configure loguru for stylish output
 logger.remove()
@@ -14,90 +16,6 @@ logger.add(
 )
 logger.add("pipeline.log", rotation="1 MB")
 
-class QAEvaluationPipeline:
-    """本番環境でのQA評価パイプライン"""
-    def __init__(self, judge_configs):
-        self.judges = [self._create_judge(config) for config in judge_configs]
-    def _create_judge(self, config):
-        return GEval(
-            name=config["name"],
-            criteria=config["criteria"],
-            evaluation_steps=config["steps"],
-            evaluation_params=config["params"],
-            threshold=config["threshold"],
-            model=config.get("model", "gpt-4o-mini")
-        )
-    def evaluate_qa_batch(self, qa_pairs):
-        """QAペアのバッチ評価"""
-        logger.info(f"🚀 パイプライン評価を開始 - {len(qa_pairs)}件のQAペアを処理")
-        
-        test_cases = []
-        for i, qa in enumerate(qa_pairs, 1):
-            logger.debug(f"📄 {i}/{len(qa_pairs)}: テストケースを作成中...")
-            test_cases.append(
-                LLMTestCase(
-                    input=qa["question"],
-                    actual_output=qa["answer"],
-                    expected_output=qa.get("expected", ""),
-                    retrieval_context=qa.get("context", [])
-                )
-            )
-        
-        dataset = EvaluationDataset(test_cases=test_cases)
-        logger.info(f"🤖 {len(self.judges)}個のJudgeで評価実行中...")
-        
-        try:
-            results = evaluate(test_cases=test_cases, metrics=self.judges)
-            logger.success("✅ バッチ評価が完了しました！")
-            return self._format_results(results)
-        except Exception as e:
-            logger.error(f"❌ バッチ評価中にエラー: {e}")
-            raise
-    def _format_results(self, results):
-        """結果のフォーマット"""
-        logger.info("📊 評価結果をフォーマット中...")
-        
-        # Calculate overall metrics
-        total_tests = len(results.test_results)
-        passed_tests = sum(1 for result in results.test_results if result.success)
-        success_rate = passed_tests / total_tests if total_tests > 0 else 0
-        
-        # Calculate average score across all metrics
-        all_scores = []
-        for result in results.test_results:
-            for metric_data in result.metrics_data:
-                if hasattr(metric_data, 'score') and metric_data.score is not None:
-                    all_scores.append(metric_data.score)
-        overall_score = sum(all_scores) / len(all_scores) if all_scores else 0
-        
-        formatted = {
-            "overall_score": overall_score,
-            "success_rate": success_rate,
-            "detailed_results": []
-        }
-        
-        logger.info(f"🎯 全体スコア: {overall_score:.3f}")
-        logger.info(f"🎆 成功率: {success_rate:.1%}")
-        
-        for i, result in enumerate(results.test_results, 1):
-            detailed = {
-                "question": result.input,
-                "answer": result.actual_output,
-                "overall_success": result.success,
-                "judge_scores": {}
-            }
-            
-            logger.debug(f"📁 {i}: 詳細結果を処理中...")
-            for metric_data in result.metrics_data:
-                detailed["judge_scores"][metric_data.name] = {
-                    "score": metric_data.score,
-                    "success": metric_data.success,
-                    "reason": getattr(metric_data, 'reason', '')
-                }
-            formatted["detailed_results"].append(detailed)
-        
-        return formatted
-
 # 使用例
 judge_configs = [
     {
@@ -128,7 +46,32 @@ qa_data = [
 ]
 
 try:
-    evaluation_results = pipeline.evaluate_qa_batch(qa_data)
+    # 大量のQAペアは全件評価せず、層化サンプルで平均スコア・合格率を信頼区間つきで推定する
+    target_width = os.environ.get("SAMPLE_TARGET_WIDTH")
+    if target_width:
+        estimate = pipeline.evaluate_sample(qa_data, target_width=float(target_width), seed=0)
+        for name, judge_estimate in estimate["judges"].items():
+            low, high = judge_estimate["pass_rate_ci"]
+            logger.info(f"📐 {name} 合格率: {judge_estimate['pass_rate']:.1%} ({low:.1%}〜{high:.1%})")
+    
+    shard_processes = os.environ.get("SHARD_PROCESSES")
+    work_queue_path = os.environ.get("WORK_QUEUE_PATH")
+    if work_queue_path:
+        # 各ノードで同じスクリプトを実行すると、共有キューのタスクを分担して評価する
+        with WorkQueue(work_queue_path) as work_queue:
+            work_queue.enqueue(qa_data, pipeline.judges)
+            evaluation_results = pipeline.evaluate_from_queue(work_queue)
+    elif shard_processes:
+        # 大規模バッチはプロセスごとにJudge・HTTPプールを持たせて分割評価する
+        runner = ShardedPipelineRunner(judge_configs, processes=int(shard_processes))
+        evaluation_results = runner.evaluate_qa_batch(qa_data)
+    else:
+        # RESUME=1 で前回中断した評価をジャーナルから再開する
+        with ResultJournal(
+            os.environ.get("PIPELINE_JOURNAL_PATH", "pipeline_journal.jsonl"),
+            resume=os.environ.get("RESUME") == "1"
+        ) as journal:
+            evaluation_results = pipeline.evaluate_qa_batch(qa_data, journal=journal)
     
     logger.success(f"🎉 評価完了 - 全体スコア: {evaluation_results['overall_score']:.3f}")
     logger.info(f"📊 成功率: {evaluation_results['success_rate']:.1%}")
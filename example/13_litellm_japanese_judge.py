@@ -25,10 +25,14 @@ if __name__ == "__main__":
     api_key = os.environ.get("LITELLM_API_KEY", "your-api-key")
 
     # LiteLLMモデルインスタンス作成
+    max_reason_chars = os.environ.get("JUDGE_MAX_REASON_CHARS")
     custom_model = LiteLLMModel(
         model_name=model_name,
         base_url=api_base,
-        api_key=api_key
+        api_key=api_key,
+        # 日本語の評価理由は長くなりがちなため、ストリーミングで受け取り評価JSONが閉じたら打ち切る
+        stream=True,
+        max_reason_chars=int(max_reason_chars) if max_reason_chars else None
     )
 
     # 日本語専用GEvalメトリック
@@ -1,12 +1,19 @@
-import pandas as pd
-from deepeval.test_case import LLMTestCase, LLMTestCaseParams
+from deepeval.test_case import LLMTestCaseParams
 from deepeval.metrics import GEval
 from loguru import logger
 import sys
 import os
 from dotenv import load_dotenv
 from litellm_model import LiteLLMModel
-from langfuse import Langfuse
+from rate_limiter import RateLimitScheduler
+from judge_telemetry import JudgeTelemetry
+from single_flight import SingleFlight
+from incremental_eval import IncrementalResultStore
+from result_journal import ResultJournal
+from dataset_loader import iter_test_cases
+from concurrent_runner import ConcurrentJudgeRunner
+from langfuse_exporter import LangfuseBatchExporter
+from datetime import datetime, timezone
 
 # .envファイルをロード
 load_dotenv()
@@ -20,25 +27,16 @@ logger.add(
 )
 logger.add("litellm_japanese_evaluation_batch.log", rotation="1 MB", encoding="utf-8")
 
-# Langfuseクライアント初期化
-langfuse = Langfuse(
-    secret_key=os.environ.get("LANGFUSE_SECRET_KEY", ""),
+# Langfuseエクスポーター初期化（バックグラウンドでまとめて送信するため、評価ループはLangfuseの応答を待たない）
+langfuse_exporter = LangfuseBatchExporter(
+    host=os.environ.get("LANGFUSE_HOST") or "https://cloud.langfuse.com",
     public_key=os.environ.get("LANGFUSE_PUBLIC_KEY", ""),
-    host=os.environ.get("LANGFUSE_HOST", "https://cloud.langfuse.com")
+    secret_key=os.environ.get("LANGFUSE_SECRET_KEY", "")
 )
 
 def create_test_cases_from_csv(csv_path):
-    df = pd.read_csv(csv_path)
-    test_cases = []
-    for _, row in df.iterrows():
-        test_case = LLMTestCase(
-            input=row["question"],
-            actual_output=row["llm_answer"],
-            expected_output=row["expected_answer"],
-            retrieval_context=row.get("context", "").split("|||") if pd.notna(row.get("context")) else []
-        )
-        test_cases.append(test_case)
-    return test_cases
+    # 全件をリスト化せず、1件ずつストリーミングで生成する
+    return iter_test_cases(csv_path)
 
 def main():
     # LiteLLMモデル情報を環境変数から取得
@@ -46,11 +44,25 @@ def main():
     api_base = os.environ.get("LITELLM_BASE_URL", "http://localhost:4000")
     api_key = os.environ.get("LITELLM_API_KEY", "your-api-key")
 
+    # プロバイダのクォータに合わせたRPM/TPM予算（未設定なら制限なしで429リトライのみ）
+    scheduler = RateLimitScheduler(
+        rpm=int(os.environ["LITELLM_RPM"]) if os.environ.get("LITELLM_RPM") else None,
+        tpm=int(os.environ["LITELLM_TPM"]) if os.environ.get("LITELLM_TPM") else None
+    )
+
+    # 呼び出しごとのレイテンシ・待ち時間・トークン数・コストを集計する
+    telemetry = JudgeTelemetry()
+
     # LiteLLMモデルインスタンス作成
     custom_model = LiteLLMModel(
         model_name=model_name,
         base_url=api_base,
-        api_key=api_key
+        api_key=api_key,
+        scheduler=scheduler,
+        telemetry=telemetry,
+        judge_name="Correctness",
+        # 重複した質問が並列に評価されても、同時に送るのは1リクエストだけにする
+        single_flight=SingleFlight()
     )
 
     # 日本語専用GEvalメトリック
@@ -88,88 +100,145 @@ def main():
         model=custom_model
     )
 
+    # (テストケース, Judge) ごとの評価結果を実行間で保存
+    result_store = IncrementalResultStore(os.environ.get("INCREMENTAL_STORE_PATH", "incremental_results.sqlite3"))
+
+    # 今回の実行の評価結果を1件ごとに追記（RESUME=1 なら前回中断したところから再開）
+    resume = os.environ.get("RESUME") == "1"
+    journal = ResultJournal(
+        os.environ.get("RESULT_JOURNAL_PATH", "results_journal.jsonl"),
+        resume=resume
+    )
+
     # テストケースをCSVから生成
     test_cases = create_test_cases_from_csv("example/qa_dataset.csv")
 
-    logger.info(f"📝 テストケース数: {len(test_cases)} 件")
+    logger.info("📝 テストケースを読み込みながら評価します")
     success_count = 0
     fail_count = 0
+    error_count = 0
+    resumed_count = 0
+
+    def judge_case(judge, test_case):
+        # ワーカースレッドで実行: RESUME=1 で中断前の実行がジャーナルに記録済みなら、評価もLangfuse送信もしない
+        started_at = datetime.now(timezone.utc).isoformat()
+        if resume:
+            recorded = journal.resumed(test_case, judge)
+            if recorded is not None:
+                return recorded["score"], recorded["reason"], started_at, "resumed"
+        # 前回から行の内容・Judge定義が変わっていなければ保存済み結果を再利用
+        stored = result_store.get(test_case, judge)
+        if stored is not None:
+            journal.append(test_case, judge, stored.score, stored.success, stored.reason)
+            return stored.score, stored.reason, started_at, "reused"
+        judge.measure(test_case, _show_indicator=False)
+        passed = judge.score >= judge.threshold
+        result_store.put(test_case, judge, judge.score, passed, judge.reason)
+        journal.append(test_case, judge, judge.score, passed, judge.reason)
+        return judge.score, judge.reason, started_at, None
+
+    # Judgeの複製をワーカーごとに持たせて並列評価（結果は入力順に返る）
+    runner = ConcurrentJudgeRunner(
+        correctness_judge,
+        concurrency=int(os.environ.get("JUDGE_CONCURRENCY", "4"))
+    )
+    logger.info(f"⚡ {runner.concurrency}並列で評価します")
 
-    for idx, test_case in enumerate(test_cases, 1):
-        logger.info(f"==== {idx}件目の評価を開始 ====")
-        try:
-            logger.debug(f"   入力: {test_case.input}")
-            logger.debug(f"   実際の出力: {test_case.actual_output}")
-            logger.debug(f"   期待される出力: {test_case.expected_output}")
-
-            logger.info("⚡ 評価処理中...")
-            correctness_judge.measure(test_case)
-
-            score = correctness_judge.score
-            threshold = correctness_judge.threshold
-            passed = score >= threshold
-            reason = correctness_judge.reason
-
-            logger.info("📊 評価結果サマリー:")
-            logger.info(f"   🎯 スコア: {score:.3f}")
-            logger.info(f"   🎚️  しきい値: {threshold}")
-            logger.info(f"   🏆 判定: {'✅ 合格' if passed else '❌ 不合格'}")
-
-            logger.info("📝 評価理由:")
-            for line in reason.split('\n'):
-                if line.strip():
-                    logger.info(f"   {line.strip()}")
-
-            # Langfuseに評価結果を送信
-            logger.info("🌐 Langfuseに評価結果を送信します")
-            with langfuse.start_as_current_span(name="LiteLLM日本語Judge評価 Case15") as span:
-                span.update_trace(
-                    input={
-                        "input": test_case.input,
-                        "actual_output": test_case.actual_output,
-                        "expected_output": test_case.expected_output
-                    },
-                    output={
-                        "score": score,
-                        "threshold": threshold,
-                        "passed": passed,
-                        "reason": reason
-                    },
-                    metadata={
-                        "model": model_name,
-                        "evaluation_type": "correctness",
-                        "language": "japanese"
-                    }
-                )
-                langfuse.score_current_trace(
-                    name="correctness_score",
-                    value=score,
-                    data_type="NUMERIC",
-                    comment=f"評価理由: {reason[:100]}..."
-                )
-            logger.success("🚀 Langfuseへの送信が完了しました")
+    for idx, (test_case, result, error) in enumerate(runner.map(judge_case, test_cases), 1):
+        logger.info(f"==== {idx}件目の評価結果 ====")
+        logger.debug(f"   入力: {test_case.input}")
+        logger.debug(f"   実際の出力: {test_case.actual_output}")
+        logger.debug(f"   期待される出力: {test_case.expected_output}")
 
+        if error is not None:
+            logger.error(f"❌ 評価中にエラーが発生しました")
+            logger.error(f"   エラー詳細: {str(error)}")
+            logger.error(f"   エラータイプ: {type(error).__name__}")
+            fail_count += 1
+            error_count += 1
+            continue
+
+        score, reason, started_at, source = result
+        threshold = correctness_judge.threshold
+        passed = score >= threshold
+        if source == "resumed":
+            logger.info(f"📒 ジャーナルに記録済みのためスキップしました (スコア: {score:.3f})")
+            resumed_count += 1
             if passed:
-                logger.success(f"🎉 テストケースが合格しました (スコア: {score:.3f} >= しきい値: {threshold})")
                 success_count += 1
             else:
-                logger.warning(f"⚠️  テストケースが不合格です (スコア: {score:.3f} < しきい値: {threshold})")
                 fail_count += 1
+            continue
+        if source == "reused":
+            logger.info("♻️ 保存済みの評価結果を再利用しました")
+
+        logger.info("📊 評価結果サマリー:")
+        logger.info(f"   🎯 スコア: {score:.3f}")
+        logger.info(f"   🎚️  しきい値: {threshold}")
+        logger.info(f"   🏆 判定: {'✅ 合格' if passed else '❌ 不合格'}")
+
+        logger.info("📝 評価理由:")
+        for line in reason.split('\n'):
+            if line.strip():
+                logger.info(f"   {line.strip()}")
+
+        # Langfuseに評価結果を送信（キューに積むだけで、送信はバックグラウンドで行う）
+        trace_id = langfuse_exporter.enqueue_trace(
+            name="LiteLLM日本語Judge評価 Case15",
+            input={
+                "input": test_case.input,
+                "actual_output": test_case.actual_output,
+                "expected_output": test_case.expected_output
+            },
+            output={
+                "score": score,
+                "threshold": threshold,
+                "passed": passed,
+                "reason": reason
+            },
+            metadata={
+                "model": model_name,
+                "evaluation_type": "correctness",
+                "language": "japanese"
+            }
+        )
+        langfuse_exporter.enqueue_span(
+            trace_id,
+            name="correctness_judge",
+            start_time=started_at,
+            end_time=datetime.now(timezone.utc).isoformat(),
+            output={"score": score, "reason": reason}
+        )
+        langfuse_exporter.enqueue_score(
+            trace_id,
+            name="correctness_score",
+            value=score,
+            data_type="NUMERIC",
+            comment=f"評価理由: {reason[:100]}..."
+        )
+        logger.info("🌐 Langfuseへの送信キューに評価結果を追加しました")
 
-        except Exception as e:
-            logger.error(f"❌ 評価中にエラーが発生しました")
-            logger.error(f"   エラー詳細: {str(e)}")
-            logger.error(f"   エラータイプ: {type(e).__name__}")
+        if passed:
+            logger.success(f"🎉 テストケースが合格しました (スコア: {score:.3f} >= しきい値: {threshold})")
+            success_count += 1
+        else:
+            logger.warning(f"⚠️  テストケースが不合格です (スコア: {score:.3f} < しきい値: {threshold})")
             fail_count += 1
-        finally:
-            try:
-                langfuse.flush()
-                logger.info("🧹 Langfuseデータの送信完了を確認しました")
-            except Exception as e:
-                logger.warning(f"⚠️ Langfuseのflush中にエラー: {str(e)}")
 
+    # 未送信のイベントをまとめて送信してから終了する
+    langfuse_exporter.shutdown()
+    journal.close()
+    telemetry.log_summary()
+    telemetry.dump(
+        os.environ.get("JUDGE_TELEMETRY_PATH", "judge_telemetry.json"),
+        os.environ.get("JUDGE_METRICS_PATH", "judge_metrics.prom")
+    )
+
+    # 件数は入力の行ごとに数える（エラーは不合格に含め、中断前に記録済みの行はその結果で数える）
     logger.info("🏁 バッチ評価処理が完了しました")
-    logger.info(f"✅ 合格: {success_count}件, ❌ 不合格: {fail_count}件, 合計: {len(test_cases)}件")
+    if resumed_count:
+        logger.info(f"📒 前回の実行から引き継いだ評価: {resumed_count}件")
+    logger.info(f"✅ 合格: {success_count}件, ❌ 不合格: {fail_count}件（うちエラー: {error_count}件）, 合計: {success_count + fail_count}件")
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
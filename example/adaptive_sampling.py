@@ -0,0 +1,185 @@
+"""層化ランダムサンプリングで評価し、信頼区間が目標幅まで狭まったら打ち切るための推定器"""
+from statistics import NormalDist
+import math
+import random
+
+DEFAULT_CONFIDENCE = 0.95
+DEFAULT_TARGET_WIDTH = 0.05
+DEFAULT_BATCH_SIZE = 100
+MIN_PER_STRATUM = 10
+
+
+class _StratumStats:
+    """1層・1Judge分のスコア平均・分散（Welford法）と合格数"""
+    __slots__ = ("count", "mean", "m2", "passed")
+
+    def __init__(self):
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.passed = 0
+
+    def update(self, score, success):
+        self.count += 1
+        delta = score - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (score - self.mean)
+        self.passed += bool(success)
+
+    @property
+    def variance(self):
+        return self.m2 / (self.count - 1) if self.count > 1 else 0.25
+
+    @property
+    def pass_variance(self):
+        # 0件・全件合格でも区間幅が0にならないよう、0.5件ずつ足して分散を見積もる
+        p = (self.passed + 0.5) / (self.count + 1)
+        return p * (1 - p) * self.count / (self.count - 1) if self.count > 1 else 0.25
+
+
+class StratifiedEstimate:
+    """層の大きさで重み付けした母集団平均スコア・合格率とその信頼区間（有限母集団修正つき）"""
+    def __init__(self, strata_sizes, confidence=DEFAULT_CONFIDENCE):
+        self.strata_sizes = dict(strata_sizes)
+        self.population = sum(self.strata_sizes.values())
+        self.z = NormalDist().inv_cdf(0.5 + confidence / 2)
+        self.confidence = confidence
+        self._stats = {stratum: _StratumStats() for stratum in self.strata_sizes}
+
+    def update(self, stratum, score, success):
+        self._stats[stratum].update(score, success)
+
+    @property
+    def count(self):
+        return sum(stats.count for stats in self._stats.values())
+
+    def _combine(self, value, variance):
+        """層ごとの推定値を重み付きで合算し (推定値, 標準誤差) を返す（未サンプルの層があればNone）"""
+        estimate, var = 0.0, 0.0
+        for stratum, stats in self._stats.items():
+            if stats.count == 0:
+                return None
+            weight = self.strata_sizes[stratum] / self.population
+            fpc = 1 - stats.count / self.strata_sizes[stratum]
+            estimate += weight * value(stats)
+            var += weight ** 2 * fpc * variance(stats) / stats.count
+        return estimate, math.sqrt(max(var, 0.0))
+
+    def _interval(self, value, variance):
+        combined = self._combine(value, variance)
+        if combined is None:
+            return None, (0.0, 1.0)
+        estimate, se = combined
+        return estimate, (max(0.0, estimate - self.z * se), min(1.0, estimate + self.z * se))
+
+    def mean_score(self):
+        return self._interval(lambda s: s.mean, lambda s: s.variance)
+
+    def pass_rate(self):
+        return self._interval(lambda s: s.passed / s.count, lambda s: s.pass_variance)
+
+    def width(self):
+        """平均スコア・合格率のうち広い方の信頼区間幅"""
+        _, (low, high) = self.mean_score()
+        _, (pass_low, pass_high) = self.pass_rate()
+        return max(high - low, pass_high - pass_low)
+
+    def stratum_std(self, stratum):
+        """Neyman配分用の層内標準偏差（スコア・合格率のうち大きい方）"""
+        stats = self._stats[stratum]
+        return math.sqrt(max(stats.variance, stats.pass_variance))
+
+    def to_dict(self):
+        mean, mean_ci = self.mean_score()
+        rate, rate_ci = self.pass_rate()
+        return {
+            "samples": self.count,
+            "mean_score": mean,
+            "mean_score_ci": mean_ci,
+            "pass_rate": rate,
+            "pass_rate_ci": rate_ci,
+            "confidence": self.confidence
+        }
+
+
+class StratifiedSampler:
+    """層ごとにシャッフルした順で非復元抽出する（各層の添字リストだけを持つ）"""
+    def __init__(self, items, strata=None, seed=None):
+        self._rng = random.Random(seed)
+        key = _strata_key(strata)
+        self._pools = {}
+        for index, item in enumerate(items):
+            self._pools.setdefault(key(item), []).append(index)
+        for pool in self._pools.values():
+            self._rng.shuffle(pool)
+        self.sizes = {stratum: len(pool) for stratum, pool in self._pools.items()}
+        self._drawn = dict.fromkeys(self._pools, 0)
+
+    def remaining(self, stratum=None):
+        if stratum is not None:
+            return self.sizes[stratum] - self._drawn[stratum]
+        return sum(self.remaining(s) for s in self._pools)
+
+    def draw(self, stratum, n):
+        start = self._drawn[stratum]
+        n = min(n, self.remaining(stratum))
+        self._drawn[stratum] = start + n
+        return self._pools[stratum][start:start + n]
+
+    def allocate(self, batch_size, weights=None):
+        """batch_sizeを層に配分する（weightsなしなら層の大きさに比例、ありならNeyman配分）
+
+        まだMIN_PER_STRATUM件に満たない層には、予算の範囲内で優先的に割り当てる。
+        配分の合計はbatch_size（と残り件数）を超えない。
+        """
+        allocation = dict.fromkeys(self._pools, 0)
+        budget = min(batch_size, self.remaining())
+        # 下限に満たない層へ1件ずつ順番に割り当て、予算が尽きたらそこで止める
+        short = [stratum for stratum in self._pools if self._below_minimum(stratum, 0)]
+        while budget > 0 and short:
+            for stratum in list(short):
+                if budget == 0:
+                    break
+                allocation[stratum] += 1
+                budget -= 1
+                if not self._below_minimum(stratum, allocation[stratum]):
+                    short.remove(stratum)
+        # 残りは最大剰余法で配分し、層の残り件数を超えた分は他の層に回す
+        while budget > 0:
+            available = {
+                stratum: self.remaining(stratum) - allocation[stratum]
+                for stratum in self._pools if self.remaining(stratum) > allocation[stratum]
+            }
+            if not available:
+                break
+            shares = {stratum: self.sizes[stratum] * (weights[stratum] if weights else 1.0) for stratum in available}
+            total = sum(shares.values())
+            if total <= 0:
+                shares = {stratum: 1.0 for stratum in available}
+                total = len(shares)
+            quotas = {stratum: budget * share / total for stratum, share in shares.items()}
+            extra = {stratum: min(int(quota), available[stratum]) for stratum, quota in quotas.items()}
+            leftover = budget - sum(extra.values())
+            for stratum in sorted(quotas, key=lambda s: quotas[s] - int(quotas[s]), reverse=True):
+                if leftover == 0:
+                    break
+                if extra[stratum] < available[stratum]:
+                    extra[stratum] += 1
+                    leftover -= 1
+            for stratum, n in extra.items():
+                allocation[stratum] += n
+                budget -= n
+        return {stratum: n for stratum, n in allocation.items() if n}
+
+    def _below_minimum(self, stratum, allocated):
+        drawn = self._drawn[stratum] + allocated
+        return drawn < MIN_PER_STRATUM and allocated < self.remaining(stratum)
+
+
+def _strata_key(strata):
+    """stratifyの指定（None / 辞書のキー名 / 関数）を層キーを返す関数にする"""
+    if strata is None:
+        return lambda item: "all"
+    if callable(strata):
+        return strata
+    return lambda item: item.get(strata)
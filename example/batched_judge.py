@@ -0,0 +1,173 @@
+"""1つのGEval Judgeで複数テストケースを1回のLLM呼び出しにまとめて採点するバッチJudge"""
+from concurrent.futures import ThreadPoolExecutor
+from deepeval.metrics import BaseMetric
+from loguru import logger
+import copy
+from incremental_eval import fingerprint_test_case
+from judge_prompt import (
+    copy_judge_definition,
+    extract_json,
+    format_judge,
+    format_test_case,
+    normalize_score,
+    param_name,
+    strict_score,
+    generate_text
+)
+from token_counter import count_tokens
+
+DEFAULT_TOKEN_BUDGET = 6000
+DEFAULT_MAX_BATCH_SIZE = 20
+
+BATCH_PROMPT_TEMPLATE = """あなたは厳密で公平な評価者です。以下の評価観点で、複数のテストケースをそれぞれ独立して評価してください。
+
+# 評価観点
+{judge}
+
+# テストケース
+{items}
+
+# 出力形式
+次の形式のJSONのみを出力してください。全てのテストケースについて、idはテストケースの見出しの番号と一致させてください。
+scoreは0〜10の整数、reasonはスコアの理由を100文字程度で簡潔に書いてください。
+{{"results": [{{"id": "<番号>", "score": <0-10>, "reason": "<理由>"}}]}}
+"""
+
+
+class BatchedJudge:
+    """トークン予算に収まるだけのテストケースを1プロンプトに詰めて採点する"""
+    def __init__(self, judge, token_budget=DEFAULT_TOKEN_BUDGET, max_batch_size=DEFAULT_MAX_BATCH_SIZE,
+                 max_concurrent=4, model=None):
+        self.judge = judge
+        self.model = model or judge.model
+        self.token_budget = token_budget
+        self.max_batch_size = max_batch_size
+        self.max_concurrent = max_concurrent
+        self.metric = BatchedJudgeMetric(self)
+        self.request_count = 0
+        self.fallback_count = 0
+        self._params = [param_name(p) for p in judge.evaluation_params]
+        self._results = {}
+
+    @property
+    def judging_mode(self):
+        return {"mode": "batched", "model": self.model.get_model_name()}
+
+    def _format_item(self, item_id, test_case):
+        return f"## {item_id}\n{format_test_case(test_case, self._params)}"
+
+    def build_prompt(self, batch):
+        return BATCH_PROMPT_TEMPLATE.format(
+            judge=format_judge(self.judge),
+            items="\n\n".join(self._format_item(i, tc) for i, tc in enumerate(batch, 1))
+        )
+
+    def plan_batches(self, test_cases):
+        """プロンプトがtoken_budgetを超えないようにテストケースを分割する"""
+        model_name = getattr(self.model, "model_name", None)
+        overhead = count_tokens(BATCH_PROMPT_TEMPLATE + format_judge(self.judge), model_name)
+        batches, batch, used = [], [], overhead
+        for test_case in test_cases:
+            cost = count_tokens(self._format_item(len(batch) + 1, test_case), model_name)
+            if batch and (used + cost > self.token_budget or len(batch) >= self.max_batch_size):
+                batches.append(batch)
+                batch, used = [], overhead
+            batch.append(test_case)
+            used += cost
+        if batch:
+            batches.append(batch)
+        return batches
+
+    def parse(self, text, batch_size):
+        """{1始まりの番号: (score, reason)} を返す（解析できなかった項目は含めない）"""
+        try:
+            data = extract_json(text)
+        except ValueError as e:
+            logger.warning(f"⚠️ バッチ評価のJSON解析に失敗: {e}")
+            return {}
+        items = data.get("results", []) if isinstance(data, dict) else data
+        parsed = {}
+        for item in items if isinstance(items, list) else []:
+            try:
+                item_id = int(item["id"])
+                if 1 <= item_id <= batch_size:
+                    parsed[item_id] = (normalize_score(item["score"]), str(item.get("reason", "")))
+            except (KeyError, TypeError, ValueError):
+                continue
+        return parsed
+
+    def judge_single(self, test_case):
+        """元のGEvalで1件だけ採点する（共有インスタンスを汚さないよう複製して使う）"""
+        judge = copy.copy(self.judge)
+        judge.measure(test_case, _show_indicator=False)
+        return judge.score, judge.reason
+
+    async def a_judge_single(self, test_case):
+        judge = copy.copy(self.judge)
+        await judge.a_measure(test_case, _show_indicator=False)
+        return judge.score, judge.reason
+
+    def _judge_batch(self, batch):
+        self.request_count += 1
+        try:
+            parsed = self.parse(generate_text(self.model, self.build_prompt(batch)), len(batch))
+        except Exception as e:
+            logger.warning(f"⚠️ バッチ評価の呼び出しに失敗したため個別に採点します: {e}")
+            parsed = {}
+        missing = [i for i in range(1, len(batch) + 1) if i not in parsed]
+        if missing:
+            self.fallback_count += len(missing)
+            logger.warning(f"⚠️ {len(missing)}/{len(batch)}件の結果が欠落・不正のため個別に再評価します")
+        for i in missing:
+            parsed[i] = self.judge_single(batch[i - 1])
+        return [parsed[i] for i in range(1, len(batch) + 1)]
+
+    def evaluate(self, test_cases):
+        """テストケースと同じ順番で (score, reason) のリストを返す"""
+        batches = self.plan_batches(test_cases)
+        logger.info(f"📦 {self.judge.name}: {len(test_cases)}件を{len(batches)}回の呼び出しで評価します")
+        with ThreadPoolExecutor(max_workers=self.max_concurrent) as executor:
+            results = [item for batch_results in executor.map(self._judge_batch, batches) for item in batch_results]
+        return results
+
+    def prefetch(self, test_cases):
+        """まとめて採点した結果を保持し、metric経由のevaluate()で再利用できるようにする"""
+        self._results = {}
+        if not test_cases:
+            return
+        for test_case, result in zip(test_cases, self.evaluate(test_cases)):
+            self._results[fingerprint_test_case(test_case)] = result
+
+    def lookup(self, test_case):
+        """prefetch済みの (score, reason) を返す（無ければNone）"""
+        return self._results.get(fingerprint_test_case(test_case))
+
+
+class BatchedJudgeMetric(BaseMetric):
+    """prefetch済みの結果を返すメトリック（未prefetchのケースは個別に採点）"""
+    def __init__(self, batched_judge):
+        self.batched_judge = batched_judge
+        copy_judge_definition(self, batched_judge.judge, batched_judge.judging_mode)
+
+    def measure(self, test_case, *args, **kwargs):
+        result = self.batched_judge.lookup(test_case)
+        score, self.reason = result or self.batched_judge.judge_single(test_case)
+        self.score = strict_score(self, score)
+        self.success = self.score >= self.threshold
+        return self.score
+
+    async def a_measure(self, test_case, *args, **kwargs):
+        result = self.batched_judge.lookup(test_case)
+        score, self.reason = result or await self.batched_judge.a_judge_single(test_case)
+        self.score = strict_score(self, score)
+        self.success = self.score >= self.threshold
+        return self.score
+
+    def is_successful(self):
+        if self.error is not None:
+            self.success = False
+        return bool(self.success)
+
+    @property
+    def __name__(self):
+        return getattr(self.batched_judge.judge, "__name__", self.name)
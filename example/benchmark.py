@@ -0,0 +1,243 @@
+"""モックJudgeサーバーに対して評価経路を実行し、スループット・レイテンシ・CPU/メモリを計測するベンチマーク
+
+使い方:
+    python benchmark.py --workloads batch pipeline runner --sizes 50 200 --concurrency 1 4 16
+
+モックサーバーは別プロセスで起動するため、計測されるCPU時間・メモリはクライアント側のみ。
+"""
+from deepeval.metrics import GEval
+from deepeval.test_case import LLMTestCase, LLMTestCaseParams
+from deepeval import evaluate
+from loguru import logger
+from itertools import cycle, islice
+import argparse
+import json
+import multiprocessing
+import os
+import sys
+import tempfile
+import time
+import numpy as np
+from litellm_model import LiteLLMModel
+from rate_limiter import RateLimitScheduler
+from dataset_loader import iter_test_cases
+from concurrent_runner import ConcurrentJudgeRunner, measure
+from judge_registry import JudgeRegistry
+from qa_pipeline import QAEvaluationPipeline
+from mock_judge_server import LATENCY_DISTRIBUTIONS, MockJudgeServer, MockServerConfig
+
+try:
+    import resource
+except ImportError:  # Windowsには無い
+    resource = None
+
+try:
+    from deepeval.evaluate.configs import AsyncConfig, DisplayConfig
+except ImportError:  # 旧バージョンのdeepevalはキーワード引数で指定する
+    AsyncConfig = DisplayConfig = None
+
+WORKLOADS = ("batch", "pipeline", "runner")
+
+JUDGE_DEFINITIONS = [
+    ("Accuracy", "回答が事実的に正確であるかを評価する", [LLMTestCaseParams.INPUT, LLMTestCaseParams.ACTUAL_OUTPUT]),
+    ("Completeness", "回答が質問に対して十分に完全で包括的かを評価する",
+     [LLMTestCaseParams.INPUT, LLMTestCaseParams.ACTUAL_OUTPUT, LLMTestCaseParams.EXPECTED_OUTPUT]),
+    ("Clarity", "回答が分かりやすく、理解しやすい形で表現されているかを評価する", [LLMTestCaseParams.ACTUAL_OUTPUT]),
+    ("Relevance", "回答が質問に直接関連しており、的確に答えているかを評価する",
+     [LLMTestCaseParams.INPUT, LLMTestCaseParams.ACTUAL_OUTPUT])
+]
+EVALUATION_STEPS = ["質問を理解する", "回答を確認する", "基準に照らして採点する"]
+
+
+class TimedLiteLLMModel(LiteLLMModel):
+    """1回の生成（リトライ・待ち時間を含む）ごとの所要時間を記録する"""
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.latencies = []
+        self.error_count = 0
+
+    def generate(self, prompt):
+        started = time.perf_counter()
+        try:
+            return super().generate(prompt)
+        except Exception:
+            self.error_count += 1
+            raise
+        finally:
+            self.latencies.append(time.perf_counter() - started)
+
+    async def a_generate(self, prompt):
+        started = time.perf_counter()
+        try:
+            return await super().a_generate(prompt)
+        except Exception:
+            self.error_count += 1
+            raise
+        finally:
+            self.latencies.append(time.perf_counter() - started)
+
+
+def evaluate_options(concurrency):
+    """インストールされているdeepevalに合わせて並列度・表示設定の引数を作る"""
+    if AsyncConfig is not None:
+        return {
+            "async_config": AsyncConfig(max_concurrent=concurrency),
+            "display_config": DisplayConfig(show_indicator=False, print_results=False)
+        }
+    return {"max_concurrent": concurrency, "show_indicator": False, "print_results": False}
+
+
+def make_test_cases(size):
+    """qa_dataset.csvを繰り返してsize件のテストケースを作る（内容が重複しないよう番号を付与）"""
+    base = list(iter_test_cases(os.path.join(os.path.dirname(os.path.abspath(__file__)), "qa_dataset.csv")))
+    return [
+        LLMTestCase(
+            input=f"{tc.input} (#{i})",
+            actual_output=tc.actual_output,
+            expected_output=tc.expected_output,
+            retrieval_context=tc.retrieval_context
+        )
+        for i, tc in enumerate(islice(cycle(base), size))
+    ]
+
+
+def run_batch(model, test_cases, concurrency):
+    """06_batch_evaluation.py相当: 4つのGEvalでevaluate()する"""
+    judges = [
+        GEval(name=name, criteria=criteria, evaluation_steps=EVALUATION_STEPS,
+              evaluation_params=params, threshold=0.7, model=model)
+        for name, criteria, params in JUDGE_DEFINITIONS
+    ]
+    evaluate(test_cases=test_cases, metrics=judges, **evaluate_options(concurrency))
+
+
+def run_pipeline(model, test_cases, concurrency):
+    """10_pipeline.py相当: QAEvaluationPipeline経由で評価する（評価手順の生成を含む）"""
+    judge_configs = [
+        {"name": name, "criteria": criteria, "params": params, "threshold": 0.7, "model": model}
+        for name, criteria, params in JUDGE_DEFINITIONS
+    ]
+    with tempfile.TemporaryDirectory() as directory:
+        pipeline = QAEvaluationPipeline(
+            judge_configs,
+            registry=JudgeRegistry(os.path.join(directory, "steps.json")),
+            evaluate_kwargs=evaluate_options(concurrency)
+        )
+        pipeline.evaluate_qa_batch([
+            {"question": tc.input, "answer": tc.actual_output, "expected": tc.expected_output}
+            for tc in test_cases
+        ])
+
+
+def run_runner(model, test_cases, concurrency):
+    """15番スクリプト相当: ConcurrentJudgeRunnerで1つのGEvalを並列実行する"""
+    name, criteria, params = JUDGE_DEFINITIONS[1]
+    judge = GEval(name=name, criteria=criteria, evaluation_steps=EVALUATION_STEPS,
+                  evaluation_params=params, threshold=0.7, model=model)
+    for _ in ConcurrentJudgeRunner(judge, concurrency=concurrency).map(measure, test_cases):
+        pass
+
+
+RUNNERS = {"batch": run_batch, "pipeline": run_pipeline, "runner": run_runner}
+
+
+def _peak_rss_mb():
+    if resource is None:
+        return None
+    # Linuxはキロバイト、macOSはバイト単位
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def run_benchmark(workload, base_url, size, concurrency):
+    """1つの組み合わせを実行して計測結果を返す"""
+    model = TimedLiteLLMModel(
+        model_name="mock-judge",
+        base_url=base_url,
+        api_key="mock",
+        pool_size=concurrency,
+        scheduler=RateLimitScheduler()
+    )
+    test_cases = make_test_cases(size)
+    cpu_started = time.process_time()
+    started = time.perf_counter()
+    RUNNERS[workload](model, test_cases, concurrency)
+    elapsed = time.perf_counter() - started
+    latencies = np.array(model.latencies) * 1000
+    return {
+        "workload": workload,
+        "size": size,
+        "concurrency": concurrency,
+        "seconds": elapsed,
+        "cases_per_second": size / elapsed if elapsed else 0,
+        "llm_calls": len(latencies),
+        "llm_errors": model.error_count,
+        "p50_ms": float(np.percentile(latencies, 50)) if len(latencies) else None,
+        "p99_ms": float(np.percentile(latencies, 99)) if len(latencies) else None,
+        "client_cpu_seconds": time.process_time() - cpu_started,
+        "peak_rss_mb": _peak_rss_mb()
+    }
+
+
+def _serve(config, url_queue):
+    server = MockJudgeServer(config)
+    url_queue.put(server.base_url)
+    server.serve_forever()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="モックJudgeサーバーを使った評価経路のベンチマーク")
+    parser.add_argument("--workloads", nargs="+", choices=WORKLOADS, default=list(WORKLOADS))
+    parser.add_argument("--sizes", nargs="+", type=int, default=[50, 200])
+    parser.add_argument("--concurrency", nargs="+", type=int, default=[1, 4, 16])
+    parser.add_argument("--latency-ms", type=float, default=200.0)
+    parser.add_argument("--latency-distribution", choices=LATENCY_DISTRIBUTIONS, default="lognormal")
+    parser.add_argument("--latency-sigma", type=float, default=0.5)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0)
+    parser.add_argument("--server-url", help="起動済みのモックサーバーを使う場合のURL")
+    parser.add_argument("--output", help="計測結果をJSONで保存するパス")
+    args = parser.parse_args()
+
+    server_process = None
+    base_url = args.server_url
+    if base_url is None:
+        config = MockServerConfig(
+            latency_ms=args.latency_ms,
+            latency_distribution=args.latency_distribution,
+            latency_sigma=args.latency_sigma,
+            error_rate=args.error_rate,
+            rate_limit_rate=args.rate_limit_rate,
+            seed=0
+        )
+        url_queue = multiprocessing.Queue()
+        server_process = multiprocessing.Process(target=_serve, args=(config, url_queue), daemon=True)
+        server_process.start()
+        base_url = url_queue.get(timeout=30)
+
+    reports = []
+    try:
+        # ピークRSSはプロセス全体の最大値のため、小さいサイズから順に実行する
+        for size in sorted(args.sizes):
+            for workload in args.workloads:
+                for concurrency in args.concurrency:
+                    logger.info(f"⏱️ {workload}: {size}件, 並列度{concurrency}")
+                    report = run_benchmark(workload, base_url, size, concurrency)
+                    logger.info(
+                        f"   {report['cases_per_second']:.1f}件/秒, p50 {report['p50_ms']:.0f}ms, "
+                        f"p99 {report['p99_ms']:.0f}ms, CPU {report['client_cpu_seconds']:.2f}秒, "
+                        f"エラー {report['llm_errors']}件"
+                    )
+                    reports.append(report)
+    finally:
+        if server_process is not None:
+            server_process.terminate()
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(reports, f, ensure_ascii=False, indent=2)
+        logger.info(f"💾 計測結果を {args.output} に保存しました")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,127 @@
+"""安いJudgeから順に採点し、しきい値付近のケースだけ高価なJudgeに回すカスケードメトリック"""
+from collections import Counter
+from deepeval.metrics import BaseMetric
+from loguru import logger
+import copy
+import threading
+from incremental_eval import fingerprint_judge
+from judge_prompt import copy_judge_definition
+
+DEFAULT_MARGIN = 0.1
+DEFAULT_MIN_CONFIDENCE = 0.5
+
+
+class CascadeStats:
+    """どのTierで判定が確定したかの件数（evaluate()がメトリックを複製しても共有される）"""
+    def __init__(self):
+        self.decided = Counter()
+        self.escalations = 0
+        self._lock = threading.Lock()
+
+    def record(self, judge_name, escalations):
+        with self._lock:
+            self.decided[judge_name] += 1
+            self.escalations += escalations
+
+    def to_dict(self):
+        with self._lock:
+            total = sum(self.decided.values())
+            return {
+                "decided": dict(self.decided),
+                "escalations": self.escalations,
+                "escalation_rate": self.escalations / total if total else 0.0
+            }
+
+
+class CascadeJudgeMetric(BaseMetric):
+    """judgesを安い順に並べて渡す。スコアがthreshold±margin内、またはconfidence_fnの値が
+    min_confidence未満のときだけ次のJudgeで採点し直す（最後のJudgeの結果は常に採用）
+
+    判定したTierは decided_by / tier に記録される。
+    """
+    def __init__(self, judges, margin=DEFAULT_MARGIN, threshold=None, confidence_fn=None,
+                 min_confidence=DEFAULT_MIN_CONFIDENCE, stats=None):
+        if len(judges) < 2:
+            raise ValueError("カスケードには2つ以上のJudgeが必要です")
+        self.judges = judges
+        self.margin = margin
+        self.confidence_fn = confidence_fn
+        self.min_confidence = min_confidence
+        self.stats = stats or CascadeStats()
+        # 名前・評価基準は最終段（最も高精度）のJudgeに合わせ、指紋はTier構成・マージンで区別する
+        copy_judge_definition(self, judges[-1], {
+            "mode": "cascade",
+            "tiers": [fingerprint_judge(judge) for judge in judges],
+            "margin": margin,
+            "min_confidence": min_confidence if confidence_fn is not None else None
+        })
+        if threshold is not None:
+            self.threshold = threshold
+        self.tier = None
+        self.decided_by = None
+
+    def _is_decisive(self, judge, test_case):
+        if judge.score is None:
+            return False
+        if abs(judge.score - self.threshold) <= self.margin:
+            return False
+        if self.confidence_fn is not None:
+            confidence = self.confidence_fn(judge, test_case)
+            if confidence is not None and confidence < self.min_confidence:
+                return False
+        return True
+
+    def _tier_judge(self, tier):
+        # 共有インスタンスを汚さないよう複製し、合否の基準はカスケード全体のしきい値に揃える
+        judge = copy.copy(self.judges[tier])
+        judge.threshold = self.threshold
+        return judge
+
+    def _finish(self, tier, judge):
+        # 各Tierは同じ評価基準（同じname）なので、判定したTierはJudgeモデルで区別する
+        self.tier = tier
+        self.decided_by = getattr(judge, "evaluation_model", None) or judge.name
+        self.score, self.reason = judge.score, judge.reason
+        self.success = self.score >= self.threshold
+        self.verbose_logs = f"判定Tier: {tier + 1}/{len(self.judges)} ({self.decided_by})"
+        self.stats.record(self.decided_by, tier)
+        if tier:
+            logger.debug(f"🪜 {self.name}: {tier}回エスカレーションして{self.decided_by}で判定しました")
+        return self.score
+
+    def measure(self, test_case, *args, **kwargs):
+        for tier in range(len(self.judges)):
+            judge = self._tier_judge(tier)
+            last = tier == len(self.judges) - 1
+            try:
+                judge.measure(test_case, *args, **kwargs)
+            except Exception as e:
+                if last:
+                    raise
+                logger.warning(f"⚠️ {judge.name}で失敗したため次のJudgeで評価します: {e}")
+                continue
+            if last or self._is_decisive(judge, test_case):
+                return self._finish(tier, judge)
+
+    async def a_measure(self, test_case, *args, **kwargs):
+        for tier in range(len(self.judges)):
+            judge = self._tier_judge(tier)
+            last = tier == len(self.judges) - 1
+            try:
+                await judge.a_measure(test_case, *args, **kwargs)
+            except Exception as e:
+                if last:
+                    raise
+                logger.warning(f"⚠️ {judge.name}で失敗したため次のJudgeで評価します: {e}")
+                continue
+            if last or self._is_decisive(judge, test_case):
+                return self._finish(tier, judge)
+
+    def is_successful(self):
+        if self.error is not None:
+            self.success = False
+        return bool(self.success)
+
+    @property
+    def __name__(self):
+        return getattr(self.judges[-1], "__name__", self.name)
@@ -0,0 +1,110 @@
+"""テストケース間で共通する検索コンテキストのチャンクを1つだけ保持し、チャンク単位の計算結果も共有するストア"""
+from collections import OrderedDict
+import sys
+import threading
+from context_compaction import char_ngrams
+from token_counter import count_tokens
+
+DEFAULT_MAX_CHUNKS = 50000
+
+
+class ChunkStore:
+    """同じ内容のチャンクはIDと文字列オブジェクトを1つだけ持ち、全テストケースから参照させる
+
+    トークン数・n-gramなどチャンク単位の計算結果もチャンクごとに1回だけ計算して再利用する。
+    保持するチャンクはmax_chunks件まで（Noneなら無制限）で、超えたら最も長く使われていない
+    チャンクとその計算結果を捨てる。捨てたチャンクを参照済みのテストケースはそのまま使える。
+    """
+    def __init__(self, max_chunks=DEFAULT_MAX_CHUNKS):
+        self.max_chunks = max_chunks
+        self.evictions = 0
+        # 文字列 -> ID（使われた順に並べ、先頭から捨てる）
+        self._ids = OrderedDict()
+        self._texts = {}
+        self._token_counts = {}
+        self._ngrams = {}
+        self._next_id = 0
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._texts)
+
+    def _intern(self, text):
+        """(ID, 共有の文字列オブジェクト) を返す"""
+        with self._lock:
+            chunk_id = self._ids.get(text)
+            if chunk_id is not None:
+                self._ids.move_to_end(text)
+                return chunk_id, self._texts[chunk_id]
+            # 以降の辞書引きで文字列比較が不要になるよう、保持する文字列はsys.internする
+            text = sys.intern(text)
+            chunk_id = self._next_id
+            self._next_id += 1
+            self._ids[text] = chunk_id
+            self._texts[chunk_id] = text
+            if self.max_chunks is not None and len(self._ids) > self.max_chunks:
+                self._evict()
+            return chunk_id, text
+
+    def _evict(self):
+        # 呼び出し側でself._lockを保持していること
+        _, chunk_id = self._ids.popitem(last=False)
+        del self._texts[chunk_id]
+        self._token_counts.pop(chunk_id, None)
+        self._ngrams.pop(chunk_id, None)
+        self.evictions += 1
+
+    def intern(self, text):
+        """チャンクを登録してIDを返す（登録済みなら既存のID）"""
+        return self._intern(text)[0]
+
+    def intern_many(self, texts):
+        return tuple(self.intern(text) for text in texts)
+
+    def text(self, chunk_id):
+        return self._texts[chunk_id]
+
+    def resolve(self, chunk_ids):
+        """IDのリストを共有の文字列オブジェクトのリストにする（捨てられたIDはKeyError）"""
+        return [self._texts[chunk_id] for chunk_id in chunk_ids]
+
+    def intern_list(self, texts):
+        """文字列リストを共有オブジェクトに置き換えたリストを返す（retrieval_context用）"""
+        return [self._intern(text)[1] for text in texts]
+
+    def _remember(self, cache, chunk_id, value):
+        with self._lock:
+            # 計算中に捨てられたチャンクの結果は保持しない
+            if chunk_id in self._texts:
+                cache[chunk_id] = value
+
+    def token_count(self, text, model_name=None):
+        """チャンクのトークン数（チャンク・モデルごとに1回だけ数える）"""
+        chunk_id = self.intern(text)
+        counts = self._token_counts.get(chunk_id)
+        count = counts.get(model_name) if counts else None
+        if count is None:
+            count = count_tokens(text, model_name)
+            with self._lock:
+                if chunk_id in self._texts:
+                    self._token_counts.setdefault(chunk_id, {})[model_name] = count
+        return count
+
+    def ngrams(self, text):
+        """チャンクの文字n-gram集合（チャンクごとに1回だけ計算する）"""
+        chunk_id = self.intern(text)
+        ngrams = self._ngrams.get(chunk_id)
+        if ngrams is None:
+            ngrams = frozenset(char_ngrams(text))
+            self._remember(self._ngrams, chunk_id, ngrams)
+        return ngrams
+
+    def stats(self):
+        with self._lock:
+            return {
+                "chunks": len(self._texts),
+                "total_chars": sum(len(text) for text in self._texts.values()),
+                "evictions": self.evictions,
+                "token_counts_cached": sum(len(counts) for counts in self._token_counts.values()),
+                "ngrams_cached": len(self._ngrams)
+            }
@@ -0,0 +1,117 @@
+"""評価結果をParquet（列指向）で保存・読み込みするストア"""
+from loguru import logger
+import os
+import pyarrow as pa
+import pyarrow.parquet as pq
+from incremental_eval import fingerprint_test_case
+from result_journal import judge_score_key
+
+LONG_TABLE_FILE = "results.parquet"
+SCORE_MATRIX_FILE = "scores.parquet"
+
+LONG_SCHEMA = pa.schema([
+    ("row_id", pa.int64()),
+    ("case_id", pa.string()),
+    ("question", pa.string()),
+    ("answer", pa.string()),
+    ("judge", pa.dictionary(pa.int32(), pa.string())),
+    ("score", pa.float64()),
+    ("success", pa.bool_()),
+    ("reason", pa.string())
+])
+
+
+def score_matrix_schema(judge_names):
+    return pa.schema(
+        [("row_id", pa.int64()), ("case_id", pa.string()), ("overall_success", pa.bool_())]
+        + [(name, pa.float64()) for name in judge_names]
+    )
+
+
+class ColumnarResultWriter:
+    """評価結果を縦持ちテーブルとスコア行列の2つのParquetに書き出す
+
+    - results.parquet: row_id, case_id, question, answer, judge, score, success, reason（1行 = 1ペア）
+    - scores.parquet: row_id, case_id, overall_success, Judge名ごとのスコア列（1行 = 1テストケース）
+
+    row_idは書き込み順の通し番号で、テストケースを一意に指す。
+    case_idは内容のハッシュのため、同じ質問・回答のケースが複数あると重複する。
+
+    write()のたびにRow Groupを追記するため、チャンク評価の結果を順に書き込める。
+    """
+    def __init__(self, directory, judge_names):
+        self.directory = directory
+        self.judge_names = list(judge_names)
+        self.row_count = 0
+        os.makedirs(directory, exist_ok=True)
+        self._matrix_schema = score_matrix_schema(self.judge_names)
+        self._long_writer = pq.ParquetWriter(os.path.join(directory, LONG_TABLE_FILE), LONG_SCHEMA)
+        self._matrix_writer = pq.ParquetWriter(os.path.join(directory, SCORE_MATRIX_FILE), self._matrix_schema)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def write(self, test_results):
+        """deepevalのTestResult（またはIncrementalEvaluatorの結果）を追記する"""
+        if not test_results:
+            return
+        row_ids = list(range(self.row_count, self.row_count + len(test_results)))
+        case_ids = [fingerprint_test_case(result) for result in test_results]
+        pairs = [
+            (row_id, case_id, result, metric_data)
+            for row_id, case_id, result in zip(row_ids, case_ids, test_results)
+            for metric_data in result.metrics_data
+        ]
+        self._long_writer.write_table(pa.table({
+            "row_id": [row_id for row_id, _, _, _ in pairs],
+            "case_id": [case_id for _, case_id, _, _ in pairs],
+            "question": [result.input for _, _, result, _ in pairs],
+            "answer": [result.actual_output for _, _, result, _ in pairs],
+            "judge": [judge_score_key(m.name) for _, _, _, m in pairs],
+            "score": [m.score for _, _, _, m in pairs],
+            "success": [bool(m.success) for _, _, _, m in pairs],
+            "reason": [getattr(m, "reason", "") or "" for _, _, _, m in pairs]
+        }, schema=LONG_SCHEMA))
+
+        scores = {name: [None] * len(test_results) for name in self.judge_names}
+        for row, result in enumerate(test_results):
+            for metric_data in result.metrics_data:
+                name = judge_score_key(metric_data.name)
+                if name in scores:
+                    scores[name][row] = metric_data.score
+        self._matrix_writer.write_table(pa.table({
+            "row_id": row_ids,
+            "case_id": case_ids,
+            "overall_success": [bool(result.success) for result in test_results],
+            **scores
+        }, schema=self._matrix_schema))
+        self.row_count += len(test_results)
+
+    def close(self):
+        self._long_writer.close()
+        self._matrix_writer.close()
+        logger.info(f"💾 {self.row_count}件の評価結果を {self.directory} に保存しました")
+
+
+def load_scores(directory, judge_names=None, memory_map=True):
+    """スコア行列を読み込む（judge_namesを指定するとその列だけを読む）"""
+    columns = ["row_id", "case_id", "overall_success", *judge_names] if judge_names else None
+    table = pq.read_table(os.path.join(directory, SCORE_MATRIX_FILE), columns=columns, memory_map=memory_map)
+    return table.to_pandas()
+
+
+def load_results(directory, columns=None, filters=None, memory_map=True):
+    """縦持ちテーブルを読み込む
+
+    filtersはpyarrowの形式（例: [("score", "<", 0.6)]）で、条件に合う行だけを読み込む。
+    """
+    table = pq.read_table(
+        os.path.join(directory, LONG_TABLE_FILE),
+        columns=columns,
+        filters=filters,
+        memory_map=memory_map
+    )
+    return table.to_pandas()
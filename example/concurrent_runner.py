@@ -0,0 +1,55 @@
+"""Judgeの複製をプールして、テストケースを並列に評価するランナー"""
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+import copy
+import queue
+
+DEFAULT_CONCURRENCY = 4
+
+
+class ConcurrentJudgeRunner:
+    """GEvalはscore/reasonをインスタンスに保持するため、ワーカーごとに複製を貸し出して並列化する"""
+    def __init__(self, judge, concurrency=DEFAULT_CONCURRENCY):
+        self.judge = judge
+        self.concurrency = concurrency
+        self._pool = queue.Queue()
+        for _ in range(concurrency):
+            clone = copy.copy(judge)
+            # 各スレッドでイベントループを作らず、共有の同期HTTPプールで送信させる
+            clone.async_mode = False
+            self._pool.put(clone)
+
+    def _call(self, fn, test_case):
+        judge = self._pool.get()
+        try:
+            return fn(judge, test_case)
+        finally:
+            self._pool.put(judge)
+
+    def map(self, fn, test_cases):
+        """fn(judge, test_case) を並列実行し、(test_case, 結果, 例外) を入力順に返す
+
+        test_casesはイテレータでもよく、同時に保持するのは concurrency * 2 件まで。
+        """
+        max_in_flight = self.concurrency * 2
+        with ThreadPoolExecutor(max_workers=self.concurrency) as executor:
+            in_flight = deque()
+            for test_case in test_cases:
+                in_flight.append((test_case, executor.submit(self._call, fn, test_case)))
+                if len(in_flight) >= max_in_flight:
+                    yield self._collect(*in_flight.popleft())
+            while in_flight:
+                yield self._collect(*in_flight.popleft())
+
+    @staticmethod
+    def _collect(test_case, future):
+        try:
+            return test_case, future.result(), None
+        except Exception as e:
+            return test_case, None, e
+
+
+def measure(judge, test_case):
+    """ConcurrentJudgeRunner.map用の標準処理: (score, reason) を返す"""
+    judge.measure(test_case, _show_indicator=False)
+    return judge.score, judge.reason
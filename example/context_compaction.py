@@ -0,0 +1,161 @@
+"""RAG Judgeに渡すretrieval_contextを、重複除去・関連度順の選別・トークン予算で圧縮する"""
+from deepeval.metrics import BaseMetric
+from loguru import logger
+import copy
+import math
+import unicodedata
+from judge_prompt import copy_judge_definition
+from token_counter import count_tokens
+
+DEFAULT_TOKEN_BUDGET = 1500
+DEFAULT_NGRAM_SIZE = 3
+NEAR_DUPLICATE_THRESHOLD = 0.9
+
+
+def normalize_text(text):
+    """全角・半角、大文字・小文字、空白の揺れを吸収する"""
+    return "".join(unicodedata.normalize("NFKC", text).lower().split())
+
+
+def char_ngrams(text, n=DEFAULT_NGRAM_SIZE):
+    """文字n-gramの集合（分かち書き不要で日本語にも使える）"""
+    normalized = normalize_text(text)
+    if len(normalized) <= n:
+        return {normalized} if normalized else set()
+    return {normalized[i:i + n] for i in range(len(normalized) - n + 1)}
+
+
+def jaccard(a, b):
+    if not a and not b:
+        return 1.0
+    return len(a & b) / len(a | b)
+
+
+def _chunk_ngrams(chunk, chunk_store=None):
+    return chunk_store.ngrams(chunk) if chunk_store is not None else char_ngrams(chunk)
+
+
+def _chunk_tokens(chunk, model_name=None, chunk_store=None):
+    return chunk_store.token_count(chunk, model_name) if chunk_store is not None else count_tokens(chunk, model_name)
+
+
+def dedupe_chunks(chunks, threshold=NEAR_DUPLICATE_THRESHOLD, chunk_store=None):
+    """完全一致・ほぼ同一（n-gramのJaccard係数がthreshold以上）のチャンクを除き、先に出たものを残す
+
+    chunk_store（ChunkStore）を渡すと、チャンクごとのn-gramを全テストケースで使い回す。
+    """
+    kept, kept_ngrams = [], []
+    for chunk in chunks:
+        ngrams = _chunk_ngrams(chunk, chunk_store)
+        if any(jaccard(ngrams, other) >= threshold for other in kept_ngrams):
+            continue
+        kept.append(chunk)
+        kept_ngrams.append(ngrams)
+    return kept
+
+
+def relevance(chunk, query_ngrams, chunk_store=None):
+    """質問・回答とのn-gram重なり（長いチャンクが有利になりすぎないよう長さで正規化）"""
+    ngrams = _chunk_ngrams(chunk, chunk_store)
+    if not ngrams:
+        return 0.0
+    return len(ngrams & query_ngrams) / math.sqrt(len(ngrams))
+
+
+def truncate_to_budget(text, token_budget, model_name=None):
+    """token_budgetに収まる最長の先頭部分を返す（二分探索）"""
+    if count_tokens(text, model_name) <= token_budget:
+        return text
+    low, high = 0, len(text)
+    while low < high:
+        middle = (low + high + 1) // 2
+        if count_tokens(text[:middle], model_name) <= token_budget:
+            low = middle
+        else:
+            high = middle - 1
+    return text[:low]
+
+
+def compact_context(chunks, input="", actual_output="", token_budget=DEFAULT_TOKEN_BUDGET,
+                    model_name=None, near_duplicate_threshold=NEAR_DUPLICATE_THRESHOLD, chunk_store=None):
+    """重複を除いたチャンクを質問・回答との関連度順に選び、token_budget以内に収める
+
+    選ばれたチャンクは元の検索順のまま返す。1件も収まらない場合は最も関連度の高いチャンクを切り詰める。
+    """
+    if not chunks:
+        return []
+    unique = dedupe_chunks(chunks, near_duplicate_threshold, chunk_store)
+    query_ngrams = char_ngrams(input or "") | char_ngrams(actual_output or "")
+    ranked = sorted(range(len(unique)), key=lambda i: relevance(unique[i], query_ngrams, chunk_store), reverse=True)
+    selected, used = set(), 0
+    for i in ranked:
+        tokens = _chunk_tokens(unique[i], model_name, chunk_store)
+        if used + tokens <= token_budget:
+            selected.add(i)
+            used += tokens
+    if not selected:
+        return [truncate_to_budget(unique[ranked[0]], token_budget, model_name)]
+    return [chunk for i, chunk in enumerate(unique) if i in selected]
+
+
+def compact_test_case(test_case, token_budget=DEFAULT_TOKEN_BUDGET, model_name=None, chunk_store=None):
+    """retrieval_contextを圧縮したテストケースの複製を返す（元のテストケースは変更しない）"""
+    if not test_case.retrieval_context:
+        return test_case
+    compacted = copy.copy(test_case)
+    compacted.retrieval_context = compact_context(
+        test_case.retrieval_context,
+        input=test_case.input,
+        actual_output=test_case.actual_output,
+        token_budget=token_budget,
+        model_name=model_name,
+        chunk_store=chunk_store
+    )
+    return compacted
+
+
+class CompactContextMetric(BaseMetric):
+    """Judgeごとのトークン予算でretrieval_contextを圧縮してから元のGEvalで採点するメトリック"""
+    def __init__(self, judge, token_budget=DEFAULT_TOKEN_BUDGET, chunk_store=None):
+        self.judge = judge
+        self.token_budget = token_budget
+        self.chunk_store = chunk_store
+        # 圧縮したコンテキストでの採点結果は、元のGEvalの結果と区別する
+        copy_judge_definition(self, judge, {"mode": "compacted", "token_budget": token_budget})
+
+    def _compact(self, test_case):
+        model_name = getattr(self.judge.model, "model_name", None)
+        compacted = compact_test_case(test_case, self.token_budget, model_name, self.chunk_store)
+        if compacted is not test_case:
+            before = sum(_chunk_tokens(chunk, model_name, self.chunk_store) for chunk in test_case.retrieval_context)
+            after = sum(_chunk_tokens(chunk, model_name, self.chunk_store) for chunk in compacted.retrieval_context)
+            logger.debug(
+                f"✂️ {self.name}: retrieval_context {len(test_case.retrieval_context)}件→{len(compacted.retrieval_context)}件, "
+                f"{before}→{after}トークン"
+            )
+        return compacted
+
+    def _copy_result(self, judge):
+        self.score, self.reason = judge.score, judge.reason
+        self.success = self.score >= self.threshold
+        return self.score
+
+    def measure(self, test_case, *args, **kwargs):
+        # 共有インスタンスを汚さないよう複製して採点する
+        judge = copy.copy(self.judge)
+        judge.measure(self._compact(test_case), *args, **kwargs)
+        return self._copy_result(judge)
+
+    async def a_measure(self, test_case, *args, **kwargs):
+        judge = copy.copy(self.judge)
+        await judge.a_measure(self._compact(test_case), *args, **kwargs)
+        return self._copy_result(judge)
+
+    def is_successful(self):
+        if self.error is not None:
+            self.success = False
+        return bool(self.success)
+
+    @property
+    def __name__(self):
+        return getattr(self.judge, "__name__", self.name)
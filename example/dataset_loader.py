@@ -0,0 +1,57 @@
+"""CSV/JSONLのQAデータセットをメモリに全件載せずにLLMTestCaseとして読み込むローダー"""
+from deepeval.test_case import LLMTestCase
+from itertools import islice
+import csv
+import json
+
+CONTEXT_SEPARATOR = "|||"
+DEFAULT_CHUNK_SIZE = 1000
+
+
+def iter_qa_rows(path):
+    """1行ずつ辞書として返す（拡張子 .jsonl / .ndjson はJSONL、それ以外はCSV）"""
+    with open(path, encoding="utf-8", newline="") as f:
+        if path.endswith((".jsonl", ".ndjson")):
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+        else:
+            yield from csv.DictReader(f)
+
+
+def split_context(value):
+    """区切り文字 ||| で連結された文字列（JSONLではリストも可）を検索コンテキストのリストにする"""
+    if not value:
+        return []
+    if isinstance(value, list):
+        return value
+    return value.split(CONTEXT_SEPARATOR)
+
+
+def row_to_test_case(row, chunk_store=None):
+    """chunk_store（ChunkStore）を渡すと、同じ内容のチャンクは全テストケースで1つの文字列を共有する"""
+    retrieval_context = split_context(row.get("context"))
+    if chunk_store is not None:
+        retrieval_context = chunk_store.intern_list(retrieval_context)
+    return LLMTestCase(
+        input=row["question"],
+        actual_output=row["llm_answer"],
+        expected_output=row.get("expected_answer") or None,
+        retrieval_context=retrieval_context
+    )
+
+
+def iter_test_cases(path, chunk_store=None):
+    """テストケースを1件ずつ生成する"""
+    for row in iter_qa_rows(path):
+        yield row_to_test_case(row, chunk_store)
+
+
+def iter_test_case_chunks(path, chunk_size=DEFAULT_CHUNK_SIZE, chunk_store=None):
+    """テストケースをchunk_size件ずつのリストで生成する（メモリ使用量はチャンクサイズで頭打ち）"""
+    test_cases = iter_test_cases(path, chunk_store)
+    while True:
+        chunk = list(islice(test_cases, chunk_size))
+        if not chunk:
+            return
+        yield chunk
@@ -0,0 +1,71 @@
+"""(テストケース × Judge) のスコア行列から、Judge間で意見が分かれたケースをまとめて検出する"""
+from dataclasses import dataclass
+import numpy as np
+
+DEFAULT_CHUNK_SIZE = 1_000_000
+METRICS = ("std", "spread")
+
+
+@dataclass
+class Disagreements:
+    indices: np.ndarray   # 行番号（値の大きい順）
+    std: np.ndarray       # 各行のスコア標準偏差
+    spread: np.ndarray    # 各行の最大スコア - 最小スコア
+    count: int            # しきい値を超えた行の総数
+
+
+def row_std(scores):
+    """行ごとのスコア標準偏差（欠損値NaNは無視）"""
+    scores = np.asarray(scores, dtype=np.float64)
+    if np.isnan(scores).any():
+        return np.nanstd(scores, axis=1)
+    # Judge数（列数）は少ないため、列方向に演算したほうが行ごとのstdより速い
+    columns = scores.T
+    mean = columns.sum(axis=0) / len(columns)
+    return np.sqrt(((columns - mean) ** 2).sum(axis=0) / len(columns))
+
+
+def row_spread(scores):
+    """行ごとの最大スコア - 最小スコア（欠損値NaNは無視）"""
+    scores = np.asarray(scores, dtype=np.float64)
+    if np.isnan(scores).any():
+        return np.nanmax(scores, axis=1) - np.nanmin(scores, axis=1)
+    columns = scores.T
+    return np.maximum.reduce(columns) - np.minimum.reduce(columns)
+
+
+def _top_k(values, k):
+    """大きい順の上位k件の位置を返す（全体をソートせず部分選択）"""
+    if len(values) > k:
+        candidates = np.argpartition(values, -k)[-k:]
+    else:
+        candidates = np.arange(len(values))
+    return candidates[np.argsort(values[candidates], kind="stable")[::-1]]
+
+
+def find_disagreements(scores, threshold=0.3, top_k=5, metric="std", chunk_size=DEFAULT_CHUNK_SIZE):
+    """metric（"std" または "spread"）がthresholdを超えた行のうち、上位top_k件を返す
+
+    行列はchunk_size行ずつ処理し、保持するのは各チャンクの上位top_k件だけなので、
+    1000万行規模でも行ごとのPythonオブジェクトを作らずに済む。
+    """
+    if metric not in METRICS:
+        raise ValueError(f"metricは{METRICS}のいずれかを指定してください: {metric}")
+    scores = np.asarray(scores, dtype=np.float64)
+    best_indices = np.empty(0, dtype=np.int64)
+    best_std = np.empty(0)
+    best_spread = np.empty(0)
+    count = 0
+    for start in range(0, len(scores), chunk_size):
+        chunk = scores[start:start + chunk_size]
+        values = row_std(chunk) if metric == "std" else row_spread(chunk)
+        over = np.flatnonzero(values > threshold)
+        count += len(over)
+        top = over[_top_k(values[over], top_k)]
+        # これまでの上位候補とこのチャンクの上位候補を合わせて、上位top_k件に絞る
+        best_indices = np.concatenate([best_indices, top + start])
+        best_std = np.concatenate([best_std, row_std(chunk[top])])
+        best_spread = np.concatenate([best_spread, row_spread(chunk[top])])
+        keep = _top_k(best_std if metric == "std" else best_spread, top_k)
+        best_indices, best_std, best_spread = best_indices[keep], best_std[keep], best_spread[keep]
+    return Disagreements(indices=best_indices, std=best_std, spread=best_spread, count=count)
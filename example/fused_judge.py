@@ -0,0 +1,173 @@
+"""複数のGEval Judgeを1回のLLM呼び出しでまとめて採点するフューズドJudge"""
+from collections import OrderedDict
+from concurrent.futures import Future
+from deepeval.metrics import BaseMetric
+from loguru import logger
+import asyncio
+import copy
+import threading
+from incremental_eval import fingerprint_judge, fingerprint_test_case
+from judge_prompt import (
+    copy_judge_definition,
+    extract_json,
+    format_judge,
+    format_test_case,
+    normalize_score,
+    param_name,
+    strict_score,
+    generate_text,
+    a_generate_text
+)
+
+MEMO_SIZE = 1024
+
+FUSED_PROMPT_TEMPLATE = """あなたは厳密で公平な評価者です。以下のテストケースを、各評価観点ごとに独立して評価してください。
+
+# テストケース
+{test_case}
+
+# 評価観点
+{judges}
+
+# 出力形式
+次の形式のJSONのみを出力してください。scoreは0〜10の整数、reasonはスコアの理由です。
+全ての評価観点について、nameは評価観点の見出しと完全に一致させてください。
+{{"results": [{{"name": "<評価観点名>", "score": <0-10>, "reason": "<理由>"}}]}}
+"""
+
+
+class FusedJudgeGroup:
+    """GEvalのリストを受け取り、テストケースごとに1回の呼び出しで全観点を採点する"""
+    def __init__(self, judges, model=None):
+        self.judges = judges
+        self.model = model or judges[0].model
+        # 同じ観点でも、一緒に採点する観点・モデルが変われば別の結果として扱う
+        self.judging_mode = {
+            "mode": "fused",
+            "members": [fingerprint_judge(judge) for judge in judges],
+            "model": self.model.get_model_name()
+        }
+        self.metrics = [FusedJudgeMetric(self, judge) for judge in judges]
+        self.request_count = 0
+        self.fallback_count = 0
+        self._params = list(dict.fromkeys(
+            param_name(p) for judge in judges for p in (judge.evaluation_params or [])
+        ))
+        self._memo = OrderedDict()
+        self._lock = threading.Lock()
+
+    def build_prompt(self, test_case):
+        return FUSED_PROMPT_TEMPLATE.format(
+            test_case=format_test_case(test_case, self._params),
+            judges="\n\n".join(format_judge(judge) for judge in self.judges)
+        )
+
+    def parse(self, text):
+        """{judge名: (score, reason)} を返す（解析できなかった観点は含めない）"""
+        try:
+            data = extract_json(text)
+        except ValueError as e:
+            logger.warning(f"⚠️ フューズド評価のJSON解析に失敗: {e}")
+            return {}
+        items = data.get("results", []) if isinstance(data, dict) else data
+        names = {judge.name for judge in self.judges}
+        parsed = {}
+        for item in items if isinstance(items, list) else []:
+            try:
+                if item["name"] in names:
+                    parsed[item["name"]] = (normalize_score(item["score"]), str(item.get("reason", "")))
+            except (KeyError, TypeError, ValueError):
+                continue
+        return parsed
+
+    def _remember(self, key, value):
+        # 呼び出し側でself._lockを保持していること
+        self._memo[key] = value
+        while len(self._memo) > MEMO_SIZE:
+            self._memo.popitem(last=False)
+
+    def _fallback_judges(self, parsed):
+        missing = [judge for judge in self.judges if judge.name not in parsed]
+        if missing:
+            self.fallback_count += len(missing)
+            logger.warning(f"⚠️ {[j.name for j in missing]} は個別のJudge呼び出しにフォールバックします")
+        # 元のGEvalは他のテストケースと共有されるため、複製して採点する
+        return [copy.copy(judge) for judge in missing]
+
+    def _evaluate(self, test_case):
+        self.request_count += 1
+        parsed = self.parse(generate_text(self.model, self.build_prompt(test_case)))
+        for judge in self._fallback_judges(parsed):
+            judge.measure(test_case, _show_indicator=False)
+            parsed[judge.name] = (judge.score, judge.reason)
+        return parsed
+
+    async def _a_evaluate(self, test_case):
+        self.request_count += 1
+        parsed = self.parse(await a_generate_text(self.model, self.build_prompt(test_case)))
+        for judge in self._fallback_judges(parsed):
+            await judge.a_measure(test_case, _show_indicator=False)
+            parsed[judge.name] = (judge.score, judge.reason)
+        return parsed
+
+    def judge(self, test_case, name):
+        """同じテストケースへの2つ目以降の観点は、1回目の呼び出し結果を共有する"""
+        key = fingerprint_test_case(test_case)
+        with self._lock:
+            future = self._memo.get(key)
+            owner = future is None
+            if owner:
+                future = Future()
+                self._remember(key, future)
+        if owner:
+            try:
+                future.set_result(self._evaluate(test_case))
+            except Exception as e:
+                with self._lock:
+                    self._memo.pop(key, None)
+                future.set_exception(e)
+        return future.result()[name]
+
+    async def a_judge(self, test_case, name):
+        key = ("async", fingerprint_test_case(test_case))
+        with self._lock:
+            task = self._memo.get(key)
+            if task is None:
+                task = asyncio.ensure_future(self._a_evaluate(test_case))
+                self._remember(key, task)
+        try:
+            parsed = await task
+        except Exception:
+            with self._lock:
+                self._memo.pop(key, None)
+            raise
+        return parsed[name]
+
+
+class FusedJudgeMetric(BaseMetric):
+    """FusedJudgeGroupの結果から1観点分を取り出すメトリック（元のGEvalと同じ名前・閾値）"""
+    def __init__(self, group, judge):
+        self.group = group
+        self.judge = judge
+        copy_judge_definition(self, judge, group.judging_mode)
+
+    def measure(self, test_case, *args, **kwargs):
+        score, self.reason = self.group.judge(test_case, self.name)
+        self.score = strict_score(self, score)
+        self.success = self.score >= self.threshold
+        return self.score
+
+    async def a_measure(self, test_case, *args, **kwargs):
+        score, self.reason = await self.group.a_judge(test_case, self.name)
+        self.score = strict_score(self, score)
+        self.success = self.score >= self.threshold
+        return self.score
+
+    def is_successful(self):
+        if self.error is not None:
+            self.success = False
+        return bool(self.success)
+
+    @property
+    def __name__(self):
+        return getattr(self.judge, "__name__", self.name)
@@ -0,0 +1,219 @@
+"""変更された行・Judgeだけを再評価するインクリメンタル評価"""
+from dataclasses import dataclass, field
+from deepeval import evaluate
+from loguru import logger
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+DEFAULT_STORE_PATH = "incremental_results.sqlite3"
+LOAD_BATCH_SIZE = 500
+
+TEST_CASE_FIELDS = ("input", "actual_output", "expected_output", "context", "retrieval_context")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS results (
+    case_fp TEXT NOT NULL,
+    judge_fp TEXT NOT NULL,
+    judge_name TEXT NOT NULL,
+    score REAL,
+    success INTEGER NOT NULL,
+    reason TEXT,
+    updated_at REAL NOT NULL,
+    PRIMARY KEY (case_fp, judge_fp)
+);
+"""
+
+
+def _hash(payload):
+    canonical = json.dumps(payload, ensure_ascii=False, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+def fingerprint_test_case(test_case):
+    """テストケース（またはdeepevalのTestResult）の内容から指紋を作る"""
+    # TestResult側で空リストがNoneになっても同じ指紋になるよう空値はNoneに揃える
+    return _hash({name: getattr(test_case, name, None) or None for name in TEST_CASE_FIELDS})
+
+
+def fingerprint_judge(judge):
+    """Judgeの評価基準・手順・パラメータ・閾値・モデルから指紋を作る"""
+    model = getattr(judge, "model", None)
+    definition = {
+        "name": judge.name,
+        "criteria": getattr(judge, "criteria", None),
+        "evaluation_steps": getattr(judge, "evaluation_steps", None),
+        "evaluation_params": [
+            getattr(param, "value", param) for param in (getattr(judge, "evaluation_params", None) or [])
+        ],
+        "threshold": judge.threshold,
+        "strict_mode": getattr(judge, "strict_mode", False),
+        "model": model.get_model_name() if hasattr(model, "get_model_name") else getattr(judge, "evaluation_model", None)
+    }
+    # フューズド・バッチ採点のラッパーはプロンプトが元のGEvalと違うため、採点方式も指紋に含める
+    judging_mode = getattr(judge, "judging_mode", None)
+    if judging_mode is not None:
+        definition["judging_mode"] = judging_mode
+    return _hash(definition)
+
+
+@dataclass
+class StoredMetricData:
+    name: str
+    score: float
+    success: bool
+    reason: str = ""
+
+
+@dataclass
+class StoredTestResult:
+    input: str
+    actual_output: str
+    expected_output: str
+    success: bool
+    metrics_data: list = field(default_factory=list)
+
+
+@dataclass
+class IncrementalResults:
+    test_results: list
+    reused_count: int
+    judged_count: int
+
+
+class IncrementalResultStore:
+    """(テストケース指紋, Judge指紋) ごとの評価結果を保存するストア"""
+    def __init__(self, path=DEFAULT_STORE_PATH):
+        self.path = path
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._conn = sqlite3.connect(path, timeout=30, isolation_level=None, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(_SCHEMA)
+        # 並列ランナーから複数スレッドで使われるため、接続の利用を直列化する
+        self._lock = threading.Lock()
+
+    def load(self, case_fps, judge_fps):
+        """指定したテストケース・Judgeの保存済み結果を {(case_fp, judge_fp): StoredMetricData} で返す"""
+        case_fps = list(dict.fromkeys(case_fps))
+        judge_fps = set(judge_fps)
+        stored = {}
+        # SQLiteのパラメータ数上限を超えないよう分割して問い合わせる
+        for start in range(0, len(case_fps), LOAD_BATCH_SIZE):
+            batch = case_fps[start:start + LOAD_BATCH_SIZE]
+            placeholders = ",".join("?" for _ in batch)
+            with self._lock:
+                rows = self._conn.execute(
+                    f"SELECT case_fp, judge_fp, judge_name, score, success, reason FROM results WHERE case_fp IN ({placeholders})",
+                    batch
+                ).fetchall()
+            for case_fp, judge_fp, name, score, success, reason in rows:
+                if judge_fp in judge_fps:
+                    stored[(case_fp, judge_fp)] = StoredMetricData(name, score, bool(success), reason or "")
+        return stored
+
+    def get(self, test_case, judge):
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT judge_name, score, success, reason FROM results WHERE case_fp = ? AND judge_fp = ?",
+                (fingerprint_test_case(test_case), fingerprint_judge(judge))
+            ).fetchone()
+        if row is None:
+            return None
+        return StoredMetricData(row[0], row[1], bool(row[2]), row[3] or "")
+
+    def put(self, test_case, judge, score, success, reason):
+        self.put_many([(fingerprint_test_case(test_case), fingerprint_judge(judge), judge.name, score, success, reason)])
+
+    def put_many(self, rows):
+        """(case_fp, judge_fp, judge_name, score, success, reason) をまとめて保存"""
+        now = time.time()
+        with self._lock:
+            self._conn.execute("BEGIN")
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO results (case_fp, judge_fp, judge_name, score, success, reason, updated_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                [(c, j, n, score, int(bool(success)), reason, now) for c, j, n, score, success, reason in rows]
+            )
+            self._conn.execute("COMMIT")
+
+
+class IncrementalEvaluator:
+    """保存済みの (テストケース, Judge) は再利用し、未評価のペアだけLLMに送る"""
+    def __init__(self, judges, store=None):
+        self.judges = judges
+        self.store = store or IncrementalResultStore()
+        self._judge_fps = [fingerprint_judge(judge) for judge in judges]
+
+    def _match_judge(self, metric_name):
+        # deepevalのバージョンによってメトリック名に " [GEval]" が付くことがある
+        for judge, judge_fp in zip(self.judges, self._judge_fps):
+            if metric_name == judge.name or metric_name.startswith(f"{judge.name} ["):
+                return judge, judge_fp
+        return None, None
+
+    def pending_test_cases(self, test_cases, judge):
+        """指定Judgeの結果がまだ保存されていないテストケースを返す"""
+        case_fps = [fingerprint_test_case(tc) for tc in test_cases]
+        judge_fp = fingerprint_judge(judge)
+        stored = self.store.load(case_fps, [judge_fp])
+        return [tc for tc, case_fp in zip(test_cases, case_fps) if (case_fp, judge_fp) not in stored]
+
+    def evaluate(self, test_cases, **evaluate_kwargs):
+        case_fps = [fingerprint_test_case(tc) for tc in test_cases]
+        stored = self.store.load(case_fps, self._judge_fps)
+
+        # 未評価Judgeの組み合わせごとにテストケースをまとめてevaluate()する
+        pending_groups = {}
+        seen = set()
+        reused_pairs = 0
+        for test_case, case_fp in zip(test_cases, case_fps):
+            if case_fp in seen:
+                continue
+            seen.add(case_fp)
+            missing = tuple(i for i, judge_fp in enumerate(self._judge_fps) if (case_fp, judge_fp) not in stored)
+            reused_pairs += len(self.judges) - len(missing)
+            if missing:
+                pending_groups.setdefault(missing, []).append(test_case)
+
+        judged_pairs = 0
+        for judge_indexes, group in pending_groups.items():
+            metrics = [self.judges[i] for i in judge_indexes]
+            logger.info(f"🔁 {len(group)}件を{[m.name for m in metrics]}で再評価します")
+            results = evaluate(test_cases=group, metrics=metrics, **evaluate_kwargs)
+            rows = []
+            for result in results.test_results:
+                case_fp = fingerprint_test_case(result)
+                for metric_data in result.metrics_data:
+                    judge, judge_fp = self._match_judge(metric_data.name)
+                    if judge is None or metric_data.score is None or getattr(metric_data, "error", None):
+                        # エラーになった結果は保存せず、次回の実行で再評価する
+                        continue
+                    reason = getattr(metric_data, "reason", "") or ""
+                    rows.append((case_fp, judge_fp, judge.name, metric_data.score, metric_data.success, reason))
+                    stored[(case_fp, judge_fp)] = StoredMetricData(judge.name, metric_data.score, bool(metric_data.success), reason)
+            self.store.put_many(rows)
+            judged_pairs += len(rows)
+
+        logger.info(f"♻️ 再利用: {reused_pairs}ペア, 新規評価: {judged_pairs}ペア")
+        return IncrementalResults(
+            test_results=[self._build_result(tc, case_fp, stored) for tc, case_fp in zip(test_cases, case_fps)],
+            reused_count=reused_pairs,
+            judged_count=judged_pairs
+        )
+
+    def _build_result(self, test_case, case_fp, stored):
+        metrics_data = [
+            stored[(case_fp, judge_fp)]
+            for judge_fp in self._judge_fps
+            if (case_fp, judge_fp) in stored
+        ]
+        return StoredTestResult(
+            input=test_case.input,
+            actual_output=test_case.actual_output,
+            expected_output=test_case.expected_output,
+            success=len(metrics_data) == len(self.judges) and all(m.success for m in metrics_data),
+            metrics_data=metrics_data
+        )
@@ -0,0 +1,133 @@
+"""Judge LLMレスポンスの永続キャッシュ（SQLite・内容アドレス方式・サイズ上限付きLRU）"""
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+DEFAULT_CACHE_PATH = "judge_cache.sqlite3"
+DEFAULT_MAX_BYTES = 512 * 1024 * 1024
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS entries (
+    key TEXT PRIMARY KEY,
+    response TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    last_access REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS entries_last_access ON entries(last_access);
+CREATE TABLE IF NOT EXISTS meta (
+    id INTEGER PRIMARY KEY CHECK (id = 0),
+    total_size INTEGER NOT NULL
+);
+INSERT OR IGNORE INTO meta (id, total_size) VALUES (0, 0);
+CREATE TRIGGER IF NOT EXISTS entries_insert AFTER INSERT ON entries BEGIN
+    UPDATE meta SET total_size = total_size + NEW.size WHERE id = 0;
+END;
+CREATE TRIGGER IF NOT EXISTS entries_delete AFTER DELETE ON entries BEGIN
+    UPDATE meta SET total_size = total_size - OLD.size WHERE id = 0;
+END;
+CREATE TRIGGER IF NOT EXISTS entries_update AFTER UPDATE OF size ON entries BEGIN
+    UPDATE meta SET total_size = total_size - OLD.size + NEW.size WHERE id = 0;
+END;
+"""
+
+
+def make_cache_key(payload):
+    """モデル名・プロンプト・生成パラメータを含むリクエスト本体からキーを作る"""
+    canonical = json.dumps(payload, ensure_ascii=False, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+class JudgeResponseCache:
+    """複数プロセスから同時に使えるJudgeレスポンスキャッシュ"""
+    def __init__(self, path=DEFAULT_CACHE_PATH, max_bytes=DEFAULT_MAX_BYTES):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._local = threading.local()
+        self._counter_lock = threading.Lock()
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        self._connect().executescript(_SCHEMA)
+
+    def _connect(self):
+        # sqlite3の接続はスレッド間で共有できないためスレッドごとに持つ
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _count(self, hit):
+        with self._counter_lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    def get(self, payload):
+        """キャッシュ済みのレスポンス文字列を返す（無ければNone）"""
+        key = make_cache_key(payload)
+        conn = self._connect()
+        row = conn.execute("SELECT response FROM entries WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            self._count(False)
+            return None
+        conn.execute("UPDATE entries SET last_access = ? WHERE key = ?", (time.time(), key))
+        self._count(True)
+        return row[0]
+
+    def put(self, payload, response):
+        """レスポンスを保存し、上限を超えた分は最終アクセスが古い順に削除する"""
+        key = make_cache_key(payload)
+        size = len(key) + len(response.encode("utf-8"))
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.execute(
+                "INSERT INTO entries (key, response, size, last_access) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT(key) DO UPDATE SET response = excluded.response, "
+                "size = excluded.size, last_access = excluded.last_access",
+                (key, response, size, time.time())
+            )
+            self._evict(conn)
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    def _evict(self, conn):
+        total = conn.execute("SELECT total_size FROM meta WHERE id = 0").fetchone()[0]
+        while total > self.max_bytes:
+            rows = conn.execute(
+                "SELECT key, size FROM entries ORDER BY last_access LIMIT 100"
+            ).fetchall()
+            if not rows:
+                break
+            for key, size in rows:
+                if total <= self.max_bytes:
+                    break
+                conn.execute("DELETE FROM entries WHERE key = ?", (key,))
+                total -= size
+
+    def stats(self):
+        """ヒット数・ミス数・ヒット率・件数・合計サイズを返す"""
+        conn = self._connect()
+        entries = conn.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+        total = conn.execute("SELECT total_size FROM meta WHERE id = 0").fetchone()[0]
+        requests = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / requests if requests else 0.0,
+            "entries": entries,
+            "total_bytes": total
+        }
+
+    def clear(self):
+        self._connect().execute("DELETE FROM entries")
@@ -0,0 +1,177 @@
+"""Judgeと人間評価の一致度をストリーミングで監視し、劣化（ドリフト）を検知するモニター"""
+from collections import deque
+from dataclasses import dataclass
+from loguru import logger
+import math
+
+DEFAULT_PASS_THRESHOLD = 0.7
+WINDOW_MODES = ("sliding", "tumbling")
+M2_EPSILON = 1e-12
+
+
+class RunningStats:
+    """人間スコア・Judgeスコアの平均・分散・共分散と合否の混同行列を逐次更新する
+
+    update/removeはO(1)で、別の区間の統計とmerge()で結合できる。
+    """
+    def __init__(self, pass_threshold=DEFAULT_PASS_THRESHOLD):
+        self.pass_threshold = pass_threshold
+        self.n = 0
+        self.human_mean = 0.0
+        self.judge_mean = 0.0
+        self._human_m2 = 0.0
+        self._judge_m2 = 0.0
+        self._co_moment = 0.0
+        # (人間の合否, Judgeの合否) ごとの件数
+        self.confusion = {(True, True): 0, (True, False): 0, (False, True): 0, (False, False): 0}
+
+    def _pass_pair(self, human_score, judge_score):
+        return human_score >= self.pass_threshold, judge_score >= self.pass_threshold
+
+    def update(self, human_score, judge_score):
+        self.n += 1
+        human_delta = human_score - self.human_mean
+        self.human_mean += human_delta / self.n
+        judge_delta = judge_score - self.judge_mean
+        self.judge_mean += judge_delta / self.n
+        self._human_m2 += human_delta * (human_score - self.human_mean)
+        self._judge_m2 += judge_delta * (judge_score - self.judge_mean)
+        self._co_moment += human_delta * (judge_score - self.judge_mean)
+        self.confusion[self._pass_pair(human_score, judge_score)] += 1
+
+    def remove(self, human_score, judge_score):
+        """update()済みの1件を取り除く（スライディングウィンドウ用）"""
+        if self.n <= 1:
+            self.__init__(self.pass_threshold)
+            return
+        self.confusion[self._pass_pair(human_score, judge_score)] -= 1
+        previous_human_mean = (self.n * self.human_mean - human_score) / (self.n - 1)
+        previous_judge_mean = (self.n * self.judge_mean - judge_score) / (self.n - 1)
+        self._human_m2 -= (human_score - previous_human_mean) * (human_score - self.human_mean)
+        self._judge_m2 -= (judge_score - previous_judge_mean) * (judge_score - self.judge_mean)
+        self._co_moment -= (human_score - previous_human_mean) * (judge_score - self.judge_mean)
+        # 逆向きの更新は丸め誤差でわずかに負になりうるため、0で下げ止める
+        self._human_m2 = max(0.0, self._human_m2)
+        self._judge_m2 = max(0.0, self._judge_m2)
+        self.human_mean, self.judge_mean = previous_human_mean, previous_judge_mean
+        self.n -= 1
+
+    def merge(self, other):
+        """別区間の統計を結合した新しいRunningStatsを返す"""
+        merged = RunningStats(self.pass_threshold)
+        merged.n = self.n + other.n
+        if merged.n == 0:
+            return merged
+        human_delta = other.human_mean - self.human_mean
+        judge_delta = other.judge_mean - self.judge_mean
+        weight = self.n * other.n / merged.n
+        merged.human_mean = self.human_mean + human_delta * other.n / merged.n
+        merged.judge_mean = self.judge_mean + judge_delta * other.n / merged.n
+        merged._human_m2 = self._human_m2 + other._human_m2 + human_delta ** 2 * weight
+        merged._judge_m2 = self._judge_m2 + other._judge_m2 + judge_delta ** 2 * weight
+        merged._co_moment = self._co_moment + other._co_moment + human_delta * judge_delta * weight
+        merged.confusion = {key: self.confusion[key] + other.confusion[key] for key in self.confusion}
+        return merged
+
+    @property
+    def correlation(self):
+        """ピアソン相関（どちらかのスコアが一定なら定義できないためNaN）"""
+        # 丸め誤差で残った極小の分散は0とみなす（0〜1のスコアでは意味のある分散よりはるかに小さい）
+        floor = M2_EPSILON * self.n
+        if self._human_m2 <= floor or self._judge_m2 <= floor:
+            return float("nan")
+        product = self._human_m2 * self._judge_m2
+        return max(-1.0, min(1.0, self._co_moment / math.sqrt(product)))
+
+    @property
+    def agreement_rate(self):
+        agreed = self.confusion[(True, True)] + self.confusion[(False, False)]
+        return agreed / self.n if self.n else float("nan")
+
+    def to_dict(self):
+        """09番スクリプトのevaluate_judge_performanceと同じキーで返す"""
+        return {
+            "correlation": self.correlation,
+            "agreement_rate": self.agreement_rate,
+            "human_mean": self.human_mean,
+            "judge_mean": self.judge_mean
+        }
+
+
+@dataclass
+class DriftAlert:
+    metric: str       # "correlation" または "agreement_rate"
+    baseline: float
+    current: float
+    observed: int     # 検知時点までの累計件数
+
+
+class JudgeMonitor:
+    """ウィンドウ内の一致度をベースラインと比較し、一定以上下がったらDriftAlertを返す
+
+    - sliding: 直近window_size件を常に評価（1件ごとに最古の1件を取り除く）
+    - tumbling: window_size件ごとに区切って評価し、ウィンドウをリセット
+    baselineを省略した場合は、最初に埋まったウィンドウの統計をベースラインにする。
+    """
+    def __init__(self, window_size=1000, mode="sliding", baseline=None, correlation_drop=0.1,
+                 agreement_drop=0.1, pass_threshold=DEFAULT_PASS_THRESHOLD, on_alert=None):
+        if mode not in WINDOW_MODES:
+            raise ValueError(f"modeは{WINDOW_MODES}のいずれかを指定してください: {mode}")
+        self.window_size = window_size
+        self.mode = mode
+        self.baseline = baseline
+        self.correlation_drop = correlation_drop
+        self.agreement_drop = agreement_drop
+        self.pass_threshold = pass_threshold
+        self.on_alert = on_alert
+        self.total = RunningStats(pass_threshold)
+        self.window = RunningStats(pass_threshold)
+        self._pairs = deque()
+        self._removed = 0
+        self._drifting = set()
+
+    def update(self, human_score, judge_score):
+        """1件追加し、新たに検知したドリフトのリストを返す（無ければ空リスト）"""
+        self.total.update(human_score, judge_score)
+        self.window.update(human_score, judge_score)
+        if self.mode == "sliding":
+            self._pairs.append((human_score, judge_score))
+            if len(self._pairs) > self.window_size:
+                self.window.remove(*self._pairs.popleft())
+                self._removed += 1
+                # remove()の丸め誤差が積もらないよう、window_size件ごとにウィンドウから再計算する
+                if self._removed % self.window_size == 0:
+                    self.window = self._recompute_window()
+        if self.window.n < self.window_size:
+            return []
+        alerts = self._check(self.window)
+        if self.mode == "tumbling":
+            self.window = RunningStats(self.pass_threshold)
+        return alerts
+
+    def _recompute_window(self):
+        stats = RunningStats(self.pass_threshold)
+        for human_score, judge_score in self._pairs:
+            stats.update(human_score, judge_score)
+        return stats
+
+    def _check(self, stats):
+        if self.baseline is None:
+            self.baseline = stats.to_dict()
+            logger.info(f"📏 モニタリングのベースラインを設定しました: {self.baseline}")
+            return []
+        alerts = []
+        for metric, allowed_drop in (("correlation", self.correlation_drop), ("agreement_rate", self.agreement_drop)):
+            current = getattr(stats, metric)
+            drifting = self.baseline[metric] - current > allowed_drop
+            # 劣化が続いている間は重複して通知せず、回復したら再び通知対象にする
+            if drifting and metric not in self._drifting:
+                alert = DriftAlert(metric, self.baseline[metric], current, self.total.n)
+                logger.warning(f"🚨 Judgeの{metric}が低下しました: {alert.baseline:.3f} → {alert.current:.3f}")
+                if self.on_alert:
+                    self.on_alert(alert)
+                alerts.append(alert)
+                self._drifting.add(metric)
+            elif not drifting:
+                self._drifting.discard(metric)
+        return alerts
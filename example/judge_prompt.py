@@ -0,0 +1,107 @@
+"""複数のJudge・テストケースをまとめて評価するためのプロンプト組み立てとJSON解析"""
+import json
+import re
+
+# GEvalと同じく0〜10で採点させ、0〜1に正規化する
+SCORE_SCALE = 10
+
+PARAM_LABELS = {
+    "input": "Input",
+    "actual_output": "Actual Output",
+    "expected_output": "Expected Output",
+    "context": "Context",
+    "retrieval_context": "Retrieval Context"
+}
+
+_CODE_FENCE = re.compile(r"```(?:json)?\s*(.*?)```", re.DOTALL)
+
+
+def param_name(param):
+    """LLMTestCaseParamsを属性名（"input" など）に変換"""
+    return getattr(param, "value", param)
+
+
+def format_test_case(test_case, params):
+    """指定パラメータのみを「ラベル: 値」形式で並べる"""
+    lines = []
+    for name in params:
+        value = getattr(test_case, name, None)
+        if isinstance(value, list):
+            value = "\n".join(f"- {item}" for item in value)
+        lines.append(f"{PARAM_LABELS.get(name, name)}:\n{value if value else '(なし)'}")
+    return "\n\n".join(lines)
+
+
+def format_judge(judge):
+    """Judgeの評価基準・評価手順・参照フィールドをプロンプト用に整形"""
+    lines = [f"## {judge.name}"]
+    if getattr(judge, "criteria", None):
+        lines.append(f"評価基準: {judge.criteria.strip()}")
+    if getattr(judge, "evaluation_steps", None):
+        lines.append("評価手順:")
+        lines.extend(f"{i}. {step}" for i, step in enumerate(judge.evaluation_steps, 1))
+    params = [PARAM_LABELS.get(param_name(p), param_name(p)) for p in (judge.evaluation_params or [])]
+    if params:
+        lines.append(f"参照するフィールド: {', '.join(params)}")
+    if getattr(judge, "strict_mode", False):
+        lines.append(f"厳格モード: 基準を完全に満たす場合は{SCORE_SCALE}、それ以外は0のどちらかで採点")
+    return "\n".join(lines)
+
+
+def extract_json(text):
+    """LLM出力からJSONを取り出す（コードブロックや前後の説明文は無視）"""
+    fenced = _CODE_FENCE.search(text)
+    if fenced:
+        text = fenced.group(1)
+    starts = [i for i in (text.find("{"), text.find("[")) if i >= 0]
+    if not starts:
+        raise ValueError("JSONが見つかりません")
+    start = min(starts)
+    end = max(text.rfind("}"), text.rfind("]"))
+    return json.loads(text[start:end + 1])
+
+
+def normalize_score(raw_score):
+    """0〜10のスコアを0〜1に変換（範囲外・数値でない場合はValueError）"""
+    score = float(raw_score)
+    if not 0 <= score <= SCORE_SCALE:
+        raise ValueError(f"スコアが範囲外です: {raw_score}")
+    return score / SCORE_SCALE
+
+
+def generate_text(model, prompt):
+    """DeepEvalBaseLLMで生成（(テキスト, コスト) を返すモデルにも対応）"""
+    result = model.generate(prompt)
+    return result[0] if isinstance(result, tuple) else result
+
+
+async def a_generate_text(model, prompt):
+    result = await model.a_generate(prompt)
+    return result[0] if isinstance(result, tuple) else result
+
+
+def strict_score(metric, score):
+    """strict_modeのJudgeはGEvalと同じく合格なら1、不合格なら0の2値にする"""
+    if getattr(metric, "strict_mode", False):
+        return 1.0 if score >= metric.threshold else 0.0
+    return score
+
+
+def copy_judge_definition(metric, judge, judging_mode=None):
+    """ラッパーメトリックに元のGEvalの名前・閾値・評価基準などを引き継ぐ
+
+    judging_modeには採点方式（"fused" / "batched" と、まとめて採点する相手など）を渡し、
+    元のGEvalや別の方式で採点した結果と指紋が一致しないようにする。
+    """
+    metric.name = judge.name
+    metric.threshold = judge.threshold
+    # インクリメンタル評価の指紋用に定義も引き継ぎ、採点方式で区別する
+    metric.judging_mode = judging_mode
+    metric.criteria = getattr(judge, "criteria", None)
+    metric.evaluation_steps = getattr(judge, "evaluation_steps", None)
+    metric.evaluation_params = judge.evaluation_params
+    metric.model = judge.model
+    metric.strict_mode = getattr(judge, "strict_mode", False)
+    metric.evaluation_model = getattr(judge, "evaluation_model", None)
+    metric.async_mode = True
+    metric.include_reason = True
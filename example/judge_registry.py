@@ -0,0 +1,103 @@
+"""Judge設定を正規化ハッシュで管理し、同一設定のGEvalと生成済み評価手順を共有するレジストリ"""
+from deepeval.metrics import GEval
+from loguru import logger
+import hashlib
+import json
+import os
+import tempfile
+import threading
+
+DEFAULT_STEPS_CACHE_PATH = "judge_steps_cache.json"
+DEFAULT_MODEL = "gpt-4o-mini"
+
+
+def normalize_config(config):
+    """空白や型の揺れを吸収したJudge設定を返す（ハッシュ計算用）"""
+    model = config.get("model", DEFAULT_MODEL)
+    return {
+        "name": config["name"].strip(),
+        "criteria": (config.get("criteria") or "").strip(),
+        "steps": [step.strip() for step in config.get("steps") or []],
+        "params": [getattr(param, "value", param) for param in config["params"]],
+        "threshold": float(config["threshold"]),
+        "model": model if isinstance(model, str) else model.get_model_name()
+    }
+
+
+def config_key(config):
+    canonical = json.dumps(normalize_config(config), ensure_ascii=False, sort_keys=True)
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+class JudgeRegistry:
+    """プロセス内で同一設定のJudgeを1インスタンスに集約し、評価手順をディスクにキャッシュする"""
+    def __init__(self, steps_cache_path=DEFAULT_STEPS_CACHE_PATH):
+        self.steps_cache_path = steps_cache_path
+        self._judges = {}
+        self._lock = threading.Lock()
+        self._steps = self._load_steps()
+
+    def _load_steps(self):
+        if not os.path.exists(self.steps_cache_path):
+            return {}
+        try:
+            with open(self.steps_cache_path, encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError) as e:
+            logger.warning(f"⚠️ 評価手順キャッシュを読み込めません: {e}")
+            return {}
+
+    def get_or_create(self, config):
+        """設定に対応するGEvalを返す（同じ設定なら同じインスタンス）"""
+        key = config_key(config)
+        with self._lock:
+            judge = self._judges.get(key)
+            if judge is not None:
+                logger.debug(f"♻️ Judge {config['name']} を再利用します")
+                return judge
+            judge = GEval(
+                name=config["name"],
+                criteria=config["criteria"],
+                evaluation_steps=config.get("steps") or self._steps.get(key),
+                evaluation_params=config["params"],
+                threshold=config["threshold"],
+                model=config.get("model", DEFAULT_MODEL)
+            )
+            if not judge.evaluation_steps:
+                # evaluate()はメトリックを複製して使うため、評価前にここで一度だけ生成して保存する
+                self._generate_steps(key, judge)
+            self._judges[key] = judge
+            return judge
+
+    def _generate_steps(self, key, judge):
+        logger.info(f"🧠 Judge {judge.name} の評価手順を生成します（初回のみ）")
+        try:
+            steps = judge._generate_evaluation_steps()
+        except TypeError:
+            # マルチモーダル対応版のdeepevalでは引数が必要
+            steps = judge._generate_evaluation_steps(False)
+        judge.evaluation_steps = steps
+        self._steps[key] = list(steps)
+        self._save_steps()
+
+    def _save_steps(self):
+        # 他プロセスが書き込んだ分を取り込んでから、一時ファイル経由で置き換える
+        self._steps = {**self._load_steps(), **self._steps}
+        directory = os.path.dirname(os.path.abspath(self.steps_cache_path))
+        fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump(self._steps, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, self.steps_cache_path)
+
+
+_default_registry = None
+_default_registry_lock = threading.Lock()
+
+
+def get_default_registry():
+    """プロセス全体で共有するレジストリを返す"""
+    global _default_registry
+    with _default_registry_lock:
+        if _default_registry is None:
+            _default_registry = JudgeRegistry(os.environ.get("JUDGE_STEPS_CACHE_PATH", DEFAULT_STEPS_CACHE_PATH))
+        return _default_registry
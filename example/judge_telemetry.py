@@ -0,0 +1,188 @@
+"""Judge呼び出しごとのレイテンシ・待ち時間・トークン数・リトライ・コストを集計するテレメトリ"""
+from bisect import bisect_left
+from loguru import logger
+import json
+import threading
+
+# 秒単位のヒストグラム境界（Prometheusのデフォルトに長めの区間を追加）
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+# 100万トークンあたりのUSD単価 (入力, 出力)。未登録のモデルはコスト0として扱う
+DEFAULT_PRICES = {
+    "gpt-4o-mini": (0.15, 0.60),
+    "gpt-4o": (2.50, 10.00),
+    "gpt-4.1-mini": (0.40, 1.60),
+    "gpt-4.1": (2.00, 8.00)
+}
+
+
+class Histogram:
+    """累積バケット形式で出力できる固定境界のヒストグラム"""
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def cumulative(self):
+        """(上限, 累積件数) のリスト（最後は +Inf）"""
+        total = 0
+        result = []
+        for bound, count in zip(self.buckets + (float("inf"),), self.counts):
+            total += count
+            result.append((bound, total))
+        return result
+
+    def to_dict(self):
+        return {
+            "buckets": {("+Inf" if bound == float("inf") else bound): count for bound, count in self.cumulative()},
+            "sum": self.sum,
+            "count": self.count
+        }
+
+
+class _Series:
+    def __init__(self):
+        self.latency = Histogram()
+        self.queue_wait = Histogram()
+        self.requests = 0
+        self.errors = 0
+        self.cache_hits = 0
+        self.coalesced = 0
+        self.early_stops = 0
+        self.retries = 0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.cost = 0.0
+
+
+class JudgeTelemetry:
+    """(Judge名, モデル名) ごとに呼び出し統計を集計する"""
+    def __init__(self, prices=None):
+        self.prices = {**DEFAULT_PRICES, **(prices or {})}
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def _get_series(self, judge, model):
+        key = (judge, model)
+        if key not in self._series:
+            self._series[key] = _Series()
+        return self._series[key]
+
+    def cost(self, model, prompt_tokens, completion_tokens):
+        input_price, output_price = self.prices.get(model, (0.0, 0.0))
+        return (prompt_tokens * input_price + completion_tokens * output_price) / 1_000_000
+
+    def record(self, judge, model, wall_time, queue_wait=0.0, prompt_tokens=0, completion_tokens=0,
+               retries=0, error=False, early_stop=False):
+        """1回のLLM呼び出し（リトライを含む）を記録する"""
+        with self._lock:
+            series = self._get_series(judge, model)
+            series.requests += 1
+            series.errors += int(error)
+            series.early_stops += int(early_stop)
+            series.retries += retries
+            series.latency.observe(wall_time)
+            series.queue_wait.observe(queue_wait)
+            series.prompt_tokens += prompt_tokens
+            series.completion_tokens += completion_tokens
+            series.cost += self.cost(model, prompt_tokens, completion_tokens)
+
+    def record_cache_hit(self, judge, model):
+        with self._lock:
+            self._get_series(judge, model).cache_hits += 1
+
+    def record_coalesced(self, judge, model):
+        with self._lock:
+            self._get_series(judge, model).coalesced += 1
+
+    def snapshot(self):
+        """Judge・モデルごとの集計値を辞書で返す"""
+        with self._lock:
+            return [
+                {
+                    "judge": judge,
+                    "model": model,
+                    "requests": series.requests,
+                    "errors": series.errors,
+                    "cache_hits": series.cache_hits,
+                    "coalesced": series.coalesced,
+                    "early_stops": series.early_stops,
+                    "retries": series.retries,
+                    "prompt_tokens": series.prompt_tokens,
+                    "completion_tokens": series.completion_tokens,
+                    "cost_usd": series.cost,
+                    "latency_seconds": series.latency.to_dict(),
+                    "queue_wait_seconds": series.queue_wait.to_dict()
+                }
+                for (judge, model), series in sorted(self._series.items())
+            ]
+
+    def prometheus_text(self):
+        """Prometheusのテキスト形式で出力する"""
+        counters = [
+            ("judge_llm_requests_total", "LLM呼び出し回数", lambda s: s.requests),
+            ("judge_llm_errors_total", "失敗したLLM呼び出し回数", lambda s: s.errors),
+            ("judge_llm_cache_hits_total", "キャッシュから返した回数", lambda s: s.cache_hits),
+            ("judge_llm_coalesced_total", "実行中の同一リクエストの結果を共有した回数", lambda s: s.coalesced),
+            ("judge_llm_stream_early_stops_total", "評価JSONの受信後にストリーミングを打ち切った回数", lambda s: s.early_stops),
+            ("judge_llm_retries_total", "リトライ回数", lambda s: s.retries),
+            ("judge_llm_prompt_tokens_total", "プロンプトトークン数", lambda s: s.prompt_tokens),
+            ("judge_llm_completion_tokens_total", "生成トークン数", lambda s: s.completion_tokens),
+            ("judge_llm_cost_usd_total", "推定コスト（USD）", lambda s: s.cost)
+        ]
+        histograms = [
+            ("judge_llm_request_duration_seconds", "LLM呼び出しの所要時間（リトライ・待ちを含む）", lambda s: s.latency),
+            ("judge_llm_queue_wait_seconds", "レート制限による待ち時間", lambda s: s.queue_wait)
+        ]
+        with self._lock:
+            series_items = sorted(self._series.items())
+            lines = []
+            for name, help_text, value in counters:
+                lines += [f"# HELP {name} {help_text}", f"# TYPE {name} counter"]
+                for (judge, model), series in series_items:
+                    lines.append(f"{name}{{{_labels(judge, model)}}} {value(series)}")
+            for name, help_text, histogram in histograms:
+                lines += [f"# HELP {name} {help_text}", f"# TYPE {name} histogram"]
+                for (judge, model), series in series_items:
+                    labels = _labels(judge, model)
+                    for bound, count in histogram(series).cumulative():
+                        le = "+Inf" if bound == float("inf") else bound
+                        lines.append(f'{name}_bucket{{{labels},le="{le}"}} {count}')
+                    lines.append(f"{name}_sum{{{labels}}} {histogram(series).sum}")
+                    lines.append(f"{name}_count{{{labels}}} {histogram(series).count}")
+        return "\n".join(lines) + "\n"
+
+    def dump(self, json_path, prometheus_path=None):
+        """JSONスナップショット（とPrometheusテキスト）をファイルに書き出す"""
+        with open(json_path, "w", encoding="utf-8") as f:
+            json.dump(self.snapshot(), f, ensure_ascii=False, indent=2)
+        if prometheus_path:
+            with open(prometheus_path, "w", encoding="utf-8") as f:
+                f.write(self.prometheus_text())
+        logger.info(f"📈 Judgeテレメトリを {json_path} に保存しました")
+
+    def log_summary(self):
+        """Judgeごとの呼び出し回数・平均レイテンシ・コストをログに出す"""
+        for item in self.snapshot():
+            latency = item["latency_seconds"]
+            mean = latency["sum"] / latency["count"] if latency["count"] else 0
+            logger.info(
+                f"📈 {item['judge']} ({item['model']}): {item['requests']}回, 平均{mean:.2f}秒, "
+                f"リトライ{item['retries']}回, トークン{item['prompt_tokens'] + item['completion_tokens']}, "
+                f"${item['cost_usd']:.4f}"
+            )
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(judge, model):
+    return f'judge="{_escape(judge)}",model="{_escape(model)}"'
+
@@ -0,0 +1,156 @@
+"""Langfuseへトレース・スパン・スコアをバックグラウンドでまとめて送信するエクスポーター"""
+from datetime import datetime, timezone
+from loguru import logger
+import queue
+import random
+import threading
+import time
+import uuid
+import httpx
+
+DEFAULT_MAX_QUEUE_SIZE = 10000
+DEFAULT_BATCH_SIZE = 100
+DEFAULT_FLUSH_INTERVAL = 1.0
+
+_STOP = object()
+
+
+def _now():
+    return datetime.now(timezone.utc).isoformat()
+
+
+class LangfuseBatchExporter:
+    """上限付きキューに積んだイベントを、ワーカースレッドが /api/public/ingestion へまとめて送る"""
+    def __init__(self, host, public_key, secret_key, max_queue_size=DEFAULT_MAX_QUEUE_SIZE,
+                 batch_size=DEFAULT_BATCH_SIZE, flush_interval=DEFAULT_FLUSH_INTERVAL,
+                 max_retries=3, timeout=10.0):
+        self.url = f"{host.rstrip('/')}/api/public/ingestion"
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_retries = max_retries
+        self.sent_count = 0
+        self.failed_count = 0
+        self._client = httpx.Client(auth=(public_key, secret_key), timeout=timeout)
+        # キューが満杯になるとenqueue側がブロックする（バックプレッシャー）
+        self._queue = queue.Queue(maxsize=max_queue_size)
+        self._worker = threading.Thread(target=self._run, name="langfuse-exporter", daemon=True)
+        self._worker.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.shutdown()
+
+    def _enqueue(self, event_type, body):
+        self._queue.put({
+            "id": str(uuid.uuid4()),
+            "timestamp": _now(),
+            "type": event_type,
+            "body": body
+        })
+
+    def enqueue_trace(self, name, input=None, output=None, metadata=None):
+        """トレースを登録し、スパン・スコアの紐付けに使うtrace_idを返す"""
+        trace_id = str(uuid.uuid4())
+        self._enqueue("trace-create", {
+            "id": trace_id,
+            "name": name,
+            "timestamp": _now(),
+            "input": input,
+            "output": output,
+            "metadata": metadata
+        })
+        return trace_id
+
+    def enqueue_span(self, trace_id, name, start_time, end_time, input=None, output=None, metadata=None):
+        span_id = str(uuid.uuid4())
+        self._enqueue("span-create", {
+            "id": span_id,
+            "traceId": trace_id,
+            "name": name,
+            "startTime": start_time,
+            "endTime": end_time,
+            "input": input,
+            "output": output,
+            "metadata": metadata
+        })
+        return span_id
+
+    def enqueue_score(self, trace_id, name, value, data_type="NUMERIC", comment=None):
+        self._enqueue("score-create", {
+            "id": str(uuid.uuid4()),
+            "traceId": trace_id,
+            "name": name,
+            "value": value,
+            "dataType": data_type,
+            "comment": comment
+        })
+
+    def _next_batch(self):
+        """最初の1件を待ってから、batch_size件またはflush_interval経過まで集める"""
+        first = self._queue.get()
+        batch = [first]
+        deadline = time.monotonic() + self.flush_interval
+        while first is not _STOP and len(batch) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                event = self._queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            batch.append(event)
+            if event is _STOP:
+                break
+        return batch
+
+    def _send(self, events):
+        for attempt in range(self.max_retries + 1):
+            try:
+                response = self._client.post(self.url, json={"batch": events})
+                if response.status_code < 500 and response.status_code != 429:
+                    response.raise_for_status()
+                    self.sent_count += len(events)
+                    return
+                error = f"HTTP {response.status_code}"
+            except httpx.TransportError as e:
+                error = str(e)
+            except httpx.HTTPStatusError as e:
+                # 4xxは再送しても成功しないため破棄する
+                logger.warning(f"⚠️ Langfuseへの送信を破棄しました ({len(events)}件): {e}")
+                self.failed_count += len(events)
+                return
+            if attempt < self.max_retries:
+                time.sleep(random.uniform(0, 2 ** attempt))
+        logger.warning(f"⚠️ Langfuseへの送信に失敗しました ({len(events)}件): {error}")
+        self.failed_count += len(events)
+
+    def _run(self):
+        stopped = False
+        while not stopped:
+            batch = self._next_batch()
+            events = [event for event in batch if event is not _STOP]
+            stopped = len(events) != len(batch)
+            try:
+                if events:
+                    self._send(events)
+            except Exception as e:
+                logger.warning(f"⚠️ Langfuseエクスポーターでエラー: {e}")
+                self.failed_count += len(events)
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+
+    def flush(self):
+        """キューに積まれたイベントが全て送信（または破棄）されるまで待つ"""
+        self._queue.join()
+
+    def shutdown(self):
+        """残りのイベントを送信してからワーカーを停止する"""
+        if not self._worker.is_alive():
+            return
+        self._queue.put(_STOP)
+        self._worker.join()
+        self._client.close()
+        logger.info(f"🧹 Langfuseエクスポーター停止 - 送信: {self.sent_count}件, 失敗: {self.failed_count}件")
@@ -1,13 +1,124 @@
 from deepeval.models.base_model import DeepEvalBaseLLM
 from loguru import logger
-import requests
+import asyncio
+import atexit
+import copy
+import json
+import os
+import threading
+import time
+import httpx
+from token_counter import count_tokens
+from judge_cache import make_cache_key
+from stream_parser import JudgeJSONStream
+
+DEFAULT_POOL_SIZE = 10
+DEFAULT_TIMEOUT = 60.0
+
+# base_url・プール設定ごとに共有するHTTPクライアント（keep-aliveコネクションプール）
+_sync_clients = {}
+_async_clients = {}
+_clients_lock = threading.Lock()
+
+
+def _reset_clients_after_fork():
+    # fork後の子プロセスは親のソケットを共有しないよう、プールを持たない状態から作り直す
+    global _clients_lock
+    _clients_lock = threading.Lock()
+    _sync_clients.clear()
+    _async_clients.clear()
+
+
+os.register_at_fork(after_in_child=_reset_clients_after_fork)
+
+
+def _new_client_options(pool_size, timeout):
+    # プール枯渇時はエラーにせず空きコネクションを待つ
+    return {
+        "limits": httpx.Limits(
+            max_connections=pool_size,
+            max_keepalive_connections=pool_size
+        ),
+        "timeout": httpx.Timeout(timeout, pool=None)
+    }
+
+
+def get_sync_client(base_url, pool_size=DEFAULT_POOL_SIZE, timeout=DEFAULT_TIMEOUT):
+    """base_url・pool_size・timeoutの組み合わせ単位で共有される同期HTTPクライアントを取得
+
+    設定の異なる呼び出し元が同じプールを黙って使い回さないよう、設定もキーに含める。
+    """
+    key = (base_url, pool_size, timeout)
+    with _clients_lock:
+        client = _sync_clients.get(key)
+        if client is None or client.is_closed:
+            client = httpx.Client(**_new_client_options(pool_size, timeout))
+            _sync_clients[key] = client
+            logger.debug(f"HTTPプールを作成: {base_url} (pool_size={pool_size}, timeout={timeout})")
+        return client
+
+
+def get_async_client(base_url, pool_size=DEFAULT_POOL_SIZE, timeout=DEFAULT_TIMEOUT):
+    """base_url・プール設定・イベントループ単位で共有される非同期HTTPクライアントを取得"""
+    loop = asyncio.get_running_loop()
+    key = (base_url, pool_size, timeout, id(loop))
+    with _clients_lock:
+        entry = _async_clients.get(key)
+        if entry is None or entry[0] is not loop or entry[1].is_closed:
+            # AsyncClientは生成したイベントループに紐づくため、ループごとに持つ
+            for stale_key in [k for k, (l, _) in _async_clients.items() if l.is_closed()]:
+                del _async_clients[stale_key]
+            client = httpx.AsyncClient(**_new_client_options(pool_size, timeout))
+            _async_clients[key] = (loop, client)
+            logger.debug(f"非同期HTTPプールを作成: {base_url} (pool_size={pool_size}, timeout={timeout})")
+            return client
+        return entry[1]
+
+
+def close_http_clients():
+    """共有HTTPクライアントを全て閉じる（プロセス終了時にatexitから自動で呼ばれる）"""
+    with _clients_lock:
+        for client in _sync_clients.values():
+            client.close()
+        _sync_clients.clear()
+        for loop, client in _async_clients.values():
+            # 既に閉じたループのクライアントはコネクションごと破棄される
+            if not loop.is_closed() and not loop.is_running():
+                loop.run_until_complete(client.aclose())
+        _async_clients.clear()
+
+
+atexit.register(close_http_clients)
+
 
 class LiteLLMModel(DeepEvalBaseLLM):
-    def __init__(self, model_name, base_url, api_key):
+    def __init__(self, model_name, base_url, api_key, pool_size=DEFAULT_POOL_SIZE, timeout=DEFAULT_TIMEOUT, scheduler=None, cache=None,
+                 telemetry=None, judge_name=None, single_flight=None, stream=False, max_reason_chars=None):
         self.model_name = model_name
         self.base_url = base_url.rstrip('/')
         self.api_key = api_key
-    
+        # 同じbase_urlを指す全てのモデル（=全GEvalメトリック）でプールを共有する
+        self.pool_size = pool_size
+        self.timeout = timeout
+        # RateLimitSchedulerを渡すとRPM/TPM制御と429リトライが有効になる
+        self.scheduler = scheduler
+        # JudgeResponseCacheを渡すと同一リクエストはネットワークに出ずキャッシュから返す
+        self.cache = cache
+        # JudgeTelemetryを渡すと呼び出しごとの所要時間・トークン数・コストをjudge_name単位で集計する
+        self.telemetry = telemetry
+        self.judge_name = judge_name
+        # SingleFlightを渡すと、実行中の同一リクエストは新たに送信せずその結果を共有する
+        self.single_flight = single_flight
+        # stream=Trueでは評価JSONが閉じた時点で受信を打ち切る（max_reason_charsでreasonの長さも制限）
+        self.stream = stream
+        self.max_reason_chars = max_reason_chars
+
+    def with_judge(self, judge_name):
+        """テレメトリ用のJudge名だけを変えた複製を返す（HTTPプール・キャッシュ・スケジューラは共有）"""
+        model = copy.copy(self)
+        model.judge_name = judge_name
+        return model
+
     def load_model(self):
         # LiteLLMは外部APIなので、ここでは設定を返すだけ
         return {
@@ -15,36 +126,234 @@ class LiteLLMModel(DeepEvalBaseLLM):
             "base_url": self.base_url,
             "api_key": self.api_key
         }
-    
-    def generate(self, prompt: str) -> str:
+
+    def _build_request(self, prompt):
         config = self.load_model()
-        
+
         # OpenAI互換APIでLiteLLMにリクエスト
         url = f"{config['base_url']}/chat/completions"
         headers = {
             "Authorization": f"Bearer {config['api_key']}",
             "Content-Type": "application/json"
         }
-        
+
         data = {
             "model": config["model"],
             "messages": [{"role": "user", "content": prompt}],
             "temperature": 0.1,
             "max_tokens": 2000
         }
-        
+        return url, headers, data
+
+    def _estimate_tokens(self, data):
+        # TPMはプロンプト + max_tokens で予約し、レスポンスのusageで精算する
+        return count_tokens(data["messages"][0]["content"], self.model_name) + data["max_tokens"]
+
+    def _post(self, client, url, headers, data):
+        if not self.stream:
+            return client.post(url, headers=headers, json=data)
+        return client.send(client.build_request("POST", url, headers=headers, json=self._stream_payload(data)), stream=True)
+
+    async def _a_post(self, client, url, headers, data):
+        if not self.stream:
+            return await client.post(url, headers=headers, json=data)
+        return await client.send(client.build_request("POST", url, headers=headers, json=self._stream_payload(data)), stream=True)
+
+    @staticmethod
+    def _stream_payload(data):
+        # キャッシュキーが変わらないよう、ストリーミングの指定は送信時にだけ付ける
+        return {**data, "stream": True, "stream_options": {"include_usage": True}}
+
+    def _send(self, client, url, headers, data, stats=None):
+        if self.scheduler is None:
+            return self._read(self._post(client, url, headers, data), data)
+        estimated = self._estimate_tokens(data)
+        # 読み取りもスケジューラ内で行い、途中で切れたストリームは再送させる（失敗時の予約はスケジューラが戻す）
+        result = self.scheduler.call(
+            self.model_name, estimated,
+            lambda: self._post(client, url, headers, data),
+            stats=stats,
+            read=lambda response: self._read(response, data)
+        )
+        self.scheduler.reconcile(self.model_name, estimated, result.get("usage"))
+        return result
+
+    async def _a_send(self, client, url, headers, data, stats=None):
+        if self.scheduler is None:
+            return await self._a_read(await self._a_post(client, url, headers, data), data)
+        estimated = self._estimate_tokens(data)
+        result = await self.scheduler.a_call(
+            self.model_name, estimated,
+            lambda: self._a_post(client, url, headers, data),
+            stats=stats,
+            read=lambda response: self._a_read(response, data)
+        )
+        self.scheduler.reconcile(self.model_name, estimated, result.get("usage"))
+        return result
+
+    def _read(self, response, data):
+        if not self.stream:
+            response.raise_for_status()
+            return response.json()
+        parser, state = JudgeJSONStream(self.max_reason_chars), {"usage": None, "received": [], "done": False}
+        try:
+            response.raise_for_status()
+            for line in response.iter_lines():
+                if self._on_event(line, parser, state):
+                    break
+        finally:
+            # 評価JSONがそろった時点で接続を閉じ、サーバー側の生成も打ち切らせる
+            response.close()
+        return self._stream_result(parser, state, data)
+
+    async def _a_read(self, response, data):
+        if not self.stream:
+            response.raise_for_status()
+            return response.json()
+        parser, state = JudgeJSONStream(self.max_reason_chars), {"usage": None, "received": [], "done": False}
         try:
-            response = requests.post(url, headers=headers, json=data)
             response.raise_for_status()
-            result = response.json()
-            return result["choices"][0]["message"]["content"]
+            async for line in response.aiter_lines():
+                if self._on_event(line, parser, state):
+                    break
+        finally:
+            await response.aclose()
+        return self._stream_result(parser, state, data)
+
+    @staticmethod
+    def _on_event(line, parser, state):
+        """SSEの1行を処理し、これ以上読む必要がなければTrueを返す"""
+        if not line.startswith("data:"):
+            return False
+        payload = line[5:].strip()
+        if payload == "[DONE]":
+            state["done"] = True
+            return True
+        chunk = json.loads(payload)
+        if chunk.get("usage"):
+            state["usage"] = chunk["usage"]
+        for choice in chunk.get("choices") or []:
+            content = (choice.get("delta") or {}).get("content")
+            if content:
+                state["received"].append(content)
+                if parser.feed(content):
+                    return True
+        return False
+
+    def _stream_result(self, parser, state, data):
+        """ストリーミングの受信結果を通常のレスポンスと同じ形にする"""
+        if not state["done"] and not parser.complete:
+            # [DONE]も評価JSONの完了も無いまま切れた応答は不完全なため、通信エラーとして再試行させる（キャッシュもしない）
+            raise httpx.RemoteProtocolError(f"ストリーミング応答が途中で終了しました（{parser.consumed}文字受信）")
+        early_stop = not state["done"] and parser.complete
+        usage = state["usage"]
+        if usage is None:
+            # 途中で打ち切るとusageが届かないため、受信した分から見積もる
+            prompt_tokens = count_tokens(data["messages"][0]["content"], self.model_name)
+            completion_tokens = count_tokens("".join(state["received"]), self.model_name)
+            usage = {
+                "prompt_tokens": prompt_tokens,
+                "completion_tokens": completion_tokens,
+                "total_tokens": prompt_tokens + completion_tokens
+            }
+        if early_stop or parser.truncated:
+            logger.debug(
+                f"✂️ ストリーミング受信: {parser.consumed}文字で終了"
+                f"（打ち切り: {early_stop}, reason切り詰め: {parser.truncated}）"
+            )
+        return {"choices": [{"message": {"content": parser.text}}], "usage": usage, "early_stop": early_stop}
+
+    def _cache_payload(self, data):
+        # reasonを切り詰めた応答は、上限ごとに別のキャッシュ・シングルフライトのキーにする
+        if self.stream and self.max_reason_chars is not None:
+            return {**data, "max_reason_chars": self.max_reason_chars}
+        return data
+
+    def _cached(self, data):
+        if self.cache is None:
+            return None
+        cached = self.cache.get(self._cache_payload(data))
+        if cached is not None and self.telemetry is not None:
+            self.telemetry.record_cache_hit(self.judge_name or "unknown", self.model_name)
+        return cached
+
+    def _record_coalesced(self, shared):
+        if shared and self.telemetry is not None:
+            self.telemetry.record_coalesced(self.judge_name or "unknown", self.model_name)
+
+    def generate(self, prompt: str) -> str:
+        url, headers, data = self._build_request(prompt)
+        cached = self._cached(data)
+        if cached is not None:
+            return cached
+        if self.single_flight is None:
+            return self._fetch(url, headers, data)
+        content, shared = self.single_flight.do(make_cache_key(self._cache_payload(data)), lambda: self._fetch(url, headers, data))
+        self._record_coalesced(shared)
+        return content
+
+    async def a_generate(self, prompt: str) -> str:
+        url, headers, data = self._build_request(prompt)
+        cached = self._cached(data)
+        if cached is not None:
+            return cached
+        if self.single_flight is None:
+            return await self._a_fetch(url, headers, data)
+        content, shared = await self.single_flight.a_do(make_cache_key(self._cache_payload(data)), lambda: self._a_fetch(url, headers, data))
+        self._record_coalesced(shared)
+        return content
+
+    def _fetch(self, url, headers, data):
+        client = get_sync_client(self.base_url, self.pool_size, self.timeout)
+
+        stats = {"queue_wait": 0.0, "retries": 0}
+        started = time.perf_counter()
+        try:
+            result = self._send(client, url, headers, data, stats)
+            content = result["choices"][0]["message"]["content"]
         except Exception as e:
             logger.error(f"LiteLLM API error: {e}")
+            self._record(started, stats, error=True)
             raise
-    
-    async def a_generate(self, prompt: str) -> str:
-        # 同期版を再利用（簡単な実装）
-        return self.generate(prompt)
-    
+        self._record(started, stats, result.get("usage"), early_stop=result.get("early_stop", False))
+        # シングルフライトの完了より先にキャッシュへ入れ、後続の同一リクエストはキャッシュから返す
+        if self.cache is not None:
+            self.cache.put(self._cache_payload(data), content)
+        return content
+
+    async def _a_fetch(self, url, headers, data):
+        # イベントループをブロックしないよう非同期クライアントで送信する
+        client = get_async_client(self.base_url, self.pool_size, self.timeout)
+
+        stats = {"queue_wait": 0.0, "retries": 0}
+        started = time.perf_counter()
+        try:
+            result = await self._a_send(client, url, headers, data, stats)
+            content = result["choices"][0]["message"]["content"]
+        except Exception as e:
+            logger.error(f"LiteLLM API error: {e}")
+            self._record(started, stats, error=True)
+            raise
+        self._record(started, stats, result.get("usage"), early_stop=result.get("early_stop", False))
+        if self.cache is not None:
+            self.cache.put(self._cache_payload(data), content)
+        return content
+
+    def _record(self, started, stats, usage=None, error=False, early_stop=False):
+        if self.telemetry is None:
+            return
+        usage = usage or {}
+        self.telemetry.record(
+            judge=self.judge_name or "unknown",
+            model=self.model_name,
+            wall_time=time.perf_counter() - started,
+            queue_wait=stats["queue_wait"],
+            prompt_tokens=usage.get("prompt_tokens") or 0,
+            completion_tokens=usage.get("completion_tokens") or 0,
+            retries=stats["retries"],
+            error=error,
+            early_stop=early_stop
+        )
+
     def get_model_name(self):
-        return f"LiteLLM-{self.model_name}"
\ No newline at end of file
+        return f"LiteLLM-{self.model_name}"
@@ -0,0 +1,259 @@
+"""ベンチマーク用のOpenAI互換 /chat/completions モックサーバー（GEval形式の定型レスポンスを返す）"""
+from dataclasses import dataclass
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from loguru import logger
+import argparse
+import json
+import random
+import re
+import threading
+import time
+import uuid
+
+LATENCY_DISTRIBUTIONS = ("fixed", "uniform", "lognormal")
+
+_HEADING = re.compile(r"^## (.+)$", re.MULTILINE)
+
+
+@dataclass
+class MockServerConfig:
+    latency_ms: float = 200.0          # レイテンシの中央値（fixedなら固定値）
+    latency_distribution: str = "lognormal"
+    latency_sigma: float = 0.5         # lognormalのσ / uniformなら ±latency_ms*sigma
+    error_rate: float = 0.0            # HTTP 500を返す割合
+    rate_limit_rate: float = 0.0       # HTTP 429を返す割合
+    retry_after: float = 1.0           # 429のRetry-Afterヘッダー（秒）
+    reason_chars: int = 0              # reasonをこの文字数まで水増しする（長い評価理由の再現）
+    trailing_chars: int = 0            # JSONの後ろに付ける補足説明の文字数
+    stream_chunk_chars: int = 8        # stream: true のとき1イベントに入れる文字数
+    stream_chunk_ms: float = 5.0       # stream: true のときイベント間の間隔
+    seed: int = None
+
+
+def _section(prompt, title):
+    """「# 見出し」から次の「# 」までの本文を返す"""
+    start = prompt.find(f"# {title}")
+    if start < 0:
+        return ""
+    body = prompt[start + len(title) + 2:]
+    end = body.find("\n# ")
+    return body if end < 0 else body[:end]
+
+
+class MockJudgeServer:
+    """別スレッドで動くモックサーバー（with文で起動・停止）"""
+    def __init__(self, config=None, host="127.0.0.1", port=0):
+        self.config = config or MockServerConfig()
+        if self.config.latency_distribution not in LATENCY_DISTRIBUTIONS:
+            raise ValueError(f"latency_distributionは{LATENCY_DISTRIBUTIONS}のいずれかを指定してください")
+        self.request_count = 0
+        self.error_count = 0
+        self.rate_limited_count = 0
+        self.cancelled_streams = 0
+        self._random = random.Random(self.config.seed)
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer((host, port), self._handler_class())
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def base_url(self):
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def start(self):
+        """別スレッドで起動する"""
+        self._thread = threading.Thread(target=self.serve_forever, name="mock-judge-server", daemon=True)
+        self._thread.start()
+
+    def serve_forever(self):
+        """現在のスレッドで起動する（stop()されるまで戻らない）"""
+        logger.info(f"🧪 モックJudgeサーバーを起動しました: {self.base_url}")
+        self._server.serve_forever()
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+        if self._thread is not None:
+            self._thread.join()
+
+    def _latency(self):
+        config = self.config
+        with self._lock:
+            if config.latency_distribution == "fixed":
+                latency = config.latency_ms
+            elif config.latency_distribution == "uniform":
+                spread = config.latency_ms * config.latency_sigma
+                latency = self._random.uniform(config.latency_ms - spread, config.latency_ms + spread)
+            else:
+                latency = self._random.lognormvariate(0, config.latency_sigma) * config.latency_ms
+        return max(latency, 0) / 1000
+
+    def _outcome(self):
+        """このリクエストで返すステータスコードを決める"""
+        with self._lock:
+            self.request_count += 1
+            roll = self._random.random()
+            if roll < self.config.rate_limit_rate:
+                self.rate_limited_count += 1
+                return 429
+            if roll < self.config.rate_limit_rate + self.config.error_rate:
+                self.error_count += 1
+                return 500
+            return 200
+
+    def _score(self):
+        with self._lock:
+            return self._random.randint(0, 10)
+
+    def completion_text(self, prompt):
+        """レスポンス本文（JSONと、設定されていればその後ろの補足説明）"""
+        body = self.respond(prompt)
+        if self.config.reason_chars and "reason" in body:
+            body["reason"] = (body["reason"] + "。詳細な評価理由" * self.config.reason_chars)[:self.config.reason_chars]
+        content = json.dumps(body, ensure_ascii=False)
+        if self.config.trailing_chars:
+            content += "\n\n補足: " + ("この評価は回答の正確性と網羅性に基づいています。" * self.config.trailing_chars)[:self.config.trailing_chars]
+        return content
+
+    def respond(self, prompt):
+        """プロンプトの種類（評価手順生成・単体採点・複数観点・複数ケース）に応じた定型JSONを返す"""
+        if '"id": "<番号>"' in prompt:
+            items = _HEADING.findall(_section(prompt, "テストケース"))
+            return {"results": [{"id": item, "score": self._score(), "reason": "モック評価です"} for item in items]}
+        if '"name": "<評価観点名>"' in prompt:
+            names = _HEADING.findall(_section(prompt, "評価観点"))
+            return {"results": [{"name": name, "score": self._score(), "reason": "モック評価です"} for name in names]}
+        if '"steps"' in prompt:
+            return {"steps": ["質問を理解する", "回答を確認する", "基準に照らして採点する"]}
+        return {"score": self._score(), "reason": "モック評価です"}
+
+    def _handler_class(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, format, *args):
+                # リクエストごとのアクセスログは出さない
+                pass
+
+            def _reply(self, status, body, headers=None):
+                payload = json.dumps(body, ensure_ascii=False).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(payload)))
+                for name, value in (headers or {}).items():
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def _stream(self, request, content, usage):
+                """SSE（text/event-stream）で少しずつ送る。クライアントが切断したら生成を打ち切る"""
+                self.send_response(200)
+                self.send_header("Content-Type", "text/event-stream")
+                self.send_header("Connection", "close")
+                self.end_headers()
+                self.close_connection = True
+                completion_id = f"chatcmpl-{uuid.uuid4().hex}"
+                size = server.config.stream_chunk_chars
+
+                def event(delta=None, finish_reason=None, usage=None):
+                    chunk = {
+                        "id": completion_id,
+                        "object": "chat.completion.chunk",
+                        "created": int(time.time()),
+                        "model": request.get("model", "mock"),
+                        "choices": [] if usage else [{"index": 0, "delta": delta or {}, "finish_reason": finish_reason}]
+                    }
+                    if usage:
+                        chunk["usage"] = usage
+                    return f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n".encode("utf-8")
+
+                try:
+                    for start in range(0, len(content), size):
+                        self.wfile.write(event({"content": content[start:start + size]}))
+                        self.wfile.flush()
+                        time.sleep(server.config.stream_chunk_ms / 1000)
+                    self.wfile.write(event(finish_reason="stop"))
+                    if usage:
+                        self.wfile.write(event(usage=usage))
+                    self.wfile.write(b"data: [DONE]\n\n")
+                    self.wfile.flush()
+                except (BrokenPipeError, ConnectionResetError):
+                    with server._lock:
+                        server.cancelled_streams += 1
+
+            def do_POST(self):
+                request = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+                if not self.path.rstrip("/").endswith("/chat/completions"):
+                    self._reply(404, {"error": {"message": f"not found: {self.path}"}})
+                    return
+                time.sleep(server._latency())
+                status = server._outcome()
+                if status == 429:
+                    self._reply(429, {"error": {"message": "rate limited"}},
+                                {"Retry-After": str(server.config.retry_after)})
+                    return
+                if status != 200:
+                    self._reply(status, {"error": {"message": "mock server error"}})
+                    return
+                prompt = "\n".join(m.get("content", "") for m in request.get("messages", []))
+                content = server.completion_text(prompt)
+                prompt_tokens = len(prompt) // 4
+                completion_tokens = len(content) // 4
+                if request.get("stream"):
+                    usage = (request.get("stream_options") or {}).get("include_usage")
+                    self._stream(request, content, {
+                        "prompt_tokens": prompt_tokens,
+                        "completion_tokens": completion_tokens,
+                        "total_tokens": prompt_tokens + completion_tokens
+                    } if usage else None)
+                    return
+                self._reply(200, {
+                    "id": f"chatcmpl-{uuid.uuid4().hex}",
+                    "object": "chat.completion",
+                    "created": int(time.time()),
+                    "model": request.get("model", "mock"),
+                    "choices": [{
+                        "index": 0,
+                        "message": {"role": "assistant", "content": content},
+                        "finish_reason": "stop"
+                    }],
+                    "usage": {
+                        "prompt_tokens": prompt_tokens,
+                        "completion_tokens": completion_tokens,
+                        "total_tokens": prompt_tokens + completion_tokens
+                    }
+                })
+
+        return Handler
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="OpenAI互換のモックJudgeサーバー")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--latency-ms", type=float, default=200.0)
+    parser.add_argument("--latency-distribution", choices=LATENCY_DISTRIBUTIONS, default="lognormal")
+    parser.add_argument("--latency-sigma", type=float, default=0.5)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0)
+    parser.add_argument("--reason-chars", type=int, default=0)
+    parser.add_argument("--trailing-chars", type=int, default=0)
+    args = parser.parse_args()
+    MockJudgeServer(MockServerConfig(
+        latency_ms=args.latency_ms,
+        latency_distribution=args.latency_distribution,
+        latency_sigma=args.latency_sigma,
+        error_rate=args.error_rate,
+        rate_limit_rate=args.rate_limit_rate,
+        reason_chars=args.reason_chars,
+        trailing_chars=args.trailing_chars
+    ), port=args.port).serve_forever()
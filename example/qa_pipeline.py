@@ -0,0 +1,274 @@
+"""本番環境でのQA評価パイプライン（10_pipeline.py・ベンチマークから利用）"""
+from deepeval.test_case import LLMTestCase
+from deepeval import evaluate
+from loguru import logger
+import os
+import time
+from adaptive_sampling import (
+    DEFAULT_BATCH_SIZE, DEFAULT_CONFIDENCE, DEFAULT_TARGET_WIDTH, StratifiedEstimate, StratifiedSampler
+)
+from incremental_eval import fingerprint_judge
+from judge_registry import get_default_registry
+from result_journal import judge_score_key, summarize
+from work_queue import LeaseHeartbeat, default_worker_id
+
+try:
+    from deepeval.evaluate.configs import ErrorConfig
+except ImportError:  # 旧バージョンのdeepevalはキーワード引数で指定する
+    ErrorConfig = None
+
+
+def isolate_test_run_file():
+    """deepevalが実行中の結果を書く .deepeval/ の一時ファイルを、同じディレクトリで動く他のワーカーと衝突しないようプロセスごとに分ける"""
+    from deepeval.constants import HIDDEN_DIR
+    from deepeval.test_run import test_run
+    path = f"{HIDDEN_DIR}/.temp_test_run_data.{os.getpid()}.json"
+    test_run.TEMP_FILE_PATH = path
+    test_run.global_test_run_manager.temp_file_path = path
+
+
+class QAEvaluationPipeline:
+    """本番環境でのQA評価パイプライン"""
+    def __init__(self, judge_configs, registry=None, evaluate_kwargs=None):
+        # 同じ設定のJudgeは複数パイプライン間で1インスタンスを共有する
+        self.registry = registry or get_default_registry()
+        # evaluate()にそのまま渡す追加引数（並列度・表示設定など）
+        self.evaluate_kwargs = evaluate_kwargs or {}
+        self.judges = [self._create_judge(config) for config in judge_configs]
+    def _create_judge(self, config):
+        return self.registry.get_or_create(config)
+    def evaluate_qa_batch(self, qa_pairs, journal=None, checkpoint_size=100):
+        """QAペアのバッチ評価
+
+        journalを渡すと、checkpoint_size件ごとに評価結果をジャーナルへ追記し、
+        記録済みの (テストケース, Judge) は評価せずに再開する。
+        """
+        logger.info(f"🚀 パイプライン評価を開始 - {len(qa_pairs)}件のQAペアを処理")
+        
+        test_cases = []
+        for i, qa in enumerate(qa_pairs, 1):
+            logger.debug(f"📄 {i}/{len(qa_pairs)}: テストケースを作成中...")
+            test_cases.append(self._to_test_case(qa))
+        
+        logger.info(f"🤖 {len(self.judges)}個のJudgeで評価実行中...")
+        
+        try:
+            if journal is None:
+                results = evaluate(test_cases=test_cases, metrics=self.judges, **self.evaluate_kwargs)
+                logger.success("✅ バッチ評価が完了しました！")
+                return self._format_results(results)
+            self._evaluate_with_journal(test_cases, journal, checkpoint_size)
+            logger.success("✅ バッチ評価が完了しました！")
+            return self._summarize(list(journal.detailed_results(self.judges, test_cases)))
+        except Exception as e:
+            logger.error(f"❌ バッチ評価中にエラー: {e}")
+            raise
+    @staticmethod
+    def _to_test_case(qa, metadata=None):
+        return LLMTestCase(
+            input=qa["question"],
+            actual_output=qa["answer"],
+            expected_output=qa.get("expected", ""),
+            retrieval_context=qa.get("context", []),
+            metadata=metadata
+        )
+    def evaluate_sample(self, qa_pairs, target_width=DEFAULT_TARGET_WIDTH, confidence=DEFAULT_CONFIDENCE,
+                        strata=None, batch_size=DEFAULT_BATCH_SIZE, max_samples=None, seed=None):
+        """全件ではなく層化ランダムサンプルで評価し、Judgeごとの平均スコア・合格率を推定する
+
+        strataはQAペアの層を決めるキー名または関数（Noneなら層分けなし）。
+        batch_size件ずつ評価して信頼区間を更新し、全Judgeで平均スコア・合格率の
+        信頼区間幅がtarget_width以下になった時点で打ち切る。
+        """
+        sampler = StratifiedSampler(qa_pairs, strata, seed)
+        estimates = {judge.name: StratifiedEstimate(sampler.sizes, confidence) for judge in self.judges}
+        logger.info(
+            f"🎲 サンプリング評価を開始 - 母集団{len(qa_pairs)}件, {len(sampler.sizes)}層, "
+            f"目標幅{target_width} (信頼水準{confidence:.0%})"
+        )
+        
+        sampled, errors, stop_reason = 0, 0, "exhausted"
+        while sampler.remaining():
+            if max_samples is not None and sampled >= max_samples:
+                stop_reason = "max_samples"
+                break
+            size = batch_size if max_samples is None else min(batch_size, max_samples - sampled)
+            # 2回目以降は、層内のばらつきが大きい層に多く割り当てる（Neyman配分）
+            weights = None
+            if sampled:
+                weights = {
+                    stratum: max(estimate.stratum_std(stratum) for estimate in estimates.values())
+                    for stratum in sampler.sizes
+                }
+            batch = [
+                (stratum, index)
+                for stratum, n in sampler.allocate(size, weights).items()
+                for index in sampler.draw(stratum, n)
+            ]
+            results = evaluate(
+                test_cases=[
+                    self._to_test_case(qa_pairs[index], {"sample_position": position})
+                    for position, (_, index) in enumerate(batch)
+                ],
+                metrics=self.judges,
+                **self.evaluate_kwargs
+            )
+            # 非同期実行では結果が完了順に並ぶため、メタデータから層を引き当てる
+            for result in results.test_results:
+                stratum, _ = batch[result.metadata["sample_position"]]
+                for metric_data in result.metrics_data:
+                    judge = self._match_judge(self.judges, metric_data.name)
+                    if judge is None or metric_data.score is None:
+                        errors += 1
+                        continue
+                    estimates[judge.name].update(stratum, metric_data.score, metric_data.success)
+            sampled += len(batch)
+            
+            widths = {name: estimate.width() for name, estimate in estimates.items()}
+            logger.info(
+                f"📐 {sampled}件評価 - 信頼区間幅: "
+                + ", ".join(f"{name}={width:.3f}" for name, width in widths.items())
+            )
+            if all(width <= target_width for width in widths.values()):
+                stop_reason = "target_width"
+                break
+        
+        logger.success(f"✅ サンプリング評価が完了しました（{sampled}/{len(qa_pairs)}件, 終了理由: {stop_reason}）")
+        return {
+            "population": len(qa_pairs),
+            "sampled": sampled,
+            "errors": errors,
+            "stop_reason": stop_reason,
+            "strata": sampler.sizes,
+            "judges": {name: estimate.to_dict() for name, estimate in estimates.items()}
+        }
+    def evaluate_from_queue(self, queue, worker_id=None, batch_size=50, poll_interval=5.0):
+        """WorkQueueから自分のJudgeのタスクをリースして評価し、キューが空になるまで続ける
+
+        複数プロセス・複数マシンから同じキューに対して実行すると、タスクを分担して評価する。
+        評価中はハートビートでリースを延長し、途中で落ちたワーカーのタスクは期限切れ後に再評価される。
+        """
+        worker_id = worker_id or default_worker_id()
+        judges = {fingerprint_judge(judge): judge for judge in self.judges}
+        isolate_test_run_file()
+        logger.info(f"👷 ワーカー {worker_id} がキューからの評価を開始します")
+        
+        committed = 0
+        while True:
+            tasks = queue.lease(worker_id, batch_size, self.judges)
+            if not tasks:
+                if queue.is_finished(self.judges):
+                    break
+                # 他のワーカーがリース中のタスクは、期限切れになったら取り直す
+                time.sleep(poll_interval)
+                continue
+            groups = {}
+            for task in tasks:
+                groups.setdefault(task.judge_fp, []).append(task)
+            with LeaseHeartbeat(queue, tasks):
+                for judge_fp, group in groups.items():
+                    committed += self._evaluate_tasks(queue, judges[judge_fp], group)
+            logger.info(f"📤 {committed}件確定 - キューの状態: {queue.stats(self.judges)}")
+        
+        logger.success(f"✅ キューの評価が完了しました（このワーカーで{committed}件確定）")
+        return self._summarize(queue.detailed_results(self.judges))
+    def _evaluate_tasks(self, queue, judge, tasks):
+        """同じJudgeのタスクをまとめて評価し、成功した結果を確定・失敗したタスクを返却する"""
+        # 1タスクのエラーでバッチ全体を返却しないよう、エラーはメトリック単位で受け取る
+        evaluate_kwargs = dict(self.evaluate_kwargs)
+        if ErrorConfig is not None:
+            evaluate_kwargs.setdefault("error_config", ErrorConfig(ignore_errors=True))
+        else:
+            evaluate_kwargs.setdefault("ignore_errors", True)
+        pending = {task.task_id: task for task in tasks}
+        try:
+            results = evaluate(
+                test_cases=[self._to_test_case(task.qa, {"task_id": task.task_id}) for task in tasks],
+                metrics=[judge],
+                **evaluate_kwargs
+            )
+        except Exception as e:
+            logger.error(f"❌ {judge.name}の評価中にエラー: {e}")
+            queue.release(tasks, e)
+            return 0
+        done, error = [], "評価エラー"
+        for result in results.test_results:
+            metric_data = result.metrics_data[0] if result.metrics_data else None
+            if metric_data is None or metric_data.score is None:
+                # エラーになったタスクは返却し、試行回数の上限まで再評価させる
+                error = getattr(metric_data, 'error', None) or error
+                continue
+            task = pending.pop(result.metadata["task_id"])
+            done.append((task, metric_data.score, metric_data.success, getattr(metric_data, 'reason', '')))
+        if pending:
+            queue.release(list(pending.values()), error)
+        return queue.complete_many(done)
+    def _evaluate_with_journal(self, test_cases, journal, checkpoint_size):
+        """未記録のペアだけを評価し、チャンクごとにジャーナルへ書き込む"""
+        pending = []
+        for test_case in test_cases:
+            missing = tuple(i for i, judge in enumerate(self.judges) if not journal.has(test_case, judge))
+            if missing:
+                pending.append((test_case, missing))
+        logger.info(f"📒 記録済み: {len(test_cases) - len(pending)}件, 未評価: {len(pending)}件")
+        
+        for start in range(0, len(pending), checkpoint_size):
+            # 未評価Judgeの組み合わせごとにまとめてevaluate()する
+            groups = {}
+            for test_case, missing in pending[start:start + checkpoint_size]:
+                groups.setdefault(missing, []).append(test_case)
+            for judge_indexes, group in groups.items():
+                judges = [self.judges[i] for i in judge_indexes]
+                results = evaluate(test_cases=group, metrics=judges, **self.evaluate_kwargs)
+                for result in results.test_results:
+                    for metric_data in result.metrics_data:
+                        judge = self._match_judge(judges, metric_data.name)
+                        if judge is None or metric_data.score is None:
+                            # エラーになった結果は記録せず、再開時に再評価する
+                            continue
+                        journal.append(result, judge, metric_data.score, metric_data.success,
+                                       getattr(metric_data, 'reason', ''))
+            logger.info(f"💾 {min(start + checkpoint_size, len(pending))}/{len(pending)}件をジャーナルに記録しました")
+    @staticmethod
+    def _match_judge(judges, metric_name):
+        # deepevalのバージョンによってメトリック名に " [GEval]" が付くことがある
+        for judge in judges:
+            if metric_name == judge.name or judge_score_key(metric_name) == judge.name:
+                return judge
+        return None
+    def evaluate_shard(self, qa_pairs):
+        """QAペアを評価し、集計前の詳細結果を入力順で返す（ShardedPipelineRunnerのワーカー用）"""
+        test_cases = [self._to_test_case(qa, {"position": i}) for i, qa in enumerate(qa_pairs)]
+        results = evaluate(test_cases=test_cases, metrics=self.judges, **self.evaluate_kwargs)
+        # 非同期実行では結果が完了順に並ぶため、入力順に並べ直す
+        results.test_results.sort(key=lambda result: result.metadata["position"])
+        return self._detailed_results(results)
+    def _format_results(self, results):
+        """結果のフォーマット"""
+        logger.info("📊 評価結果をフォーマット中...")
+        return self._summarize(self._detailed_results(results))
+    def _detailed_results(self, results):
+        detailed_results = []
+        for i, result in enumerate(results.test_results, 1):
+            detailed = {
+                "question": result.input,
+                "answer": result.actual_output,
+                "overall_success": result.success,
+                "judge_scores": {}
+            }
+            
+            logger.debug(f"📁 {i}: 詳細結果を処理中...")
+            for metric_data in result.metrics_data:
+                detailed["judge_scores"][judge_score_key(metric_data.name)] = {
+                    "score": metric_data.score,
+                    "success": metric_data.success,
+                    "reason": getattr(metric_data, 'reason', '')
+                }
+            detailed_results.append(detailed)
+        return detailed_results
+    def _summarize(self, detailed_results):
+        """詳細結果から全体スコア・成功率を集計（ジャーナルからの再構築にも使用）"""
+        formatted = summarize(detailed_results)
+        logger.info(f"🎯 全体スコア: {formatted['overall_score']:.3f}")
+        logger.info(f"🎆 成功率: {formatted['success_rate']:.1%}")
+        return formatted
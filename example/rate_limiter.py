@@ -0,0 +1,243 @@
+"""LiteLLM Judge向けのレート制限スケジューラ（RPM/TPMトークンバケット + 429リトライ）"""
+from email.utils import parsedate_to_datetime
+from loguru import logger
+import asyncio
+import random
+import re
+import threading
+import time
+import httpx
+
+RETRYABLE_STATUS_CODES = {429, 500, 502, 503, 504}
+
+_DURATION_PATTERN = re.compile(r"(\d+(?:\.\d+)?)(ms|s|m|h)")
+_DURATION_UNITS = {"ms": 0.001, "s": 1.0, "m": 60.0, "h": 3600.0}
+
+
+def parse_duration(value):
+    """6m0s・20ms・1.5・エポック秒・HTTP日付形式を秒数に変換（解釈できなければNone）"""
+    if value is None:
+        return None
+    value = str(value).strip()
+    try:
+        seconds = float(value)
+        # 巨大な値はエポック秒とみなす
+        return max(0.0, seconds - time.time()) if seconds > 1e9 else max(0.0, seconds)
+    except ValueError:
+        pass
+    parts = _DURATION_PATTERN.findall(value)
+    if parts and "".join(n + u for n, u in parts) == value:
+        return sum(float(n) * _DURATION_UNITS[u] for n, u in parts)
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+class TokenBucket:
+    """スレッドセーフなトークンバケット（先取り予約方式）"""
+    def __init__(self, capacity, refill_per_second):
+        self.capacity = float(capacity)
+        self.refill_per_second = float(refill_per_second)
+        self.tokens = float(capacity)
+        self.blocked_until = 0.0
+        self._updated_at = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self, now):
+        elapsed = now - self._updated_at
+        self.tokens = min(self.capacity, self.tokens + elapsed * self.refill_per_second)
+        self._updated_at = now
+
+    def reserve(self, amount):
+        """amount分を予約し、送信可能になるまでの待ち秒数を返す"""
+        with self._lock:
+            now = time.monotonic()
+            self._refill(now)
+            # 容量を超える要求は永久に待たないよう容量で頭打ちにする
+            self.tokens -= min(float(amount), self.capacity)
+            wait = -self.tokens / self.refill_per_second if self.tokens < 0 else 0.0
+            return max(wait, self.blocked_until - now)
+
+    def refund(self, amount):
+        """見積もりより実使用量が少なかった分を戻す（負の値で追加消費）"""
+        with self._lock:
+            self._refill(time.monotonic())
+            self.tokens = min(self.capacity, self.tokens + amount)
+
+    def block_for(self, seconds):
+        """プロバイダから制限を通知された場合、指定秒数の間バケットを止める"""
+        with self._lock:
+            now = time.monotonic()
+            self._refill(now)
+            self.tokens = min(self.tokens, 0.0)
+            self.blocked_until = max(self.blocked_until, now + seconds)
+
+
+class RateLimitScheduler:
+    """モデルごとのRPM/TPM予算を守りながらリクエストを送り、429等はリトライする"""
+    def __init__(self, rpm=None, tpm=None, max_retries=5, base_delay=1.0, max_delay=60.0):
+        self.rpm = rpm
+        self.tpm = tpm
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self._buckets = {}
+        self._lock = threading.Lock()
+
+    def _get_buckets(self, model):
+        with self._lock:
+            if model not in self._buckets:
+                self._buckets[model] = {
+                    "requests": TokenBucket(self.rpm, self.rpm / 60.0) if self.rpm else None,
+                    "tokens": TokenBucket(self.tpm, self.tpm / 60.0) if self.tpm else None
+                }
+            return self._buckets[model]
+
+    def _reserve(self, model, tokens):
+        buckets = self._get_buckets(model)
+        waits = [0.0]
+        if buckets["requests"]:
+            waits.append(buckets["requests"].reserve(1))
+        if buckets["tokens"]:
+            waits.append(buckets["tokens"].reserve(tokens))
+        return max(waits)
+
+    def acquire(self, model, tokens):
+        """予算に空きができるまでブロックし、待った秒数を返す"""
+        wait = self._reserve(model, tokens)
+        if wait > 0:
+            time.sleep(wait)
+        return wait
+
+    async def a_acquire(self, model, tokens):
+        """acquireの非同期版"""
+        wait = self._reserve(model, tokens)
+        if wait > 0:
+            await asyncio.sleep(wait)
+        return wait
+
+    def release(self, model, tokens):
+        """失敗に終わったリクエストで予約したTPMを戻す"""
+        bucket = self._get_buckets(model)["tokens"]
+        if bucket:
+            bucket.refund(tokens)
+
+    def reconcile(self, model, estimated_tokens, usage):
+        """レスポンスのusageで実トークン数を反映する"""
+        bucket = self._get_buckets(model)["tokens"]
+        if not bucket or not usage:
+            return
+        total = usage.get("total_tokens")
+        if total is None and usage.get("prompt_tokens") is not None and usage.get("completion_tokens") is not None:
+            total = usage["prompt_tokens"] + usage["completion_tokens"]
+        if total is not None:
+            bucket.refund(estimated_tokens - total)
+
+    def observe_headers(self, model, headers):
+        """x-ratelimit-* ヘッダから残り予算が尽きていればバケットを止める"""
+        buckets = self._get_buckets(model)
+        for kind in ("requests", "tokens"):
+            remaining = headers.get(f"x-ratelimit-remaining-{kind}")
+            reset = parse_duration(headers.get(f"x-ratelimit-reset-{kind}"))
+            if remaining is None or reset is None or buckets[kind] is None:
+                continue
+            try:
+                if float(remaining) <= 0:
+                    buckets[kind].block_for(reset)
+            except ValueError:
+                continue
+
+    def retry_delay(self, attempt, headers=None):
+        """Retry-After / x-ratelimit-reset-* を優先し、無ければジッター付き指数バックオフ"""
+        headers = headers or {}
+        hinted = parse_duration(headers.get("retry-after"))
+        if hinted is None:
+            resets = [
+                parse_duration(headers.get(f"x-ratelimit-reset-{kind}"))
+                for kind in ("requests", "tokens")
+            ]
+            resets = [r for r in resets if r is not None]
+            hinted = max(resets) if resets else None
+        if hinted is not None:
+            # 複数リクエストが同時に再送しないよう少しだけずらす
+            return min(self.max_delay, hinted) + random.uniform(0, self.base_delay)
+        return random.uniform(0, min(self.max_delay, self.base_delay * (2 ** attempt)))
+
+    def _should_retry(self, model, attempt, response=None, error=None):
+        if attempt >= self.max_retries:
+            return None
+        if error is not None:
+            delay = self.retry_delay(attempt)
+            logger.warning(f"⏳ {model}: 通信エラーのため{delay:.1f}秒後に再試行 ({attempt + 1}/{self.max_retries}): {error}")
+            return delay
+        if response.status_code not in RETRYABLE_STATUS_CODES:
+            return None
+        delay = self.retry_delay(attempt, response.headers)
+        if response.status_code == 429:
+            # 他の並列リクエストも含めてモデル単位で送信を止める
+            for bucket in self._get_buckets(model).values():
+                if bucket:
+                    bucket.block_for(delay)
+        logger.warning(f"⏳ {model}: HTTP {response.status_code} のため{delay:.1f}秒後に再試行 ({attempt + 1}/{self.max_retries})")
+        return delay
+
+    def call(self, model, tokens, send, stats=None, read=None):
+        """send()でリクエストを送信し、リトライ後の最終レスポンスを返す
+
+        statsに辞書を渡すと、レート制限による待ち秒数（queue_wait）とリトライ回数（retries）を書き込む。
+        readを渡すとレスポンスをread(response)で読んだ結果を返し、読み取り中の通信エラー
+        （ストリーミングの途中切断など）も再試行の対象にする。
+        TPMは最初の送信時に1回だけ予約し、再送ではRPMだけを消費する。
+        例外で終わった場合は予約したTPMを戻す（成功時の精算は呼び出し側で行う）。
+        """
+        attempt = 0
+        try:
+            while True:
+                wait = self.acquire(model, tokens if attempt == 0 else 0)
+                if stats is not None:
+                    stats["queue_wait"] = stats.get("queue_wait", 0.0) + wait
+                    stats["retries"] = attempt
+                try:
+                    response = send()
+                    self.observe_headers(model, response.headers)
+                    delay = self._should_retry(model, attempt, response=response)
+                    if delay is None:
+                        return read(response) if read else response
+                    response.close()
+                except httpx.TransportError as e:
+                    delay = self._should_retry(model, attempt, error=e)
+                    if delay is None:
+                        raise
+                time.sleep(delay)
+                attempt += 1
+        except BaseException:
+            self.release(model, tokens)
+            raise
+
+    async def a_call(self, model, tokens, send, stats=None, read=None):
+        """callの非同期版（send・readはコルーチン関数）"""
+        attempt = 0
+        try:
+            while True:
+                wait = await self.a_acquire(model, tokens if attempt == 0 else 0)
+                if stats is not None:
+                    stats["queue_wait"] = stats.get("queue_wait", 0.0) + wait
+                    stats["retries"] = attempt
+                try:
+                    response = await send()
+                    self.observe_headers(model, response.headers)
+                    delay = self._should_retry(model, attempt, response=response)
+                    if delay is None:
+                        return await read(response) if read else response
+                    await response.aclose()
+                except httpx.TransportError as e:
+                    delay = self._should_retry(model, attempt, error=e)
+                    if delay is None:
+                        raise
+                await asyncio.sleep(delay)
+                attempt += 1
+        except BaseException:
+            # キャンセルされた場合も予約を戻す
+            self.release(model, tokens)
+            raise
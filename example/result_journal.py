@@ -0,0 +1,177 @@
+"""(テストケース, Judge) ごとの評価結果を追記していく、クラッシュに強いJSONLジャーナル"""
+from loguru import logger
+import json
+import os
+import re
+import threading
+import time
+from incremental_eval import fingerprint_judge, fingerprint_test_case
+
+DEFAULT_JOURNAL_PATH = "results_journal.jsonl"
+DEFAULT_SYNC_EVERY = 50
+DEFAULT_SYNC_INTERVAL = 1.0
+
+_METRIC_SUFFIX = re.compile(r" \[[^\[\]]*\]$")
+
+
+def judge_score_key(metric_name):
+    """詳細結果のjudge_scoresのキー（deepevalのバージョンによって付く " [GEval]" を除いたJudge名）
+
+    evaluate()の結果・ジャーナル・作業キューのどの経路でも同じキーになるよう、ここで統一する。
+    """
+    return _METRIC_SUFFIX.sub("", metric_name)
+
+
+def summarize(detailed_results):
+    """詳細結果のリストから全体スコア・成功率を計算する"""
+    all_scores = [
+        judge_score["score"]
+        for detailed in detailed_results
+        for judge_score in detailed["judge_scores"].values()
+        if judge_score.get("score") is not None
+    ]
+    passed = sum(1 for detailed in detailed_results if detailed["overall_success"])
+    return {
+        "overall_score": sum(all_scores) / len(all_scores) if all_scores else 0,
+        "success_rate": passed / len(detailed_results) if detailed_results else 0,
+        "detailed_results": detailed_results
+    }
+
+
+class ResultJournal:
+    """1ペア評価するごとに1行追記し、fsyncはまとめて行う
+
+    プロセスが落ちても書き込み済みの行はOSに渡っているため失われない。
+    電源断の場合に失われうるのは、最後のfsync以降の最大 sync_every 件まで。
+    メモリには (テストケース, Judge) のキーと行の位置だけを持ち、結果本体は必要なときにファイルから読む。
+    """
+    def __init__(self, path=DEFAULT_JOURNAL_PATH, resume=True,
+                 sync_every=DEFAULT_SYNC_EVERY, sync_interval=DEFAULT_SYNC_INTERVAL):
+        self.path = path
+        self.sync_every = sync_every
+        self.sync_interval = sync_interval
+        self._offsets = {}
+        self._size = 0
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        if resume:
+            self._load()
+        else:
+            open(path, "w", encoding="utf-8").close()
+        # 前回までの実行で記録された行はこの位置より前にある
+        self._resumed_size = self._size
+        self._file = open(path, "ab")
+        self._reader = open(path, "rb")
+        self._unsynced = 0
+        self._last_sync = time.monotonic()
+        if self._offsets:
+            logger.info(f"📒 ジャーナルから{len(self._offsets)}ペアの評価結果を復元しました")
+
+    def _load(self):
+        if not os.path.exists(self.path):
+            return
+        with open(self.path, "rb") as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    # 書き込み途中で落ちた末尾の行は捨てる
+                    break
+                if not line.endswith(b"\n"):
+                    break
+                self._offsets[(entry["case_fp"], entry["judge_fp"])] = self._size
+                self._size += len(line)
+        if self._size != os.path.getsize(self.path):
+            logger.warning("⚠️ ジャーナル末尾の不完全な行を切り捨てます")
+            with open(self.path, "r+b") as f:
+                f.truncate(self._size)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def __len__(self):
+        return len(self._offsets)
+
+    def _read(self, offset):
+        with self._lock:
+            self._reader.seek(offset)
+            return json.loads(self._reader.readline())
+
+    def has(self, test_case, judge):
+        """記録済みならTrue（ファイルは読まない）"""
+        return (fingerprint_test_case(test_case), fingerprint_judge(judge)) in self._offsets
+
+    def get(self, test_case, judge):
+        """記録済みの結果を返す（無ければNone）"""
+        offset = self._offsets.get((fingerprint_test_case(test_case), fingerprint_judge(judge)))
+        return None if offset is None else self._read(offset)
+
+    def resumed(self, test_case, judge):
+        """前回までの実行で記録された結果を返す（今回の実行で記録したものや未記録ならNone）"""
+        offset = self._offsets.get((fingerprint_test_case(test_case), fingerprint_judge(judge)))
+        return None if offset is None or offset >= self._resumed_size else self._read(offset)
+
+    def append(self, test_case, judge, score, success, reason):
+        entry = {
+            "case_fp": fingerprint_test_case(test_case),
+            "judge_fp": fingerprint_judge(judge),
+            "judge_name": judge.name,
+            "input": test_case.input,
+            "actual_output": test_case.actual_output,
+            "score": score,
+            "success": bool(success),
+            "reason": reason or "",
+            "recorded_at": time.time()
+        }
+        line = (json.dumps(entry, ensure_ascii=False) + "\n").encode("utf-8")
+        with self._lock:
+            self._file.write(line)
+            self._file.flush()
+            self._offsets[(entry["case_fp"], entry["judge_fp"])] = self._size
+            self._size += len(line)
+            self._unsynced += 1
+            if self._unsynced >= self.sync_every or time.monotonic() - self._last_sync >= self.sync_interval:
+                self._sync()
+
+    def _sync(self):
+        os.fsync(self._file.fileno())
+        self._unsynced = 0
+        self._last_sync = time.monotonic()
+
+    def detailed_results(self, judges, test_cases=None):
+        """記録済みの結果をQAEvaluationPipelineと同じ詳細結果の形式で1件ずつ返す（ジェネレーター）
+
+        test_casesを渡すとその順番・範囲に絞る。省略時は記録順で全件。
+        """
+        judge_fps = [fingerprint_judge(judge) for judge in judges]
+        if test_cases is None:
+            case_fps = dict.fromkeys(case_fp for case_fp, _ in self._offsets)
+        else:
+            case_fps = (fingerprint_test_case(tc) for tc in test_cases)
+        for case_fp in case_fps:
+            entries = [
+                self._read(self._offsets[(case_fp, judge_fp)])
+                for judge_fp in judge_fps if (case_fp, judge_fp) in self._offsets
+            ]
+            if not entries:
+                continue
+            yield {
+                "question": entries[0]["input"],
+                "answer": entries[0]["actual_output"],
+                "overall_success": len(entries) == len(judges) and all(e["success"] for e in entries),
+                "judge_scores": {
+                    judge_score_key(e["judge_name"]): {"score": e["score"], "success": e["success"], "reason": e["reason"]}
+                    for e in entries
+                }
+            }
+
+    def close(self):
+        with self._lock:
+            if self._file.closed:
+                return
+            self._sync()
+            self._file.close()
+            self._reader.close()
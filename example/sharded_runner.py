@@ -0,0 +1,93 @@
+"""QAペアを複数プロセスに分割して評価し、QAEvaluationPipelineと同じ形式の結果に統合するランナー"""
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from loguru import logger
+import multiprocessing
+import os
+from judge_registry import get_default_registry
+from qa_pipeline import QAEvaluationPipeline, isolate_test_run_file
+from result_journal import summarize
+
+DEFAULT_SHARD_SIZE = 200
+
+# ワーカープロセスごとに1つ持つパイプライン（Judge・HTTPプールはプロセス内で共有）
+_worker_pipeline = None
+
+
+def _init_worker(judge_configs, evaluate_kwargs, pipeline_factory):
+    global _worker_pipeline
+    isolate_test_run_file()
+    if pipeline_factory is not None:
+        _worker_pipeline = pipeline_factory()
+    else:
+        _worker_pipeline = QAEvaluationPipeline(judge_configs, evaluate_kwargs=evaluate_kwargs)
+
+
+def _mp_context():
+    # サンプルスクリプトは __main__ ガードなしで書かれているため、使えるならforkで起動して再実行を避ける
+    if "fork" in multiprocessing.get_all_start_methods():
+        return multiprocessing.get_context("fork")
+    return None
+
+
+def _evaluate_shard(shard_index, qa_pairs):
+    return shard_index, _worker_pipeline.evaluate_shard(qa_pairs)
+
+
+class ShardedPipelineRunner:
+    """QAペアをshard_size件ずつのシャードに分け、プロセスプールで並列に評価する
+
+    プロンプト組み立て・JSON解析・結果整形といったクライアント側の処理が1コアで
+    頭打ちになる大規模バッチ向け。各ワーカーは自分のJudgeとHTTPプールを持つ。
+    judge_configsの "model" はモデル名にするか、pipeline_factory（モジュールの
+    トップレベル関数）でワーカー内にモデルごとパイプラインを作る。
+    """
+    def __init__(self, judge_configs=None, processes=None, shard_size=DEFAULT_SHARD_SIZE,
+                 evaluate_kwargs=None, pipeline_factory=None):
+        if judge_configs is None and pipeline_factory is None:
+            raise ValueError("judge_configs か pipeline_factory のどちらかを指定してください")
+        self.judge_configs = judge_configs
+        self.processes = processes or os.cpu_count()
+        self.shard_size = shard_size
+        self.evaluate_kwargs = evaluate_kwargs or {}
+        self.pipeline_factory = pipeline_factory
+        if pipeline_factory is None:
+            # 評価手順の生成はワーカーごとに行わず、起動前にここで一度だけ済ませてキャッシュする
+            registry = get_default_registry()
+            for config in judge_configs:
+                registry.get_or_create(config)
+
+    def evaluate_qa_batch(self, qa_pairs):
+        """QAEvaluationPipeline.evaluate_qa_batchと同じ形式の結果を返す
+
+        detailed_resultsは入力順に並び、overall_score・success_rateは全シャードの
+        結果をまとめてから計算する（シャードごとの値の平均ではない）。
+        """
+        shards = [qa_pairs[start:start + self.shard_size] for start in range(0, len(qa_pairs), self.shard_size)]
+        workers = min(self.processes, len(shards)) or 1
+        logger.info(f"🧩 {len(qa_pairs)}件を{len(shards)}シャードに分割し、{workers}プロセスで評価します")
+
+        shard_results = [None] * len(shards)
+        with ProcessPoolExecutor(
+            max_workers=workers,
+            mp_context=_mp_context(),
+            initializer=_init_worker,
+            initargs=(self.judge_configs, self.evaluate_kwargs, self.pipeline_factory)
+        ) as executor:
+            futures = {executor.submit(_evaluate_shard, i, shard): i for i, shard in enumerate(shards)}
+            for done, future in enumerate(as_completed(futures), 1):
+                try:
+                    shard_index, detailed_results = future.result()
+                except Exception as e:
+                    logger.error(f"❌ シャード{futures[future]}の評価中にエラー: {e}")
+                    for pending in futures:
+                        pending.cancel()
+                    raise
+                shard_results[shard_index] = detailed_results
+                logger.info(f"📦 {done}/{len(shards)}シャード完了")
+
+        detailed_results = [detailed for shard in shard_results for detailed in shard]
+        formatted = summarize(detailed_results)
+        logger.success("✅ シャード評価が完了しました！")
+        logger.info(f"🎯 全体スコア: {formatted['overall_score']:.3f}")
+        logger.info(f"🎆 成功率: {formatted['success_rate']:.1%}")
+        return formatted
@@ -0,0 +1,88 @@
+"""実行中の同一リクエストを1回のLLM呼び出しにまとめるシングルフライト"""
+import asyncio
+import threading
+
+
+class _Call:
+    __slots__ = ("done", "result", "error")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """同じキーの呼び出しが実行中なら、新たに実行せずその結果を待って共有する
+
+    同期呼び出しはスレッド間、非同期呼び出しは同じイベントループ内のタスク間でまとめる。
+    結果は保持しないため、完了後の同一リクエストは再び実行される（永続化はキャッシュの役割）。
+    """
+    def __init__(self):
+        self._calls = {}
+        self._async_calls = {}
+        self._lock = threading.Lock()
+        self.executed = 0
+        self.coalesced = 0
+
+    def do(self, key, fn):
+        """fn() を実行して結果を返す。同じキーで実行中の呼び出しがあればその結果（例外）を返す
+
+        戻り値は (結果, 他の呼び出しの結果を共有したか)。
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            shared = call is not None
+            if shared:
+                self.coalesced += 1
+            else:
+                call = self._calls[key] = _Call()
+                self.executed += 1
+        if shared:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result, True
+        try:
+            call.result = fn()
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+        return call.result, False
+
+    async def a_do(self, key, coroutine_fn):
+        """coroutine_fn() を実行して結果を返す（a_doの呼び出し元がキャンセルされても共有中の実行は続く）
+
+        戻り値は (結果, 他の呼び出しの結果を共有したか)。
+        """
+        loop_key = (id(asyncio.get_running_loop()), key)
+        with self._lock:
+            task = self._async_calls.get(loop_key)
+            shared = task is not None
+            if shared:
+                self.coalesced += 1
+            else:
+                task = asyncio.ensure_future(coroutine_fn())
+                self._async_calls[loop_key] = task
+                task.add_done_callback(lambda _: self._forget(loop_key, task))
+                self.executed += 1
+        return await asyncio.shield(task), shared
+
+    def _forget(self, loop_key, task):
+        with self._lock:
+            if self._async_calls.get(loop_key) is task:
+                del self._async_calls[loop_key]
+
+    def stats(self):
+        with self._lock:
+            total = self.executed + self.coalesced
+            return {
+                "executed": self.executed,
+                "coalesced": self.coalesced,
+                "in_flight": len(self._calls) + len(self._async_calls),
+                "coalesce_rate": self.coalesced / total if total else 0.0
+            }
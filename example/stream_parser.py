@@ -0,0 +1,142 @@
+"""ストリーミングで届くJudgeの応答から、評価JSONが閉じた時点を検出するインクリメンタルパーサー"""
+
+DEFAULT_MAX_REASON_CHARS = None
+
+
+class JudgeJSONStream:
+    """feed()に差分テキストを渡していき、先頭のJSONオブジェクトが閉じたら完了とする
+
+    JSONの後ろに続く補足説明は読まずに済む。max_reason_charsを指定すると "reason" の
+    文字列をその長さで切り詰め、"score" が既に届いていればその時点で完了とする
+    （"reason" が先に来る場合は "score" が届くまで読み続けるが、超過分は結果に含めない）。
+    """
+    def __init__(self, max_reason_chars=DEFAULT_MAX_REASON_CHARS):
+        self.max_reason_chars = max_reason_chars
+        self.complete = False
+        self.truncated = False
+        self.consumed = 0
+        self._parts = []
+        self._started = False
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self._unicode_digits = 0
+        self._expect_key = False
+        self._key = None
+        self._string = []
+        self._string_is_key = False
+        self._value_key = None
+        self._reason_length = 0
+        self._skipping = False
+        self._score_seen = False
+
+    @property
+    def text(self):
+        """これまでに受け取った応答（完了後はJSONの閉じ括弧まで）"""
+        return "".join(self._parts)
+
+    def feed(self, delta):
+        """差分テキストを追加し、これ以上読む必要がなくなったらTrueを返す"""
+        if self.complete:
+            return True
+        self.consumed += len(delta)
+        kept = []
+        for char in delta:
+            if self._skipping:
+                # 上限を超えたreasonの残りは捨て、文字列の終わりだけを探す
+                if self._escape:
+                    self._escape = False
+                elif char == "\\":
+                    self._escape = True
+                elif char == '"':
+                    self._skipping = self._in_string = False
+                    kept.append(char)
+                continue
+            kept.append(char)
+            if self._in_string:
+                self._on_string_char(char, kept)
+                if self.complete:
+                    break
+            elif self._on_char(char):
+                self.complete = True
+                break
+        self._parts.append("".join(kept))
+        return self.complete
+
+    def _on_string_char(self, char, kept):
+        if self._escape:
+            self._escape = False
+            if char == "u":
+                self._unicode_digits = 4
+            self._collect(char)
+            return
+        if self._unicode_digits:
+            # \uXXXX の途中では切り詰めない
+            self._unicode_digits -= 1
+            self._collect(char)
+            return
+        if char == '"':
+            self._in_string = False
+            if self._string_is_key:
+                self._key = "".join(self._string)
+            return
+        capped = (
+            self.max_reason_chars is not None and self._depth == 1
+            and not self._string_is_key and self._value_key == "reason"
+        )
+        if capped and self._reason_length >= self.max_reason_chars:
+            kept.pop()
+            self.truncated = True
+            if self._score_seen:
+                # scoreは受け取り済みなので、reasonを閉じてJSONを完成させる
+                kept.append('"' + "}" * self._depth)
+                self._in_string = False
+                self._depth = 0
+                self.complete = True
+            else:
+                self._skipping = True
+                self._escape = char == "\\"
+            return
+        if capped:
+            self._reason_length += 1
+        if char == "\\":
+            self._escape = True
+        self._collect(char)
+
+    def _collect(self, char):
+        if self._string_is_key:
+            self._string.append(char)
+
+    def _on_char(self, char):
+        """文字列の外の1文字を処理し、先頭のJSONオブジェクトが閉じたらTrueを返す"""
+        if char == "{":
+            self._started = True
+            self._depth += 1
+            self._expect_key = self._depth == 1
+        elif not self._started:
+            return False
+        elif char == "}":
+            self._finish_value()
+            self._depth -= 1
+            return self._depth == 0
+        elif char == "[":
+            self._depth += 1
+        elif char == "]":
+            self._depth -= 1
+        elif char == '"':
+            self._in_string = True
+            self._string_is_key = self._depth == 1 and self._expect_key
+            self._string = []
+            if not self._string_is_key and self._depth == 1:
+                self._value_key = self._key
+                self._reason_length = 0
+        elif char == ":" and self._depth == 1:
+            self._expect_key = False
+        elif char == "," and self._depth == 1:
+            self._finish_value()
+            self._expect_key = True
+        return False
+
+    def _finish_value(self):
+        if self._depth == 1 and self._key == "score" and not self._expect_key:
+            self._score_seen = True
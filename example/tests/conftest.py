@@ -0,0 +1,5 @@
+import os
+import sys
+
+# サンプルのモジュールはexample/直下からトップレベルでimportする前提のため、パスに追加する
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
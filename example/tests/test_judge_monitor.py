@@ -0,0 +1,56 @@
+import math
+import random
+from judge_monitor import JudgeMonitor, RunningStats
+
+
+def _pearson(pairs):
+    n = len(pairs)
+    human_mean = sum(h for h, _ in pairs) / n
+    judge_mean = sum(j for _, j in pairs) / n
+    co = sum((h - human_mean) * (j - judge_mean) for h, j in pairs)
+    human_ss = sum((h - human_mean) ** 2 for h, _ in pairs)
+    judge_ss = sum((j - judge_mean) ** 2 for _, j in pairs)
+    return co / math.sqrt(human_ss * judge_ss)
+
+
+def test_sliding_window_over_constant_series():
+    rng = random.Random(0)
+    monitor = JudgeMonitor(window_size=50, mode="sliding")
+    # ばらついたスコアの後に人間スコアが一定の区間が続いても落ちない
+    for _ in range(2000):
+        monitor.update(rng.random(), rng.random())
+    for i in range(6000):
+        monitor.update(0.7, rng.random())
+        assert monitor.window._human_m2 >= 0.0
+        if i >= monitor.window_size:
+            # ウィンドウ内の人間スコアが全て同じなら相関は定義できない
+            assert math.isnan(monitor.window.correlation)
+
+
+def test_remove_clamps_and_correlation_stays_in_range():
+    rng = random.Random(1)
+    stats = RunningStats()
+    pairs = []
+    for i in range(5000):
+        pair = (0.3 if i % 2 else rng.random(), rng.random())
+        stats.update(*pair)
+        pairs.append(pair)
+        if len(pairs) > 20:
+            stats.remove(*pairs.pop(0))
+        assert stats._human_m2 >= 0.0 and stats._judge_m2 >= 0.0
+        correlation = stats.correlation
+        assert math.isnan(correlation) or -1.0 <= correlation <= 1.0
+
+
+def test_sliding_window_matches_direct_computation():
+    rng = random.Random(2)
+    monitor = JudgeMonitor(window_size=30, mode="sliding")
+    pairs = []
+    for _ in range(500):
+        human = rng.random()
+        pair = (human, min(1.0, max(0.0, human + rng.gauss(0, 0.2))))
+        monitor.update(*pair)
+        pairs.append(pair)
+    window = pairs[-30:]
+    assert monitor.window.n == 30
+    assert math.isclose(monitor.window.correlation, _pearson(window), rel_tol=1e-9)
@@ -0,0 +1,70 @@
+import asyncio
+import httpx
+import pytest
+from rate_limiter import RateLimitScheduler
+
+MODEL = "judge"
+TPM = 600_000
+
+
+def _scheduler():
+    return RateLimitScheduler(tpm=TPM, max_retries=3, base_delay=0.001, max_delay=0.01)
+
+
+def _tokens(scheduler):
+    return scheduler._get_buckets(MODEL)["tokens"].tokens
+
+
+def _responses(*status_codes):
+    codes = iter(status_codes)
+    return lambda: httpx.Response(next(codes))
+
+
+def test_retries_reserve_tokens_once():
+    scheduler = _scheduler()
+    stats = {}
+    response = scheduler.call(MODEL, 1000, _responses(503, 503, 200), stats=stats)
+    assert response.status_code == 200
+    assert stats["retries"] == 2
+    # 2回の再送でも予約は1000トークン分だけ（補充分の誤差を許容）
+    assert _tokens(scheduler) == pytest.approx(TPM - 1000, abs=200)
+    scheduler.reconcile(MODEL, 1000, {"total_tokens": 300})
+    assert _tokens(scheduler) == pytest.approx(TPM - 300, abs=200)
+
+
+def test_failed_call_releases_reservation():
+    scheduler = _scheduler()
+
+    def send():
+        raise httpx.ConnectError("boom")
+
+    with pytest.raises(httpx.ConnectError):
+        scheduler.call(MODEL, 1000, send)
+    assert _tokens(scheduler) == pytest.approx(TPM)
+
+
+def test_async_failed_call_releases_reservation():
+    scheduler = _scheduler()
+
+    async def send():
+        raise httpx.ReadTimeout("slow")
+
+    with pytest.raises(httpx.ReadTimeout):
+        asyncio.run(scheduler.a_call(MODEL, 1000, send))
+    assert _tokens(scheduler) == pytest.approx(TPM)
+
+
+def test_read_errors_are_retried():
+    scheduler = _scheduler()
+    reads = iter([httpx.RemoteProtocolError("cut"), "ok"])
+
+    def read(response):
+        outcome = next(reads)
+        if isinstance(outcome, Exception):
+            raise outcome
+        return outcome
+
+    stats = {}
+    assert scheduler.call(MODEL, 1000, _responses(200, 200), stats=stats, read=read) == "ok"
+    assert stats["retries"] == 1
+    assert _tokens(scheduler) == pytest.approx(TPM - 1000, abs=200)
@@ -0,0 +1,91 @@
+"""人間ラベルに基づくJudge閾値の校正（全ての閾値での精度・再現率・F1を一括計算）"""
+from dataclasses import dataclass
+import numpy as np
+
+
+@dataclass
+class PRCurve:
+    thresholds: np.ndarray   # 候補閾値（スコアの異なる値、降順）
+    precision: np.ndarray
+    recall: np.ndarray
+    f1: np.ndarray
+    tp: np.ndarray
+    fp: np.ndarray
+
+
+@dataclass
+class CalibrationResult:
+    threshold: float
+    precision: float
+    recall: float
+    f1: float
+
+
+def precision_recall_curve(scores, labels):
+    """「score >= 閾値 を合格」としたときの精度・再現率・F1を、全ての異なるスコア値について返す
+
+    スコアを1回ソートし、正例数の累積和から計算するためO(N log N)。
+    """
+    scores = np.asarray(scores, dtype=np.float64)
+    labels = np.asarray(labels).astype(bool)
+    order = np.argsort(-scores, kind="stable")
+    sorted_scores = scores[order]
+    tp = np.cumsum(labels[order])
+    # 同じスコアの行はまとめて合格になるため、各スコア値の最後の位置だけを使う
+    last = np.flatnonzero(np.diff(sorted_scores, append=-np.inf) != 0)
+    tp = tp[last]
+    predicted = last + 1
+    fp = predicted - tp
+    positives = labels.sum()
+    precision = tp / predicted
+    recall = tp / positives if positives else np.zeros(len(tp))
+    with np.errstate(invalid="ignore", divide="ignore"):
+        f1 = np.where(precision + recall > 0, 2 * precision * recall / (precision + recall), 0.0)
+    return PRCurve(sorted_scores[last], precision, recall, f1, tp, fp)
+
+
+def calibrate_threshold(scores, labels, target_precision=None, target_recall=None):
+    """目標を満たす最適な閾値を返す（満たす閾値が無ければNone）
+
+    - target_precision: 精度が目標以上の閾値のうち、再現率が最大のもの
+    - target_recall: 再現率が目標以上の閾値のうち、精度が最大のもの
+    - どちらも省略: F1が最大の閾値
+    """
+    if target_precision is not None and target_recall is not None:
+        raise ValueError("target_precisionとtarget_recallはどちらか一方だけ指定してください")
+    curve = precision_recall_curve(scores, labels)
+    if target_precision is not None:
+        candidates = np.flatnonzero(curve.precision >= target_precision)
+        objective = curve.recall
+    elif target_recall is not None:
+        candidates = np.flatnonzero(curve.recall >= target_recall)
+        objective = curve.precision
+    else:
+        candidates = np.arange(len(curve.thresholds))
+        objective = curve.f1
+    if len(candidates) == 0:
+        return None
+    best = candidates[np.argmax(objective[candidates])]
+    return CalibrationResult(
+        threshold=float(curve.thresholds[best]),
+        precision=float(curve.precision[best]),
+        recall=float(curve.recall[best]),
+        f1=float(curve.f1[best])
+    )
+
+
+def calibrate_thresholds(judge_scores, labels, target_precision=None, target_recall=None):
+    """複数Judgeの閾値をまとめて校正する
+
+    judge_scoresは {Judge名: スコア配列}（DataFrameも可）。labelsは全Judge共通の配列か、
+    {Judge名: ラベル配列} を指定する。
+    """
+    return {
+        name: calibrate_threshold(
+            scores,
+            labels[name] if isinstance(labels, dict) else labels,
+            target_precision=target_precision,
+            target_recall=target_recall
+        )
+        for name, scores in judge_scores.items()
+    }
@@ -0,0 +1,41 @@
+"""Judgeプロンプトのトークン数カウント（tiktokenがあれば使用、なければ概算）"""
+from functools import lru_cache
+import math
+
+try:
+    import tiktoken
+except ImportError:  # tiktokenは任意依存
+    tiktoken = None
+
+DEFAULT_ENCODING = "o200k_base"
+
+
+@lru_cache(maxsize=None)
+def _get_encoding(model_name):
+    if tiktoken is None:
+        return None
+    try:
+        return tiktoken.encoding_for_model(model_name) if model_name else tiktoken.get_encoding(DEFAULT_ENCODING)
+    except KeyError:
+        return tiktoken.get_encoding(DEFAULT_ENCODING)
+    except Exception:
+        # エンコーディングのダウンロードに失敗した場合などは概算に切り替える
+        return None
+
+
+def estimate_tokens(text):
+    """文字種からトークン数を概算（ASCIIは約4文字、日本語等は約1文字で1トークン）"""
+    if not text:
+        return 0
+    ascii_chars = sum(1 for ch in text if ord(ch) < 128)
+    return math.ceil(ascii_chars / 4) + (len(text) - ascii_chars)
+
+
+def count_tokens(text, model_name=None):
+    """テキストのトークン数を返す"""
+    if not text:
+        return 0
+    encoding = _get_encoding(model_name)
+    if encoding is None:
+        return estimate_tokens(text)
+    return len(encoding.encode(text, disallowed_special=()))
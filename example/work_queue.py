@@ -0,0 +1,305 @@
+"""(QAペア, Judge) 単位の評価タスクをSQLiteに置き、複数ワーカーがリースして分担評価するための作業キュー"""
+from dataclasses import dataclass
+from loguru import logger
+import hashlib
+import json
+import os
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+from incremental_eval import fingerprint_judge
+from result_journal import judge_score_key
+
+DEFAULT_QUEUE_PATH = "evaluation_queue.sqlite3"
+DEFAULT_LEASE_SECONDS = 300.0
+DEFAULT_MAX_ATTEMPTS = 3
+# 他のワーカーが書き込み中のとき、ロックが空くまで待つ秒数
+DEFAULT_BUSY_TIMEOUT = 60.0
+
+PENDING, LEASED, DONE, FAILED = "pending", "leased", "done", "failed"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS tasks (
+    task_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    case_fp TEXT NOT NULL,
+    judge_fp TEXT NOT NULL,
+    judge_name TEXT NOT NULL,
+    payload TEXT NOT NULL,
+    status TEXT NOT NULL DEFAULT 'pending',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    lease_owner TEXT,
+    lease_token TEXT,
+    lease_expires REAL,
+    score REAL,
+    success INTEGER,
+    reason TEXT,
+    error TEXT,
+    updated_at REAL NOT NULL,
+    UNIQUE (case_fp, judge_fp)
+);
+CREATE INDEX IF NOT EXISTS tasks_status ON tasks (status, lease_expires);
+"""
+
+
+def fingerprint_qa(qa):
+    canonical = json.dumps(qa, ensure_ascii=False, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+def default_worker_id():
+    return f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+
+@dataclass
+class Task:
+    task_id: int
+    judge_fp: str
+    judge_name: str
+    qa: dict
+    lease_token: str
+    attempts: int
+
+
+class WorkQueue:
+    """タスクはリース（期限つきの貸し出し）で取り出し、期限切れのリースは別のワーカーが再取得できる
+
+    結果はリース時に発行したトークンが一致する場合だけ確定するため、期限切れ後に
+    遅れて届いた結果や二重の書き込みは捨てられる（1タスクの結果は高々1回だけ記録される）。
+    複数マシンで共有する場合は、ファイルロックが正しく動く共有ボリューム上に置くこと。
+    WALモードは共有メモリを使うため1台のマシン内でしか使えず、ネットワーク越しの共有に耐える
+    ロールバックジャーナル（DELETE）モードで開き、ロック競合はbusy_timeout秒まで待つ。
+    """
+    def __init__(self, path=DEFAULT_QUEUE_PATH, lease_seconds=DEFAULT_LEASE_SECONDS, max_attempts=DEFAULT_MAX_ATTEMPTS,
+                 busy_timeout=DEFAULT_BUSY_TIMEOUT):
+        self.path = path
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._conn = sqlite3.connect(path, timeout=busy_timeout, isolation_level=None, check_same_thread=False)
+        self._conn.execute(f"PRAGMA busy_timeout={int(busy_timeout * 1000)}")
+        self._conn.execute("PRAGMA journal_mode=DELETE")
+        self._conn.executescript(_SCHEMA)
+        columns = {row[1] for row in self._conn.execute("PRAGMA table_info(tasks)")}
+        if "judge_fp" not in columns:
+            self._conn.close()
+            raise ValueError(f"{path} はJudgeの指紋を持たない古い形式のキューです。削除してから作り直してください")
+        # ハートビートのスレッドからも使うため、接続の利用を直列化する
+        self._lock = threading.Lock()
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _transaction(self, statements):
+        """statements(conn) を書き込みロックを取ったトランザクション内で実行する"""
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                result = statements(self._conn)
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+            self._conn.execute("COMMIT")
+            return result
+
+    def enqueue(self, qa_pairs, judges):
+        """QAペア×Judgeのタスクを登録し、新規に追加した件数を返す（登録済みのタスクは無視するため、各ノードから同じデータを投入してよい）
+
+        タスクはJudgeの設定の指紋で区別するため、評価基準などを変えたJudgeは以前の結果を使い回さず新しいタスクになる。
+        """
+        now = time.time()
+        judge_keys = [(fingerprint_judge(judge), judge.name) for judge in judges]
+        rows = []
+        for qa in qa_pairs:
+            case_fp, payload = fingerprint_qa(qa), json.dumps(qa, ensure_ascii=False)
+            rows.extend((case_fp, judge_fp, judge_name, payload, now) for judge_fp, judge_name in judge_keys)
+
+        def insert(conn):
+            before = conn.total_changes
+            conn.executemany(
+                "INSERT OR IGNORE INTO tasks (case_fp, judge_fp, judge_name, payload, updated_at) VALUES (?, ?, ?, ?, ?)",
+                rows
+            )
+            return conn.total_changes - before
+
+        added = self._transaction(insert)
+        logger.info(f"📥 {added}件のタスクをキューに追加しました（登録済み {len(rows) - added}件）")
+        return added
+
+    def lease(self, worker_id, limit, judges=None):
+        """未処理・リース期限切れのタスクを最大limit件リースする
+
+        judgesを指定すると、そのJudge（設定の指紋が一致するもの）のタスクだけを取り出す。
+        """
+        now = time.time()
+        judge_filter, judge_args = _judge_filter(judges)
+
+        def take(conn):
+            # 期限切れで試行回数を使い切ったタスクは失敗として確定する
+            conn.execute(
+                "UPDATE tasks SET status = ?, error = COALESCE(error, 'lease expired'), lease_token = NULL, updated_at = ? "
+                "WHERE status = ? AND lease_expires < ? AND attempts >= ?",
+                (FAILED, now, LEASED, now, self.max_attempts)
+            )
+            rows = conn.execute(
+                "SELECT task_id, judge_fp, judge_name, payload, attempts FROM tasks "
+                f"WHERE (status = ? OR (status = ? AND lease_expires < ?)){judge_filter} "
+                "ORDER BY task_id LIMIT ?",
+                [PENDING, LEASED, now, *judge_args, limit]
+            ).fetchall()
+            tasks = []
+            for task_id, judge_fp, judge_name, payload, attempts in rows:
+                token = uuid.uuid4().hex
+                conn.execute(
+                    "UPDATE tasks SET status = ?, attempts = attempts + 1, lease_owner = ?, lease_token = ?, "
+                    "lease_expires = ?, updated_at = ? WHERE task_id = ?",
+                    (LEASED, worker_id, token, now + self.lease_seconds, now, task_id)
+                )
+                tasks.append(Task(task_id, judge_fp, judge_name, json.loads(payload), token, attempts + 1))
+            return tasks
+
+        return self._transaction(take)
+
+    def heartbeat(self, tasks):
+        """リース中のタスクの期限を延長し、まだ自分がリースしているタスク数を返す"""
+        now = time.time()
+
+        def extend(conn):
+            extended = 0
+            for task in tasks:
+                extended += conn.execute(
+                    "UPDATE tasks SET lease_expires = ?, updated_at = ? WHERE task_id = ? AND status = ? AND lease_token = ?",
+                    (now + self.lease_seconds, now, task.task_id, LEASED, task.lease_token)
+                ).rowcount
+            return extended
+
+        return self._transaction(extend)
+
+    def complete(self, task, score, success, reason):
+        """結果を確定する。リースを失っていた（期限切れで再リース・確定済み）場合はFalseを返し、結果は捨てる"""
+        return self.complete_many([(task, score, success, reason)]) == 1
+
+    def complete_many(self, results):
+        """(Task, score, success, reason) をまとめて確定し、確定できた件数を返す"""
+        now = time.time()
+
+        def commit(conn):
+            committed = 0
+            for task, score, success, reason in results:
+                committed += conn.execute(
+                    "UPDATE tasks SET status = ?, score = ?, success = ?, reason = ?, lease_token = NULL, "
+                    "error = NULL, updated_at = ? WHERE task_id = ? AND status = ? AND lease_token = ?",
+                    (DONE, score, int(bool(success)), reason, now, task.task_id, LEASED, task.lease_token)
+                ).rowcount
+            return committed
+
+        committed = self._transaction(commit)
+        if committed < len(results):
+            logger.warning(f"⚠️ リースを失ったタスク{len(results) - committed}件の結果を破棄しました")
+        return committed
+
+    def release(self, tasks, error):
+        """評価に失敗したタスクを返却する（試行回数を使い切ったものは失敗として確定）"""
+        now = time.time()
+
+        def give_back(conn):
+            for task in tasks:
+                status = FAILED if task.attempts >= self.max_attempts else PENDING
+                conn.execute(
+                    "UPDATE tasks SET status = ?, error = ?, lease_token = NULL, lease_expires = NULL, updated_at = ? "
+                    "WHERE task_id = ? AND status = ? AND lease_token = ?",
+                    (status, str(error), now, task.task_id, LEASED, task.lease_token)
+                )
+
+        self._transaction(give_back)
+
+    def stats(self, judges=None):
+        """状態ごとのタスク数（judgesを指定するとそのJudgeのタスクだけを数える）"""
+        judge_filter, judge_args = _judge_filter(judges)
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT status, COUNT(*) FROM tasks WHERE 1 = 1{judge_filter} GROUP BY status", judge_args
+            ).fetchall()
+        counts = dict.fromkeys((PENDING, LEASED, DONE, FAILED), 0)
+        counts.update(rows)
+        return counts
+
+    def is_finished(self, judges=None):
+        """未処理・リース中のタスクが残っていなければTrue
+
+        judgesを指定すると、そのJudgeのタスクだけを見る（担当外のJudgeのタスクは待たない）。
+        """
+        counts = self.stats(judges)
+        return counts[PENDING] == 0 and counts[LEASED] == 0
+
+    def detailed_results(self, judges):
+        """確定済みの結果をQAEvaluationPipelineの詳細結果と同じ形式で、登録順に返す
+
+        指定した全Judgeの結果がそろったQAペアだけを含める。
+        """
+        judge_fps = [fingerprint_judge(judge) for judge in judges]
+        judge_filter, judge_args = _judge_filter(judges)
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT case_fp, judge_fp, judge_name, payload, score, success, reason FROM tasks "
+                f"WHERE status = ?{judge_filter} ORDER BY task_id",
+                [DONE, *judge_args]
+            ).fetchall()
+        cases = {}
+        for case_fp, judge_fp, judge_name, payload, score, success, reason in rows:
+            if case_fp not in cases:
+                cases[case_fp] = (json.loads(payload), {})
+            cases[case_fp][1][judge_fp] = (
+                judge_score_key(judge_name), {"score": score, "success": bool(success), "reason": reason or ""}
+            )
+        return [
+            {
+                "question": qa["question"],
+                "answer": qa["answer"],
+                "overall_success": all(judge_scores[judge_fp][1]["success"] for judge_fp in judge_fps),
+                "judge_scores": dict(judge_scores[judge_fp] for judge_fp in judge_fps)
+            }
+            for qa, judge_scores in cases.values()
+            if all(judge_fp in judge_scores for judge_fp in judge_fps)
+        ]
+
+
+def _judge_filter(judges):
+    """judgesのタスクに絞るWHERE句の断片と引数を返す（Noneなら絞らない）"""
+    if judges is None:
+        return "", []
+    judge_fps = [fingerprint_judge(judge) for judge in judges]
+    return f" AND judge_fp IN ({','.join('?' for _ in judge_fps)})", judge_fps
+
+
+class LeaseHeartbeat:
+    """with文の間、一定間隔でリースを延長し続けるスレッド"""
+    def __init__(self, queue, tasks, interval=None):
+        self.queue = queue
+        self.tasks = tasks
+        self.interval = interval or queue.lease_seconds / 3
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="lease-heartbeat", daemon=True)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.queue.heartbeat(self.tasks)
+            except sqlite3.Error as e:
+                logger.warning(f"⚠️ リースの延長に失敗しました: {e}")
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()